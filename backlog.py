@@ -0,0 +1,100 @@
+# backlog.py
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+import crud, inference
+from database import SessionLocal
+
+# Progress of the current (or last) drain, read by the status endpoint.
+_status = {
+    "running": False,
+    "rows_done": 0,
+    "chunks_done": 0,
+    "last_id": 0,
+    "rows_per_sec": 0.0,
+    "started_at": None,
+    "finished_at": None,
+    "last_error": None,
+}
+_status_lock = threading.Lock()
+_drain_lock = threading.Lock()
+
+
+def _update_status(**fields):
+    with _status_lock:
+        _status.update(fields)
+
+
+def drain_backlog(model, chunk_size: int = inference.PREDICTION_CHUNK_SIZE, model_version=None):
+    """
+    Predicts every pending row, chunk by chunk, paging forward on id so
+    each chunk query starts where the previous one stopped. Only one drain
+    runs at a time; a second call while one is running returns None.
+    Rows uploaded mid-drain get higher ids, so the running drain picks
+    them up before it stops.
+    """
+    if not _drain_lock.acquire(blocking=False):
+        print("Backlog drain already running; skipping.")
+        return None
+
+    started = time.perf_counter()
+    _update_status(
+        running=True,
+        rows_done=0,
+        chunks_done=0,
+        last_id=0,
+        rows_per_sec=0.0,
+        started_at=datetime.now(timezone.utc).isoformat(),
+        finished_at=None,
+        last_error=None,
+    )
+    db = SessionLocal()
+    rows_done, chunks_done, last_id = 0, 0, 0
+    try:
+        while True:
+            stats = inference.process_pending_chunk(
+                db=db, model=model, after_id=last_id, chunk_size=chunk_size,
+                model_version=model_version,
+            )
+            if stats["rows"] == 0:
+                break
+            rows_done += stats["rows"]
+            chunks_done += 1
+            last_id = stats["last_id"]
+            elapsed = time.perf_counter() - started
+            _update_status(
+                rows_done=rows_done,
+                chunks_done=chunks_done,
+                last_id=last_id,
+                rows_per_sec=round(rows_done / elapsed, 1) if elapsed > 0 else 0.0,
+            )
+    except Exception as e:
+        _update_status(last_error=str(e))
+        raise
+    finally:
+        db.close()
+        _update_status(running=False, finished_at=datetime.now(timezone.utc).isoformat())
+        _drain_lock.release()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows_done,
+        "chunks": chunks_done,
+        "seconds": round(elapsed, 4),
+        "rows_per_sec": round(rows_done / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def get_backlog_status(db: Session):
+    """Returns pending/done counts, throughput and ETA for the backlog."""
+    with _status_lock:
+        status = dict(_status)
+
+    pending = crud.count_unpredicted_data(db=db)
+    rate = status["rows_per_sec"]
+    status["rows_pending"] = pending
+    status["eta_seconds"] = round(pending / rate, 1) if pending and rate else None
+    return status
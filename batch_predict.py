@@ -0,0 +1,201 @@
+# batch_predict.py
+"""
+Streaming bulk scoring for /predict/batch.
+
+The request body (a JSON array of PredictionInput objects, or NDJSON with
+one object per line) is parsed incrementally, scored in chunks of
+PREDICT_BATCH_CHUNK_SIZE records with one vectorized predict each, and
+streamed back as NDJSON. Only one chunk is held in memory at a time.
+
+Arrow IPC and Parquet bodies (COLUMNAR_MEDIA_TYPES) skip JSON entirely:
+record batches become DataFrame chunks that go straight to validation
+and predict, with no per-record dicts.
+"""
+import codecs
+import json
+import os
+import tempfile
+
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+import inference, ingest, validation
+
+PREDICT_BATCH_CHUNK_SIZE = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "5000"))
+# Request bodies larger than this are spooled to disk rather than memory.
+PREDICT_BATCH_SPOOL_BYTES = int(os.getenv("PREDICT_BATCH_SPOOL_BYTES", str(8 * 1024 * 1024)))
+READ_BLOCK_BYTES = 64 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+COLUMNAR_MEDIA_TYPES = {
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+async def spool_request_body(byte_chunks):
+    """
+    Copies the request body into a spooled temp file. The body has to be
+    fully received before the response starts streaming, because on
+    ASGI servers older than spec 2.4 the response listens for disconnects
+    on the same receive channel the body arrives on.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=PREDICT_BATCH_SPOOL_BYTES)
+    async for chunk in byte_chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def iter_file_chunks(f, block_size: int = READ_BLOCK_BYTES):
+    """Yields a file's contents in blocks, then closes it."""
+    try:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        f.close()
+
+
+async def iter_json_records(byte_chunks):
+    """
+    Yields records from an async stream of bytes holding either a JSON
+    array or NDJSON. Raises ValueError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, mode = "", 0, None
+
+    async for chunk in byte_chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+        if mode is None:
+            stripped = buffer.lstrip(_WHITESPACE)
+            if not stripped:
+                continue
+            mode = "array" if stripped[0] == "[" else "ndjson"
+            pos = len(buffer) - len(stripped) + (1 if mode == "array" else 0)
+
+        if mode == "ndjson":
+            while True:
+                newline = buffer.find("\n", pos)
+                if newline == -1:
+                    break
+                line = buffer[pos:newline].strip()
+                pos = newline + 1
+                if line:
+                    yield json.loads(line)
+            continue
+
+        # JSON array: decode one element at a time, waiting for more bytes
+        # when an element is cut off at the end of the buffer.
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE + ",":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                mode = "done"
+                pos = len(buffer)
+                break
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break
+            pos = end
+            yield record
+
+        if mode == "done":
+            return
+
+    tail = (buffer[pos:] + text_decoder.decode(b"", final=True)).strip()
+    if mode == "ndjson" and tail:
+        yield json.loads(tail)
+    elif mode == "array":
+        raise ValueError("Unterminated JSON array in request body.")
+
+
+def _score_frame(model, frame: pd.DataFrame, offset: int, errors=None) -> str:
+    """Validates and predicts one DataFrame chunk; returns its NDJSON result lines."""
+    frame = frame.reset_index(drop=True).reindex(columns=list(validation.COLUMN_TYPES))
+    valid_df, frame_errors = validation.validate_frame(frame)
+    for pos, messages in (errors or {}).items():
+        frame_errors[pos] = messages
+
+    predictions = {}
+    if not valid_df.empty:
+        prediction = inference.predict_frame(model, valid_df)
+        predictions = dict(zip(valid_df.index.tolist(), prediction.tolist()))
+
+    lines = []
+    for pos in range(len(frame)):
+        if pos in predictions:
+            cholera, typhoid = predictions[pos]
+            lines.append(f'{{"index": {offset + pos}, "prediction": [{cholera}, {typhoid}]}}\n')
+        else:
+            lines.append(json.dumps({"index": offset + pos, "errors": frame_errors.get(pos, [])}) + "\n")
+    return "".join(lines)
+
+
+def _score_chunk(model, records, offset: int) -> str:
+    """Validates and predicts one chunk of JSON records."""
+    objects = [record if isinstance(record, dict) else {} for record in records]
+    not_objects = {
+        pos: ["record must be a JSON object"]
+        for pos, record in enumerate(records) if not isinstance(record, dict)
+    }
+    return _score_frame(model, pd.DataFrame.from_records(objects), offset, not_objects)
+
+
+def iter_columnar_frames(media_type: str, body, chunk_size: int = PREDICT_BATCH_CHUNK_SIZE):
+    """DataFrame chunks of an Arrow IPC or Parquet body; closes the body when done."""
+    try:
+        if COLUMNAR_MEDIA_TYPES[media_type] == "parquet":
+            yield from ingest.iter_parquet_chunks(body, chunk_size)
+        else:
+            yield from ingest.iter_arrow_chunks(body, chunk_size)
+    finally:
+        body.close()
+
+
+async def stream_predictions(model, records, chunk_size: int = PREDICT_BATCH_CHUNK_SIZE):
+    """
+    Consumes an async iterator of records and yields NDJSON results chunk
+    by chunk. Malformed input ends the stream with a final error line,
+    since the 200 status has already been sent.
+    """
+    chunk, offset = [], 0
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield await run_in_threadpool(_score_chunk, model, chunk, offset)
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            yield await run_in_threadpool(_score_chunk, model, chunk, offset)
+    except ValueError as e:
+        yield json.dumps({"error": f"Invalid request body: {e}"}) + "\n"
+
+
+async def stream_frame_predictions(model, frames):
+    """
+    Like stream_predictions for an (blocking) iterator of DataFrame
+    chunks; reading and scoring run in the threadpool.
+    """
+    offset = 0
+    try:
+        while True:
+            frame = await run_in_threadpool(next, frames, None)
+            if frame is None:
+                break
+            yield await run_in_threadpool(_score_frame, model, frame, offset)
+            offset += len(frame)
+    except ValueError as e:
+        yield json.dumps({"error": f"Invalid request body: {e}"}) + "\n"
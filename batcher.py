@@ -0,0 +1,128 @@
+# batcher.py
+"""
+Adaptive micro-batching for /predict.
+
+Concurrent requests are queued and gathered into one DataFrame for a
+single vectorized predict, then each caller gets its own row back. A
+batch is flushed when it reaches max_batch_size or when max_wait_ms has
+passed since its first request. Under light load (previous batch held a
+single request and nothing else is queued) the window is skipped, so a
+lone request is not delayed waiting for company.
+
+Each request carries the model it resolved when it arrived; a batch that
+spans a hot swap is split per model, so every row is predicted by the
+version its caller caches it under.
+"""
+import asyncio
+import os
+import time
+
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+from metrics import Histogram
+
+PREDICT_MICROBATCH = os.getenv("PREDICT_MICROBATCH", "false").lower() in ("1", "true", "yes")
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "64"))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size: int = PREDICT_BATCH_MAX_SIZE,
+                 max_wait_ms: float = PREDICT_BATCH_MAX_WAIT_MS):
+        """predict_fn takes a model and a DataFrame and returns an (n, 2) array."""
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_size_hist = Histogram(
+            "predict_batch_size", [1, 2, 4, 8, 16, 32, 64, 128, 256]
+        )
+        self.queue_wait_hist = Histogram(
+            "predict_queue_wait_seconds",
+            [0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1],
+        )
+        self._queue = None
+        self._task = None
+        self._last_batch_size = 1
+
+    def start(self):
+        """Starts the collector task on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, record: dict, model):
+        """Queues one input record for model and waits for its [cholera, typhoid] row."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((record, model, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        """Waits for the first item, then gathers more until size or time runs out."""
+        batch = [await self._queue.get()]
+        adaptive_wait = self.max_wait
+        if self._last_batch_size <= 1 and self._queue.empty():
+            adaptive_wait = 0.0
+        deadline = time.perf_counter() + adaptive_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self._last_batch_size = len(batch)
+
+            flushed_at = time.perf_counter()
+            self.batch_size_hist.observe(len(batch))
+            groups = {}
+            for item in batch:
+                self.queue_wait_hist.observe(flushed_at - item[3])
+                groups.setdefault(id(item[1]), []).append(item)
+
+            for items in groups.values():
+                await self._predict_group(items)
+
+    async def _predict_group(self, items):
+        """One vectorized predict for queued items that share a model."""
+        frame = pd.DataFrame([record for record, _, _, _ in items])
+        try:
+            prediction = await run_in_threadpool(self.predict_fn, items[0][1], frame)
+        except Exception as e:
+            for _, _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future, _), row in zip(items, prediction):
+            if not future.done():
+                future.set_result(row)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_seconds": self.queue_wait_hist.snapshot(),
+        }
@@ -0,0 +1,132 @@
+# benchmarks/db_concurrency.py
+"""
+Read/write throughput of the database under concurrent load.
+
+Writer threads upsert chunks of synthetic district rows (the upload path)
+while reader threads page through /get-all-predictions/ queries and
+count the backlog (the API path). Each configuration gets a fresh SQLite
+file:
+
+- default: the old engine (rollback journal, FULL sync, default pool)
+- tuned:   database.create_db_engine() (WAL, synchronous=NORMAL,
+           busy_timeout, mmap, sized pool)
+
+Pass --url to run the tuned configuration against another database
+(e.g. PostgreSQL) instead; its tables are created if missing.
+
+    python benchmarks/db_concurrency.py [--seconds 5] [--writers 4] [--readers 8]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud, database, models, schema  # noqa: E402
+
+
+def synthetic_chunk(writer: int, chunk: int, rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(writer * 100003 + chunk)
+    months = np.arange(rows)
+    return pd.DataFrame({
+        "Region": f"Region {writer}",
+        "City": [f"City {chunk}-{i // 120}" for i in months],
+        "Year": 2000 + (months // 12) % 10,
+        "Month": months % 12 + 1,
+        "Rainfall_mm": rng.uniform(0, 300, rows),
+        "Temperature_celsius": rng.uniform(20, 35, rows),
+        "Sanitation_Index": rng.uniform(0, 1, rows),
+        "Water_Quality_Index": rng.uniform(0, 1, rows),
+        "Population_Density": rng.uniform(10, 5000, rows),
+        "Waste_Management_Score": rng.uniform(0, 1, rows),
+        "Cholera_Cases": rng.integers(0, 100, rows),
+        "Typhoid_Cases": rng.integers(0, 100, rows),
+    })
+
+
+def run(engine, seconds: float, writers: int, readers: int, chunk_rows: int):
+    models.init_db(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stop = time.perf_counter() + seconds
+    counts = {"rows_written": 0, "write_txns": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def bump(**deltas):
+        with lock:
+            for key, value in deltas.items():
+                counts[key] += value
+
+    def writer(n):
+        chunk = 0
+        while time.perf_counter() < stop:
+            db = Session()
+            try:
+                written = crud.bulk_insert_data_from_dataframe(db=db, df=synthetic_chunk(n, chunk, chunk_rows))
+                bump(rows_written=written, write_txns=1)
+            except Exception:
+                db.rollback()
+                bump(errors=1)
+            finally:
+                db.close()
+            chunk += 1
+
+    def reader(n):
+        filters = schema.PredictionFilters(region=f"Region {n % max(writers, 1)}")
+        while time.perf_counter() < stop:
+            db = Session()
+            try:
+                crud.get_prediction_page(db=db, filters=filters, after_id=0, limit=200)
+                crud.count_unpredicted_data(db=db)
+                bump(reads=1)
+            except Exception:
+                bump(errors=1)
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return {
+        **counts,
+        "rows_written_per_sec": round(counts["rows_written"] / elapsed, 1),
+        "reads_per_sec": round(counts["reads"] / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--chunk-rows", type=int, default=500)
+    parser.add_argument("--url", help="benchmark this database instead of temporary SQLite files")
+    args = parser.parse_args()
+
+    load = (args.seconds, args.writers, args.readers, args.chunk_rows)
+    results = {}
+    if args.url:
+        results["tuned"] = run(database.create_db_engine(args.url), *load)
+    else:
+        for name, tuned in (("default", False), ("tuned", True)):
+            with tempfile.TemporaryDirectory() as tmp:
+                url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+                results[name] = run(database.create_db_engine(url, tuned=tuned), *load)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
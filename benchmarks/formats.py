@@ -0,0 +1,149 @@
+# benchmarks/formats.py
+"""
+Upload/export format benchmark.
+
+Writes the same synthetic test.csv-shaped data as CSV, XLSX, Parquet and
+Arrow IPC, then measures on a temporary SQLite database:
+
+- parse:  rows/s of ingest.iter_upload_chunks per format, and for XLSX
+          both readers (openpyxl read-only vs python-calamine)
+- insert: the upsert of validated chunks, as per-row parameter dicts
+          (the previous path) vs crud's staging-table path
+- ingest: ingest.ingest_upload end to end per format (includes the
+          summary and feature-store refresh)
+- export: export.stream_predictions as NDJSON, CSV and Parquet
+
+    python benchmarks/formats.py [--rows 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from suite import synthetic_csv  # noqa: E402
+
+
+def write_files(df: pd.DataFrame, directory: str):
+    import openpyxl
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    paths = {fmt: os.path.join(directory, f"upload.{fmt}") for fmt in ("csv", "xlsx", "parquet", "arrow")}
+    df.to_csv(paths["csv"], index=False)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_table(table, paths["parquet"])
+    feather.write_feather(table, paths["arrow"])
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        sheet.append(list(row))
+    workbook.save(paths["xlsx"])
+    return paths
+
+
+def rate(rows: int, seconds: float):
+    return {"seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds, 1)}
+
+
+def bench_parse(paths, rows: int):
+    import ingest
+
+    results = {}
+    readers = [(fmt, None) for fmt in ("csv", "parquet", "arrow")]
+    readers += [("xlsx", "openpyxl"), ("xlsx", "calamine")]
+    for fmt, reader in readers:
+        start = time.perf_counter()
+        with open(paths[fmt], "rb") as f:
+            if reader:
+                parsed = sum(len(chunk) for chunk in ingest.iter_xlsx_chunks(f, reader=reader))
+            else:
+                parsed = sum(len(chunk) for chunk in ingest.iter_upload_chunks(paths[fmt], f))
+        assert parsed == rows, (fmt, parsed)
+        results[f"{fmt}_{reader}" if reader else fmt] = rate(rows, time.perf_counter() - start)
+    return results
+
+
+def bench_insert(df: pd.DataFrame, directory: str, chunk_rows: int):
+    import crud, database, models, validation
+    from sqlalchemy.orm import sessionmaker
+
+    results = {}
+    for name in ("dict_executemany", "staged"):
+        engine = database.create_db_engine(f"sqlite:///{os.path.join(directory, f'insert_{name}.db')}")
+        models.init_db(engine)
+        db = sessionmaker(bind=engine)()
+        table = models.PredictionData.__table__
+        elapsed = 0.0
+        for i in range(0, len(df), chunk_rows):
+            valid_df, _ = validation.validate_frame(df.iloc[i:i + chunk_rows])
+            start = time.perf_counter()
+            if name == "staged":
+                crud._load_stage(db, table, valid_df)
+                crud._insert_from_stage(db, table, upsert=True)
+            else:
+                db.execute(crud._upsert_statement(db, table), valid_df.to_dict(orient="records")).scalars().all()
+            elapsed += time.perf_counter() - start
+        db.commit()
+        db.close()
+        engine.dispose()
+        results[name] = rate(len(df), elapsed)
+    return results
+
+
+def bench_ingest_and_export(paths, rows: int, directory: str):
+    import database, export, ingest, models, schema
+    from sqlalchemy.orm import sessionmaker
+
+    ingest_results, export_results = {}, {}
+    for fmt, path in paths.items():
+        engine = database.create_db_engine(f"sqlite:///{os.path.join(directory, f'ingest_{fmt}.db')}")
+        models.init_db(engine)
+        db = sessionmaker(bind=engine)()
+        with open(path, "rb") as f:
+            stats = ingest.ingest_upload(db, os.path.basename(path), f)
+        db.close()
+        ingest_results[fmt] = rate(rows, stats["seconds"])
+
+        if fmt == "csv":
+            # Export reads through export.engine; point it at this database
+            export.engine = engine
+            for out in ("ndjson", "csv", "parquet"):
+                start, size = time.perf_counter(), 0
+                for chunk in export.stream_predictions(schema.PredictionFilters(), fmt=out):
+                    size += len(chunk)
+                export_results[out] = {**rate(rows, time.perf_counter() - start), "mb": round(size / 1e6, 2)}
+        engine.dispose()
+    return ingest_results, export_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        df = pd.read_csv(synthetic_csv(os.path.join(tmp, "source.csv"), args.rows, tag="F", seed=args.rows))
+        paths = write_files(df, tmp)
+        results = {
+            "rows": args.rows,
+            "file_mb": {fmt: round(os.path.getsize(path) / 1e6, 2) for fmt, path in paths.items()},
+            "parse": bench_parse(paths, args.rows),
+            "insert": bench_insert(df, tmp, args.chunk_rows),
+        }
+        results["ingest"], results["export"] = bench_ingest_and_export(paths, args.rows, tmp)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
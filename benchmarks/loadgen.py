@@ -0,0 +1,151 @@
+# benchmarks/loadgen.py
+"""
+Closed-loop HTTP load generator.
+
+`concurrency` threads each send a request, wait for the reply and send
+the next one, until `requests` have been sent (or `seconds` have
+passed). Reports throughput and latency percentiles as JSON.
+
+Works against a running server (--url) or, from benchmarks/suite.py,
+an in-process fastapi TestClient (which shares the same get/post API).
+
+    python benchmarks/loadgen.py --url http://127.0.0.1:8000 \
+        [--endpoint predict] [--concurrency 32] [--requests 2000]
+"""
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+
+REGIONS = [
+    "Ashanti", "Greater Accra", "Northern", "Volta", "Western", "Eastern",
+    "Central", "Upper East", "Upper West", "Bono", "Ahafo", "Bono East",
+    "Oti", "Savannah", "North East", "Western North",
+]
+
+
+def predict_payload(rng: np.random.Generator) -> dict:
+    """A random /predict body with the same fields as a test.csv row."""
+    return {
+        "Region": REGIONS[int(rng.integers(len(REGIONS)))],
+        "City": f"City {int(rng.integers(1000))}",
+        "Year": int(rng.integers(2015, 2026)),
+        "Month": int(rng.integers(1, 13)),
+        "Rainfall_mm": round(float(rng.uniform(0, 300)), 1),
+        "Temperature_celsius": round(float(rng.uniform(20, 35)), 1),
+        "Sanitation_Index": round(float(rng.uniform(0, 1)), 2),
+        "Water_Quality_Index": round(float(rng.uniform(0, 1)), 2),
+        "Population_Density": round(float(rng.uniform(10, 5000)), 0),
+        "Waste_Management_Score": round(float(rng.uniform(0, 1)), 2),
+        "Cholera_Cases": int(rng.integers(0, 100)),
+        "Typhoid_Cases": int(rng.integers(0, 100)),
+    }
+
+
+def latency_summary(latencies_s) -> dict:
+    """Percentiles in milliseconds."""
+    if not latencies_s:
+        return {}
+    ms = np.asarray(latencies_s) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def run_load(client, send, concurrency: int = 8, requests: int = 1000,
+             seconds: float = None, seed: int = 0) -> dict:
+    """
+    Runs the load. send(client, rng) issues one request and returns the
+    response; anything but a 2xx counts as an error.
+    """
+    deadline = time.perf_counter() + seconds if seconds else None
+    lock = threading.Lock()
+    state = {"sent": 0, "errors": 0}
+    latencies = []
+
+    def take():
+        with lock:
+            if state["sent"] >= requests or (deadline and time.perf_counter() >= deadline):
+                return False
+            state["sent"] += 1
+            return True
+
+    def loop(n):
+        rng = np.random.default_rng(seed * 1000 + n)
+        local = []
+        while take():
+            start = time.perf_counter()
+            try:
+                ok = 200 <= send(client, rng).status_code < 300
+            except Exception:
+                ok = False
+            local.append(time.perf_counter() - start)
+            if not ok:
+                with lock:
+                    state["errors"] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": state["sent"],
+        "errors": state["errors"],
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_sec": round(state["sent"] / elapsed, 1) if elapsed > 0 else 0.0,
+        **latency_summary(latencies),
+    }
+
+
+def send_predict(client, rng):
+    return client.post("/predict", json=predict_payload(rng))
+
+
+def send_predict_batch(client, rng, batch_size: int = 100):
+    return client.post("/predict/batch", json=[predict_payload(rng) for _ in range(batch_size)])
+
+
+def send_get_predictions(client, rng):
+    return client.get("/get-all-predictions/", params={"limit": 1000})
+
+
+ENDPOINTS = {
+    "predict": send_predict,
+    "predict-batch": send_predict_batch,
+    "get-all-predictions": send_get_predictions,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="base URL of a running server")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="predict")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, help="stop after this long even if requests remain")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import httpx
+
+    with httpx.Client(base_url=args.url, timeout=60,
+                      limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        result = run_load(client, ENDPOINTS[args.endpoint], args.concurrency,
+                          args.requests, args.seconds, args.seed)
+    print(json.dumps({args.endpoint: result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark for the API.
+
+Each run is a fresh interpreter that imports main, enters the app
+lifespan and polls /health/ready, recording:
+
+- import_s:    time to import main
+- accepting_s: time until the lifespan has started (server accepts requests)
+- ready_s:     time until /health/ready returns 200
+
+Runs once with MODEL_LOAD_IN_BACKGROUND=false (model loaded before the
+server accepts requests, like the old import-time load) and once with
+the default background load.
+
+    python benchmarks/startup.py [--runs 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    t_accepting = time.perf_counter()
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.005)
+    t_ready = time.perf_counter()
+print(json.dumps({
+    "import_s": t_import - t0,
+    "accepting_s": t_accepting - t0,
+    "ready_s": t_ready - t0,
+}))
+"""
+
+
+def run_once(background: bool):
+    env = dict(
+        os.environ,
+        MODEL_LOAD_IN_BACKGROUND="true" if background else "false",
+        PREDICTION_WORKER_MODE="external",
+        PYTHONPATH=ROOT,
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for name, background in (("blocking_load", False), ("background_load", True)):
+        runs = [run_once(background) for _ in range(args.runs)]
+        results[name] = {
+            key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
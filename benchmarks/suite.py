@@ -0,0 +1,283 @@
+# benchmarks/suite.py
+"""
+End-to-end benchmark suite for the API.
+
+Runs the app in-process (fastapi TestClient, lifespan included) on a
+fresh temporary SQLite database with the stub LLM provider, and
+measures:
+
+- predict_latency:      sequential /predict latency percentiles
+- predict_throughput:   /predict under 1/8/32 concurrent clients (loadgen.py)
+- ingest.<rows>:        /upload-data/ rate for synthetic CSVs shaped like test.csv
+- backlog.<rows>:       time for the prediction jobs of that upload to finish
+- get_predictions.<rows>: /get-all-predictions/ latency (first page,
+                        filtered page, deep cursor) at that table size
+- report:               /generate-comprehensive-report, cache miss and hit
+
+Uploads are cumulative, so the table holds 10k, then 110k, then 1.11M
+rows. Inputs are generated from fixed seeds, so runs on the same
+machine are comparable.
+
+Results are printed (and written to --output) as JSON. --baseline
+compares against an earlier file: metrics ending in _ms / _s are
+lower-is-better, *_per_sec higher-is-better; any that moved the wrong
+way by more than --tolerance are listed and the exit status is 1.
+
+    python benchmarks/suite.py [--sizes 10000,100000,1000000] \
+        [--output bench.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadgen import REGIONS, latency_summary, run_load, send_predict  # noqa: E402
+
+# Applied before main is imported; anything already set in the environment wins.
+ENV_DEFAULTS = {
+    "LLM_PROVIDER": "stub",
+    "MODEL_LOAD_IN_BACKGROUND": "false",
+    "PREDICT_CACHE_SIZE": "0",
+    "PREDICTION_WORKER_MODE": "pool",
+}
+
+MONTHS_PER_DISTRICT = 60
+
+
+def synthetic_csv(path: str, rows: int, tag: str, seed: int = 0) -> str:
+    """
+    Writes rows of test.csv-shaped data: MONTHS_PER_DISTRICT consecutive
+    months per district, district names prefixed with tag so every
+    upload inserts new rows.
+    """
+    rng = np.random.default_rng(seed)
+    i = np.arange(rows)
+    district = i // MONTHS_PER_DISTRICT
+    month_index = i % MONTHS_PER_DISTRICT
+    pd.DataFrame({
+        "Region": np.asarray(REGIONS)[district % len(REGIONS)],
+        "City": [f"{tag} District {d}" for d in district],
+        "Year": 2020 + month_index // 12,
+        "Month": month_index % 12 + 1,
+        "Rainfall_mm": rng.uniform(0, 300, rows).round(1),
+        "Temperature_celsius": rng.uniform(20, 35, rows).round(1),
+        "Sanitation_Index": rng.uniform(0, 1, rows).round(2),
+        "Water_Quality_Index": rng.uniform(0, 1, rows).round(2),
+        "Population_Density": rng.uniform(10, 5000, rows).round(0),
+        "Waste_Management_Score": rng.uniform(0, 1, rows).round(2),
+        "Cholera_Cases": rng.integers(0, 100, rows),
+        "Typhoid_Cases": rng.integers(0, 100, rows),
+    }).to_csv(path, index=False)
+    return path
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_predict_latency(client, requests: int):
+    rng = np.random.default_rng(1)
+    for _ in range(20):  # warm-up
+        send_predict(client, rng)
+    latencies = []
+    for _ in range(requests):
+        response, seconds = timed(send_predict, client, rng)
+        response.raise_for_status()
+        latencies.append(seconds)
+    return {"requests": requests, **latency_summary(latencies)}
+
+
+def bench_predict_throughput(client, levels, requests: int):
+    return {
+        f"c{level}": run_load(client, send_predict, concurrency=level, requests=requests, seed=level)
+        for level in levels
+    }
+
+
+def bench_ingest_and_backlog(client, main, path: str, rows: int, timeout: float):
+    with open(path, "rb") as f:
+        response, seconds = timed(
+            client.post, "/upload-data/", files={"file": (os.path.basename(path), f, "text/csv")}
+        )
+    response.raise_for_status()
+    body = response.json()
+    ingest = {
+        "rows": rows,
+        "file_mb": round(os.path.getsize(path) / 1e6, 2),
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1),
+    }
+
+    start = time.perf_counter()
+    if main.worker.PREDICTION_WORKER_MODE == "pool":
+        status = "pending"
+        while status not in ("done", "failed") and time.perf_counter() - start < timeout:
+            time.sleep(0.1)
+            status = client.get(f"/jobs/{body['upload_id']}").json()["status"]
+    else:
+        main.process_pending_predictions()
+        status = "done"
+    seconds = time.perf_counter() - start
+    backlog = {
+        "rows": rows,
+        "status": status,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1),
+    }
+    return ingest, backlog
+
+
+def bench_get_predictions(client, table_rows: int, repeats: int):
+    def measure(params):
+        client.get("/get-all-predictions/", params=params).raise_for_status()  # warm-up
+        latencies = []
+        for _ in range(repeats):
+            response, seconds = timed(client.get, "/get-all-predictions/", params=params)
+            response.raise_for_status()
+            latencies.append(seconds)
+        return latency_summary(latencies)
+
+    return {
+        "table_rows": table_rows,
+        "first_page": measure({"limit": 1000}),
+        "region_page": measure({"limit": 1000, "region": REGIONS[3]}),
+        "deep_page": measure({"limit": 1000, "after_id": max(table_rows - 1000, 0)}),
+    }
+
+
+def bench_report(client):
+    results = {}
+    for name in ("miss", "hit"):
+        response, seconds = timed(client.post, "/generate-comprehensive-report")
+        response.raise_for_status()
+        results[f"{name}_ms"] = round(seconds * 1000, 3)
+        results[f"{name}_cache_header"] = response.headers.get("X-Report-Cache")
+    return results
+
+
+def _flatten(d, prefix=""):
+    for key, value in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Lines describing every metric that regressed by more than tolerance."""
+    old = dict(_flatten(baseline.get("results", baseline)))
+    regressions = []
+    for name, new in _flatten(results):
+        if name not in old or not old[name]:
+            continue
+        change = (new - old[name]) / old[name]
+        if name.endswith(("_ms", "_s", ".seconds")):
+            worse = change > tolerance
+        elif name.endswith("_per_sec"):
+            worse = change < -tolerance
+        else:
+            continue
+        if worse:
+            regressions.append(f"{name}: {old[name]} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated upload sizes in rows")
+    parser.add_argument("--latency-requests", type=int, default=500)
+    parser.add_argument("--throughput-requests", type=int, default=1000)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--page-repeats", type=int, default=20)
+    parser.add_argument("--backlog-timeout", type=float, default=1800)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    tmp = tempfile.TemporaryDirectory()
+    for key, value in ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp.name, 'bench.db')}")
+    os.chdir(ROOT)
+
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    results = {"ingest": {}, "backlog": {}, "get_predictions": {}}
+    with TestClient(app_main.app) as client:
+        results["predict_latency"] = bench_predict_latency(client, args.latency_requests)
+        results["predict_throughput"] = bench_predict_throughput(client, levels, args.throughput_requests)
+
+        table_rows = 0
+        for size in sizes:
+            path = synthetic_csv(os.path.join(tmp.name, f"synthetic_{size}.csv"), size, tag=f"S{size}", seed=size)
+            ingest, backlog = bench_ingest_and_backlog(client, app_main, path, size, args.backlog_timeout)
+            os.remove(path)
+            table_rows += size
+            results["ingest"][str(size)] = ingest
+            results["backlog"][str(size)] = backlog
+            results["get_predictions"][str(table_rows)] = bench_get_predictions(
+                client, table_rows, args.page_repeats
+            )
+            print(f"{size} rows: ingest {ingest['rows_per_sec']} rows/s, "
+                  f"backlog {backlog['rows_per_sec']} rows/s", file=sys.stderr)
+
+        results["report"] = bench_report(client)
+    tmp.cleanup()
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "env": {key: os.environ[key] for key in (*ENV_DEFAULTS, "DATABASE_URL")},
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
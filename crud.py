@@ -1,76 +1,453 @@
 # crud.py
+import io
 from sqlalchemy.orm import Session
-import models, schema
+import models, schema, validation
 import pandas as pd
-from typing import List
-from sqlalchemy import asc, desc
+from typing import List, Optional
+from datetime import timedelta, timezone
+from sqlalchemy import and_, asc, column, desc, func, insert, or_, select, true, update
+from sqlalchemy import table as sa_table
 
+# Columns the model pipeline expects, in schema order.
+INPUT_COLUMNS = list(schema.PredictionInput.__annotations__.keys())
 
-def get_unpredicted_data(db: Session, limit: int = 100):
-    """Fetches rows that haven't been processed yet."""
-    return db.query(models.PredictionData).filter(
+
+def get_unpredicted_frame(
+    db: Session, after_id: int = 0, limit: int = 1000, max_id: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Fetches unprocessed rows with id > after_id (and <= max_id, if given)
+    as one DataFrame (id + input columns), reading columns straight from
+    the cursor instead of building ORM objects. Pass the last id seen to
+    page through the backlog (keyset pagination).
+    """
+    table = models.PredictionData
+    stmt = (
+        select(table.id, *[getattr(table, col) for col in INPUT_COLUMNS])
+        .where(table.projected_cholera == None, table.id > after_id)
+        .order_by(table.id)
+        .limit(limit)
+    )
+    if max_id is not None:
+        stmt = stmt.where(table.id <= max_id)
+    return pd.read_sql_query(stmt, db.connection())
+
+def count_unpredicted_data(db: Session) -> int:
+    """Counts rows still waiting for a prediction (served by the pending index)."""
+    return db.query(func.count(models.PredictionData.id)).filter(
         models.PredictionData.projected_cholera == None
-    ).limit(limit).all()
-
-def update_data_predictions(db: Session, data_id: int, cholera: int, typhoid: int):
-    """Updates a specific row with new prediction data."""
-    db_data = db.query(models.PredictionData).filter(models.PredictionData.id == data_id).first()
-    if db_data:
-        db_data.projected_cholera = cholera
-        db_data.projected_typhoid = typhoid
+    ).scalar()
+
+def bulk_update_predictions(db: Session, ids, cholera, typhoid, model_version: Optional[str] = None):
+    """Writes a chunk of projections back with one executemany and one commit."""
+    rows = [
+        {"id": int(i), "projected_cholera": int(c), "projected_typhoid": int(t), "model_version": model_version}
+        for i, c, t in zip(ids, cholera, typhoid)
+    ]
+    if rows:
+        before = _summary_snapshot(db, ids=ids)
+        db.execute(update(models.PredictionData), rows)
+        _refresh_summaries(db, before, ids)
         db.commit()
-        db.refresh(db_data)
-    return db_data
-
-def bulk_insert_data_from_dataframe(db: Session, df: pd.DataFrame):
-    """Converts a DataFrame into records and inserts them into the DB."""
-    # Convert DataFrame to a list of dictionaries
-    data_dicts = df.to_dict(orient="records")
-    
-    # Validate with Pydantic and create model instances
-    db_items = [models.PredictionData(**schema.PredictionInput(**row).dict()) for row in data_dicts]
-    
-    db.add_all(db_items)
+    return len(rows)
+
+def _refresh_features(db: Session, ids):
+    """Recomputes lag/rolling features around the inserted or changed rows."""
+    import features
+
+    features.refresh(db, ids)
+
+def _summary_snapshot(db: Session, ids=None, condition=None):
+    """Processed rows a write is about to change, for _refresh_summaries."""
+    import summaries  # summaries -> reporting -> crud
+
+    return summaries.snapshot(db, ids=ids, condition=condition)
+
+def _refresh_summaries(db: Session, before, ids):
+    """Keeps the analytics rollups in step with prediction writes (same transaction)."""
+    import summaries
+
+    summaries.update(db, before, ids)
+
+def reset_stale_predictions(db: Session, model_version: str):
+    """
+    Clears the projections of rows scored by any other model version (or
+    none recorded) so the prediction jobs re-score them. Returns their ids.
+    """
+    table = models.PredictionData
+    stale = table.model_version.is_distinct_from(model_version)
+    before = _summary_snapshot(db, condition=stale)
+    ids = db.execute(
+        update(table)
+        .where(table.projected_cholera != None, stale)
+        .values(projected_cholera=None, projected_typhoid=None, model_version=None, updated_at=models.utcnow())
+        .returning(table.id)
+    ).scalars().all()
+    _refresh_summaries(db, before, ids)
+    db.commit()
+    return ids
+
+def count_rows_by_model_version(db: Session):
+    """Number of scored rows per model version."""
+    table = models.PredictionData
+    rows = db.query(table.model_version, func.count(table.id)).filter(
+        table.projected_cholera != None
+    ).group_by(table.model_version).all()
+    return {version or "unknown": count for version, count in rows}
+
+def create_prediction_jobs(db: Session, upload_id: str, ids, shard_size: int):
+    """
+    Splits the rows an upload inserted or changed into pending jobs of
+    up to shard_size rows, each covering the id range of its shard.
+    """
+    ids = sorted(ids)
+    jobs = [
+        models.PredictionJob(
+            upload_id=upload_id,
+            status="pending",
+            start_id=ids[i],
+            end_id=ids[min(i + shard_size, len(ids)) - 1],
+        )
+        for i in range(0, len(ids), shard_size)
+    ]
+    db.add_all(jobs)
     db.commit()
-    return len(db_items)
+    return jobs
+
+def get_jobs_for_upload(db: Session, upload_id: str):
+    """Fetches every job (shard) created for one upload."""
+    return db.query(models.PredictionJob).filter(
+        models.PredictionJob.upload_id == upload_id
+    ).order_by(models.PredictionJob.start_id).all()
+
+def claim_pending_jobs(db: Session, limit: int, owner: Optional[str] = None, lease_seconds: float = 60):
+    """
+    Marks up to `limit` pending jobs as running under owner, leased for
+    lease_seconds, and returns their ids. The status check in the UPDATE
+    makes the claim safe when several workers poll the same table.
+    """
+    job = models.PredictionJob
+    candidates = db.query(job.id).filter(
+        job.status == "pending"
+    ).order_by(job.id).limit(limit).all()
+
+    claimed = []
+    lease_expires_at = models.utcnow() + timedelta(seconds=lease_seconds)
+    for (job_id,) in candidates:
+        result = db.execute(
+            update(job)
+            .where(job.id == job_id, job.status == "pending")
+            .values(status="running", attempts=job.attempts + 1,
+                    owner=owner, lease_expires_at=lease_expires_at)
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.commit()
+    return claimed
+
+def renew_job_leases(db: Session, owner: str, lease_seconds: float) -> int:
+    """Extends the lease of every job owner is running (its heartbeat)."""
+    job = models.PredictionJob
+    result = db.execute(
+        update(job)
+        .where(job.status == "running", job.owner == owner)
+        .values(lease_expires_at=models.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    db.commit()
+    return result.rowcount
+
+def _requeue_jobs(db: Session, condition, max_attempts: int, error: str) -> int:
+    """Running jobs matching condition go back to pending, or failed once out of attempts."""
+    job = models.PredictionJob
+    running = and_(job.status == "running", condition)
+    released = {"owner": None, "lease_expires_at": None}
+    db.execute(
+        update(job)
+        .where(running, job.attempts >= max_attempts)
+        .values(status="failed", error=error, **released)
+    )
+    result = db.execute(update(job).where(running).values(status="pending", **released))
+    db.commit()
+    return result.rowcount
+
+def requeue_expired_jobs(db: Session, max_attempts: int) -> int:
+    """
+    Puts jobs whose owner stopped renewing their lease (a crashed API or
+    worker process) back in the queue, or marks them failed once they
+    have used up max_attempts. Jobs held by live processes are left alone.
+    """
+    job = models.PredictionJob
+    expired = or_(job.lease_expires_at == None, job.lease_expires_at < models.utcnow())
+    return _requeue_jobs(db, expired, max_attempts, "Worker stopped while running the job.")
+
+def release_jobs(db: Session, ids, owner: str, max_attempts: int, error: str) -> int:
+    """Hands jobs owner claimed but could not run back to the queue."""
+    job = models.PredictionJob
+    return _requeue_jobs(db, and_(job.id.in_(list(ids)), job.owner == owner), max_attempts, error)
+
+def bulk_insert_data_from_dataframe(
+    db: Session,
+    df: pd.DataFrame,
+    commit: bool = True,
+    upsert: bool = True,
+    touched_ids: Optional[list] = None,
+    rejected: Optional[list] = None,
+    row_offset: int = 0,
+):
+    """
+    Validates a DataFrame column-wise and writes it through a staging
+    table (_load_stage, then _insert_from_stage; a Core executemany on
+    other databases), with no per-row Pydantic, ORM or dict objects. When rejected is a list,
+    invalid rows are skipped and their validation.error_report entries
+    (rows numbered from row_offset) appended to it; otherwise any
+    invalid row raises ValueError.
+
+    With upsert (the default), rows are keyed on (Region, City, Year,
+    Month): new keys are inserted, existing keys are updated only if a
+    value actually changed, and only those rows lose their projections.
+    Returns the number of rows inserted or changed; their ids are
+    appended to touched_ids when a list is given.
+    """
+    valid_df, errors = validation.validate_frame(df)
+    if errors and rejected is not None:
+        rejected.extend(validation.error_report(errors, offset=row_offset))
+    elif errors:
+        pos = min(errors)
+        raise ValueError(
+            f"{len(errors)} invalid rows; first at row {row_offset + pos + 1}: {'; '.join(errors[pos])}"
+        )
+    if valid_df.empty:
+        return 0
 
+    table = models.PredictionData.__table__
+    if upsert and models.pending_duplicates and models.recount_duplicates(db.get_bind()):
+        raise ValueError(
+            f"prediction_data holds {models.pending_duplicates} duplicate rows without the natural-key "
+            f"index that upserts rely on; run `python models.py dedupe` first."
+        )
+    if upsert:
+        # Last occurrence wins when a file repeats a key
+        valid_df = valid_df.drop_duplicates(subset=models.NATURAL_KEY, keep="last")
 
-def get_all_processed_data_with_range(db: Session):
+    before = None
+    if db.get_bind().dialect.name in ("postgresql", "sqlite"):
+        _load_stage(db, table, valid_df)
+        if upsert:
+            # Processed rows whose keys are in the chunk, before the upsert clears any of them
+            before = _summary_snapshot(db, condition=table.c.id.in_(_staged_key_ids(table)))
+        ids = _insert_from_stage(db, table, upsert)
+    else:
+        if upsert:
+            stmt = _upsert_statement(db, table)
+        else:
+            stmt = insert(table).returning(table.c.id)
+        ids = db.execute(stmt, valid_df.to_dict(orient="records")).scalars().all()
+    # Changed rows lost their projections; drop them from the rollups
+    _refresh_summaries(db, before, ids)
+    _refresh_features(db, ids)
+    if commit:
+        db.commit()
+    if touched_ids is not None:
+        touched_ids.extend(ids)
+    return len(ids)
+
+def _upsert_statement(db: Session, table, from_select=None):
+    """
+    INSERT ... ON CONFLICT (natural key) DO UPDATE, skipping unchanged
+    rows. With from_select, the rows come from that SELECT of INPUT_COLUMNS.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise ValueError(f"Upsert is not supported on {dialect}.")
+
+    stmt = dialect_insert(table)
+    if from_select is not None:
+        stmt = stmt.from_select(INPUT_COLUMNS, from_select)
+    value_columns = [col for col in INPUT_COLUMNS if col not in models.NATURAL_KEY]
+    changed = or_(*[table.c[col].is_distinct_from(stmt.excluded[col]) for col in value_columns])
+    return stmt.on_conflict_do_update(
+        index_elements=models.NATURAL_KEY,
+        set_={
+            **{col: stmt.excluded[col] for col in value_columns},
+            "projected_cholera": None,
+            "projected_typhoid": None,
+            "model_version": None,
+            # onupdate is not applied to ON CONFLICT updates
+            "updated_at": models.utcnow(),
+        },
+        where=changed,
+    ).returning(table.c.id)
+
+
+STAGE_TABLE = "prediction_data_stage"
+
+def _load_stage(db: Session, table, df: pd.DataFrame):
+    """
+    Replaces the contents of the session-local staging table with df's
+    INPUT_COLUMNS: COPY ... FROM STDIN (CSV) on PostgreSQL, an executemany
+    of plain tuples built column by column on SQLite.
+    """
+    columns = ", ".join(f'"{col}"' for col in INPUT_COLUMNS)
+    conn = db.connection()
+    if db.get_bind().dialect.name == "sqlite":
+        conn.exec_driver_sql(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} AS "
+            f"SELECT {columns} FROM {table.name} WHERE 0"
+        )
+        conn.exec_driver_sql(f"DELETE FROM {STAGE_TABLE}")
+        placeholders = ", ".join("?" for _ in INPUT_COLUMNS)
+        conn.exec_driver_sql(
+            f"INSERT INTO {STAGE_TABLE} ({columns}) VALUES ({placeholders})",
+            list(zip(*[df[col].tolist() for col in INPUT_COLUMNS])),
+        )
+        return
+
+    conn.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} AS "
+        f"SELECT {columns} FROM {table.name} WITH NO DATA"
+    )
+    conn.exec_driver_sql(f"TRUNCATE {STAGE_TABLE}")
+
+    buffer = io.StringIO()
+    df[INPUT_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    copy_sql = f"COPY {STAGE_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)"
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(copy_sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def _stage():
+    return sa_table(STAGE_TABLE, *[column(col) for col in INPUT_COLUMNS])
+
+
+def _staged_key_ids(table):
+    """SELECT of the ids of existing rows whose natural key is in the staging table."""
+    stage = _stage()
+    on = and_(*[table.c[col] == stage.c[col] for col in models.NATURAL_KEY])
+    return select(table.c.id).select_from(stage.join(table, on))
+
+
+def _insert_from_stage(db: Session, table, upsert: bool):
+    """
+    Moves the chunk loaded by _load_stage into table with one INSERT ...
+    SELECT (upserting on the natural key); much faster than an
+    executemany of per-row parameter dicts with RETURNING. Returns the
+    inserted or changed ids.
     """
-    Fetches all processed data and calculates the earliest and latest
-    year/month.
+    stage = _stage()
+    # SQLite needs a WHERE in INSERT ... SELECT ... ON CONFLICT to parse it
+    staged = select(*[stage.c[col] for col in INPUT_COLUMNS]).where(true())
+    if upsert:
+        stmt = _upsert_statement(db, table, from_select=staged)
+    else:
+        stmt = insert(table).from_select(INPUT_COLUMNS, staged).returning(table.c.id)
+    return db.execute(stmt).scalars().all()
+
+
+# Columns served by /get-all-predictions/ and its exports.
+OUTPUT_COLUMNS = ["id"] + INPUT_COLUMNS + ["projected_cholera", "projected_typhoid", "model_version"]
+
+def _prediction_conditions(filters: schema.PredictionFilters):
+    table = models.PredictionData
+    conditions = []
+    if filters.region is not None:
+        conditions.append(table.Region == filters.region)
+    if filters.city is not None:
+        conditions.append(table.City == filters.city)
+    if filters.year_min is not None:
+        conditions.append(table.Year >= filters.year_min)
+    if filters.year_max is not None:
+        conditions.append(table.Year <= filters.year_max)
+    if filters.month_min is not None:
+        conditions.append(table.Month >= filters.month_min)
+    if filters.month_max is not None:
+        conditions.append(table.Month <= filters.month_max)
+    if filters.processed is True:
+        conditions.append(table.projected_cholera != None)
+    elif filters.processed is False:
+        conditions.append(table.projected_cholera == None)
+    return conditions
+
+def _prediction_select(filters: schema.PredictionFilters, after_id: int = 0):
+    table = models.PredictionData
+    return (
+        select(*[getattr(table, col) for col in OUTPUT_COLUMNS])
+        .where(table.id > after_id, *_prediction_conditions(filters))
+        .order_by(table.id)
+    )
+
+def get_prediction_page(
+    db: Session, filters: schema.PredictionFilters, after_id: int = 0, limit: int = 1000
+):
+    """
+    Returns one page of rows with id > after_id as plain mappings (no ORM
+    objects). The caller passes the last id back as the next cursor.
+    """
+    return db.execute(_prediction_select(filters, after_id).limit(limit)).mappings().all()
+
+def iter_prediction_batches(conn, filters: schema.PredictionFilters, batch_size: int = 5000):
+    """
+    Yields lists of row tuples (in OUTPUT_COLUMNS order) from a
+    server-side cursor, batch_size rows at a time.
     """
-    # Create the base query for processed data
-    query = db.query(models.PredictionData).filter(
-        models.PredictionData.projected_cholera != None,
-        models.PredictionData.projected_typhoid != None
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+        _prediction_select(filters)
     )
-    
-    # 1. Get all the data
-    all_data = query.all()
-    
-    if not all_data:
-        return None, None
-    
-    # 2. Find the date range from the processed data
-    
-    # Find earliest
-    earliest_row = query.order_by(
-        models.PredictionData.Year.asc(), 
-        models.PredictionData.Month.asc()
-    ).first()
-    
-    # Find latest
-    latest_row = query.order_by(
-        models.PredictionData.Year.desc(), 
-        models.PredictionData.Month.desc()
-    ).first()
-
-    date_range = {
-        "start_year": earliest_row.Year,
-        "start_month": earliest_row.Month,
-        "end_year": latest_row.Year,
-        "end_month": latest_row.Month,
-    }
-
-    return all_data, date_range
\ No newline at end of file
+    for partition in result.partitions():
+        yield partition
+
+
+def get_processed_fingerprint(db: Session):
+    """
+    Cheap aggregate that changes whenever the processed data does: new
+    projections, cleared projections, or rewritten rows.
+    """
+    table = models.PredictionData
+    row = db.query(
+        func.count(table.id),
+        func.max(table.id),
+        func.max(table.updated_at),
+        func.sum(table.projected_cholera),
+        func.sum(table.projected_typhoid),
+    ).filter(table.projected_cholera != None, table.projected_typhoid != None).one()
+    return tuple(str(value) for value in row)
+
+def get_cached_report(db: Session, key: str, ttl_seconds: int):
+    """Returns the cached report JSON for key if it is younger than ttl_seconds."""
+    entry = db.get(models.ReportCache, key)
+    if entry is None:
+        return None
+    created_at = entry.created_at.replace(tzinfo=timezone.utc) if entry.created_at.tzinfo is None else entry.created_at
+    if models.utcnow() - created_at > timedelta(seconds=ttl_seconds):
+        db.delete(entry)
+        db.commit()
+        return None
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_accessed = models.utcnow()
+    db.commit()
+    return entry.report_json
+
+def save_cached_report(db: Session, key: str, report_json: str, ttl_seconds: int, max_entries: int):
+    """Stores a report, then evicts expired entries and the least recently used beyond max_entries."""
+    db.merge(models.ReportCache(key=key, report_json=report_json, hits=0,
+                                created_at=models.utcnow(), last_accessed=models.utcnow()))
+    db.flush()
+
+    cache = models.ReportCache
+    db.query(cache).filter(
+        cache.created_at < models.utcnow() - timedelta(seconds=ttl_seconds)
+    ).delete(synchronize_session=False)
+    keep = db.query(cache.key).order_by(cache.last_accessed.desc()).limit(max_entries)
+    db.query(cache).filter(cache.key.not_in(keep.scalar_subquery())).delete(synchronize_session=False)
+    db.commit()
@@ -0,0 +1,114 @@
+# export.py
+"""
+Streaming exports of prediction_data. Rows come straight off a
+server-side cursor as tuples and are serialized batch by batch, without
+ORM or Pydantic objects.
+
+Parquet exports write one row group per batch (built column-wise as an
+Arrow record batch) and stream the file's bytes as each group is written;
+pyarrow is imported only when a Parquet export is requested.
+"""
+import csv
+import io
+import json
+
+import crud, schema
+from database import engine
+
+EXPORT_BATCH_SIZE = 5000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _ndjson_batch(rows) -> str:
+    columns = crud.OUTPUT_COLUMNS
+    return "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def _csv_batch(rows, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(crud.OUTPUT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def arrow_schema():
+    """Arrow schema of OUTPUT_COLUMNS (projections and model_version nullable)."""
+    import pyarrow as pa
+
+    types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+    fields = [pa.field("id", pa.int64(), nullable=False)]
+    fields += [
+        pa.field(col, types[col_type], nullable=False)
+        for col, col_type in schema.PredictionInput.__annotations__.items()
+    ]
+    fields += [
+        pa.field("projected_cholera", pa.int64()),
+        pa.field("projected_typhoid", pa.int64()),
+        pa.field("model_version", pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _parquet_chunks(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow = arrow_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, arrow, compression="zstd")
+    try:
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, arrow)],
+                schema=arrow,
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def stream_predictions(filters: schema.PredictionFilters, fmt: str = "ndjson"):
+    """
+    Generator of export chunks (text, or bytes for Parquet). Opens its own
+    connection so it does not depend on the request's session outliving
+    the response.
+    """
+    with engine.connect() as conn:
+        if fmt == "parquet":
+            yield from _parquet_chunks(crud.iter_prediction_batches(conn, filters, EXPORT_BATCH_SIZE))
+            return
+        if fmt == "csv":
+            yield _csv_batch([], header=True)
+        for rows in crud.iter_prediction_batches(conn, filters, EXPORT_BATCH_SIZE):
+            yield _csv_batch(rows) if fmt == "csv" else _ndjson_batch(rows)
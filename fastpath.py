@@ -0,0 +1,294 @@
+# fastpath.py
+"""
+NumPy-only predictor compiled from the saved sklearn pipeline.
+
+Most of the cost of a small predict is pandas and ColumnTransformer
+dispatch, not the trees. FastPredictor reads the fitted pieces out of
+the pipeline once (imputer statistics, scaler moments, one-hot
+categories, the boosted trees) and evaluates them with plain arrays:
+
+- numeric columns: impute + scale fused into one expression
+- categorical columns: precomputed category -> one-hot index maps
+- trees: every tree of every output padded into 2-D node arrays and
+  walked level by level for all rows and trees at once
+
+Only the layouts produced by model/model.ipynb and train.py are supported
+(ColumnTransformer[num: SimpleImputer+StandardScaler,
+cat: SimpleImputer+OneHotEncoder, optional "passthrough" columns, any
+dropped columns] -> MultiOutputRegressor of GradientBoostingRegressor).
+Anything else raises UnsupportedPipelineError so the caller can fall
+back to the sklearn pipeline.
+
+Run `python fastpath.py [csv]` to check parity against model.predict.
+"""
+import numpy as np
+
+DTYPE = np.float32  # sklearn trees compare features as float32
+
+
+class UnsupportedPipelineError(ValueError):
+    pass
+
+
+class FastPredictor:
+    def __init__(self, pipeline):
+        try:
+            preprocessor = pipeline.named_steps["preprocessor"]
+            regressor = pipeline.named_steps["regressor"]
+            num = preprocessor.named_transformers_["num"]
+            cat = preprocessor.named_transformers_["cat"]
+        except (AttributeError, KeyError) as e:
+            raise UnsupportedPipelineError(f"Unexpected pipeline layout: {e}")
+
+        # Offsets of each block in the ColumnTransformer output, in order
+        self.numeric_columns, self.categorical_columns, self.passthrough_columns = [], [], []
+        self.passthrough_blocks = []
+        offset = 0
+        for name, transformer, cols in preprocessor.transformers_:
+            cols = list(cols)
+            if transformer == "drop" or not cols:
+                continue
+            if name == "num":
+                self.num_offset, self.numeric_columns = offset, cols
+                offset += len(cols)
+            elif name == "cat":
+                self.cat_offset, self.categorical_columns = offset, cols
+                offset += sum(len(c) for c in cat.named_steps["onehot"].categories_)
+            elif _is_passthrough(transformer):
+                self.passthrough_blocks.append((offset, cols))
+                self.passthrough_columns.extend(cols)
+                offset += len(cols)
+            else:
+                raise UnsupportedPipelineError(f"Unsupported transformer {name!r}: {transformer!r}")
+        self.n_features = offset
+        self.input_columns = self.numeric_columns + self.categorical_columns + self.passthrough_columns
+
+        # Numeric: x -> (nan ? median : x - mean) / scale
+        imputer, scaler = num.named_steps["imputer"], num.named_steps["scaler"]
+        if imputer.strategy not in ("median", "mean", "constant", "most_frequent"):
+            raise UnsupportedPipelineError(f"Unsupported numeric imputer: {imputer.strategy}")
+        n_num = len(self.numeric_columns)
+        self.num_fill = np.asarray(imputer.statistics_, dtype=np.float64)
+        self.num_mean = (
+            np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else np.zeros(n_num)
+        )
+        self.num_scale = (
+            np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else np.ones(n_num)
+        )
+
+        # Categorical: value -> absolute column of its one-hot slot
+        cat_imputer, onehot = cat.named_steps["imputer"], cat.named_steps["onehot"]
+        if onehot.drop_idx_ is not None or onehot.handle_unknown != "ignore":
+            raise UnsupportedPipelineError("Only OneHotEncoder(handle_unknown='ignore') without drop is supported.")
+        self.cat_fill = list(cat_imputer.statistics_)
+        self.category_maps = []
+        offset = self.cat_offset
+        for categories in onehot.categories_:
+            self.category_maps.append(
+                {value: offset + i for i, value in enumerate(categories)}
+            )
+            offset += len(categories)
+
+        self._compile_trees(regressor)
+
+    def _compile_trees(self, regressor):
+        outputs = getattr(regressor, "estimators_", None)
+        if outputs is None:
+            raise UnsupportedPipelineError("Regressor is not a fitted MultiOutputRegressor.")
+
+        trees, init, rates = [], [], []
+        for booster in outputs:
+            if type(booster).__name__ != "GradientBoostingRegressor":
+                raise UnsupportedPipelineError(f"Unsupported estimator: {type(booster).__name__}")
+            if booster.init_ == "zero":
+                init.append(0.0)
+            elif hasattr(booster.init_, "constant_"):
+                init.append(float(np.ravel(booster.init_.constant_)[0]))
+            else:
+                raise UnsupportedPipelineError("Only constant (Dummy) init estimators are supported.")
+            rates.append(booster.learning_rate)
+            trees.append([stage[0].tree_ for stage in booster.estimators_])
+
+        n_outputs, n_trees = len(trees), len(trees[0])
+        if any(len(t) != n_trees for t in trees):
+            raise UnsupportedPipelineError("Outputs have different numbers of stages.")
+
+        flat = [tree for output in trees for tree in output]
+        max_nodes = max(tree.node_count for tree in flat)
+        self.max_depth = max(tree.max_depth for tree in flat)
+
+        shape = (len(flat), max_nodes)
+        self.feature = np.zeros(shape, dtype=np.intp)
+        self.threshold = np.zeros(shape, dtype=np.float64)
+        self.left = np.zeros(shape, dtype=np.intp)
+        self.right = np.zeros(shape, dtype=np.intp)
+        self.value = np.zeros(shape, dtype=np.float64)
+        for t, tree in enumerate(flat):
+            n = tree.node_count
+            own = np.arange(n)
+            is_leaf = tree.children_left == -1
+            # Leaves point at themselves so extra levels are no-ops
+            self.left[t, :n] = np.where(is_leaf, own, tree.children_left)
+            self.right[t, :n] = np.where(is_leaf, own, tree.children_right)
+            self.feature[t, :n] = np.where(is_leaf, 0, tree.feature)
+            self.threshold[t, :n] = tree.threshold
+            self.value[t, :n] = tree.value[:, 0, 0]
+
+        self.n_outputs = n_outputs
+        self.n_trees = n_trees
+        self.init = np.asarray(init, dtype=np.float64)
+        self.learning_rate = np.asarray(rates, dtype=np.float64)
+        self._tree_index = np.arange(len(flat))[None, :]
+
+    def transform(self, columns) -> np.ndarray:
+        """Builds the dense design matrix from a mapping of column -> values."""
+        n = len(columns[self.numeric_columns[0]])
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+
+        numeric = np.column_stack([
+            np.asarray(columns[col], dtype=np.float64) for col in self.numeric_columns
+        ]) if n else np.zeros((0, len(self.numeric_columns)))
+        numeric = np.where(np.isnan(numeric), self.num_fill, numeric)
+        X[:, self.num_offset: self.num_offset + len(self.numeric_columns)] = (numeric - self.num_mean) / self.num_scale
+
+        # Passthrough columns reach the trees as-is
+        for offset, cols in self.passthrough_blocks:
+            for i, col in enumerate(cols):
+                X[:, offset + i] = np.asarray(columns[col], dtype=np.float64)
+
+        rows = np.arange(n)
+        for col, fill, mapping in zip(self.categorical_columns, self.cat_fill, self.category_maps):
+            index = np.fromiter(
+                (mapping.get(fill if _is_missing(v) else v, -1) for v in columns[col]),
+                dtype=np.intp,
+                count=n,
+            )
+            known = index >= 0
+            X[rows[known], index[known]] = 1.0
+        return X
+
+    def predict_matrix(self, X: np.ndarray) -> np.ndarray:
+        """Evaluates all boosted trees over a transformed matrix."""
+        X = X.astype(DTYPE).astype(np.float64)
+        n = X.shape[0]
+        rows = np.arange(n)[:, None]
+        tree = self._tree_index
+        nodes = np.zeros((n, tree.shape[1]), dtype=np.intp)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[tree, nodes]] <= self.threshold[tree, nodes]
+            nodes = np.where(go_left, self.left[tree, nodes], self.right[tree, nodes])
+
+        leaves = self.value[tree, nodes].reshape(n, self.n_outputs, self.n_trees)
+        return self.init + self.learning_rate * leaves.sum(axis=2)
+
+    def preprocess(self, X) -> np.ndarray:
+        """The design matrix for a DataFrame (or dict of columns)."""
+        columns = {
+            col: (X[col].to_numpy() if hasattr(X[col], "to_numpy") else X[col])
+            for col in self.input_columns
+        }
+        return self.transform(columns)
+
+    def preprocess_records(self, records) -> np.ndarray:
+        """The design matrix for a list of input dicts, without a DataFrame."""
+        columns = {
+            col: [record.get(col) for record in records]
+            for col in self.input_columns
+        }
+        for col in self.numeric_columns + self.passthrough_columns:
+            columns[col] = [np.nan if v is None else v for v in columns[col]]
+        return self.transform(columns)
+
+    def predict(self, X) -> np.ndarray:
+        """Drop-in for pipeline.predict on a DataFrame (or dict of columns)."""
+        return self.predict_matrix(self.preprocess(X))
+
+    def predict_records(self, records) -> np.ndarray:
+        """Predicts a list of input dicts without building a DataFrame."""
+        return self.predict_matrix(self.preprocess_records(records))
+
+
+def _is_passthrough(transformer) -> bool:
+    # Fitted ColumnTransformers hold "passthrough" as an identity FunctionTransformer
+    if isinstance(transformer, str):
+        return transformer == "passthrough"
+    return (
+        type(transformer).__name__ == "FunctionTransformer"
+        and transformer.func is None
+        and transformer.inverse_func is None
+    )
+
+
+def _is_missing(value) -> bool:
+    # Like SimpleImputer(missing_values=np.nan) on object columns: only NaN
+    # is imputed; None falls through to OneHotEncoder as an unknown category.
+    return isinstance(value, float) and value != value
+
+
+def probe_frame(predictor: FastPredictor, rows: int = 64, seed: int = 0):
+    """Synthesises inputs covering every known category plus unknown/missing values."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col, fill, mean, scale in zip(
+        predictor.numeric_columns, predictor.num_fill, predictor.num_mean, predictor.num_scale
+    ):
+        values = rng.normal(mean, scale * 1.5, size=rows)
+        values[rng.random(rows) < 0.05] = np.nan
+        data[col] = values
+    for col, mapping in zip(predictor.categorical_columns, predictor.category_maps):
+        choices = list(mapping) + ["__unknown__", None, np.nan]
+        data[col] = [choices[i % len(choices)] for i in rng.permutation(rows)]
+    for offset, cols in predictor.passthrough_blocks:
+        for i, col in enumerate(cols):
+            # Values just either side of the thresholds the trees split this column on
+            split = predictor.threshold[(predictor.feature == offset + i) & (predictor.left != predictor.right)]
+            split = split if len(split) else np.zeros(1)
+            data[col] = rng.choice(split, size=rows) + rng.choice([-0.5, 0.5], size=rows)
+    return pd.DataFrame(data)
+
+
+def check_parity(pipeline, predictor: FastPredictor, frame=None, atol: float = 1e-6):
+    """
+    Compares predictor.predict against pipeline.predict and returns the
+    max absolute difference. Raises AssertionError beyond atol.
+    """
+    frame = probe_frame(predictor) if frame is None else frame
+    expected = pipeline.predict(frame)
+    actual = predictor.predict(frame)
+    diff = float(np.max(np.abs(expected - actual))) if len(frame) else 0.0
+    if diff > atol:
+        raise AssertionError(f"Fast predictor differs from pipeline by {diff} (> {atol}).")
+    return diff
+
+
+def build_fast_predictor(pipeline, atol: float = 1e-6) -> FastPredictor:
+    """Compiles the pipeline and verifies it against model.predict before use."""
+    predictor = FastPredictor(pipeline)
+    check_parity(pipeline, predictor, atol=atol)
+    return predictor
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    import joblib
+    import pandas as pd
+
+    pipeline = joblib.load(sys.argv[2] if len(sys.argv) > 2 else "model/cholera_gb_pipeline.joblib")
+    frame = pd.read_csv(sys.argv[1] if len(sys.argv) > 1 else "test.csv")
+    predictor = FastPredictor(pipeline)
+    print(f"Max abs diff (probe): {check_parity(pipeline, predictor)}")
+    print(f"Max abs diff (file):  {check_parity(pipeline, predictor, frame)}")
+
+    record = frame.iloc[0].to_dict()
+    for name, fn in (
+        ("sklearn", lambda: pipeline.predict(pd.DataFrame([record]))),
+        ("fast", lambda: predictor.predict_records([record])),
+    ):
+        start = time.perf_counter()
+        for _ in range(200):
+            fn()
+        print(f"{name:8s} single-row predict: {(time.perf_counter() - start) / 200 * 1e3:.3f} ms")
@@ -0,0 +1,273 @@
+# features.py
+"""
+Time-series feature store keyed on (City, Year, Month).
+
+For every stored district-month, district_features holds:
+
+- <disease>_lag1 / <disease>_lag3: cases 1 and 3 calendar months earlier
+- rainfall_roll<N> / sanitation_roll<N>: mean over the last N calendar
+  months (current month included, missing months skipped)
+
+A row's features depend only on the previous MAX_LOOKBACK months of the
+same city, so an ingest that changes months p1 .. p2 recomputes only the
+affected cities' months p1 .. p2 + MAX_LOOKBACK (refresh(), called from
+crud.bulk_insert_data_from_dataframe in the upload transaction).
+
+Cities are identified by name alone, as in model/model.ipynb
+(groupby("City")), so city names are expected to be unique across regions.
+
+Inference reads features with a primary-key lookup (lookup_frame()),
+computing them on demand for months that are not stored;
+training_frame() / `python features.py export out.csv` produce the
+notebook's dataset plus these features and the Next_Month_* targets.
+"""
+import pandas as pd
+from sqlalchemy import and_, delete, insert, select
+from sqlalchemy.orm import Session
+
+import crud, models
+
+LAGS = (1, 3)
+WINDOWS = (3, 6)
+LAG_SOURCES = {"cholera": "Cholera_Cases", "typhoid": "Typhoid_Cases"}
+ROLLING_SOURCES = {"rainfall": "Rainfall_mm", "sanitation": "Sanitation_Index"}
+
+FEATURE_COLUMNS = [
+    *[f"{name}_lag{lag}" for name in LAG_SOURCES for lag in LAGS],
+    *[f"{name}_roll{window}" for name in ROLLING_SOURCES for window in WINDOWS],
+]
+MAX_LOOKBACK = max(max(LAGS), max(WINDOWS) - 1)
+
+KEY = ["City", "Year", "Month"]
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+KEY_BATCH_SIZE = 300
+
+
+def _period(year, month):
+    return year * 12 + (month - 1)
+
+
+def compute_features(history: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes FEATURE_COLUMNS for every row of history (City, Year, Month
+    and the source columns), using only rows present in history.
+    """
+    df = history.assign(period=_period(history["Year"], history["Month"]))
+    df = df.drop_duplicates(subset=["City", "period"], keep="last").set_index(["City", "period"])
+    cities = df.index.get_level_values("City")
+    periods = df.index.get_level_values("period")
+
+    def shifted(col, months):
+        index = pd.MultiIndex.from_arrays([cities, periods - months])
+        return df[col].reindex(index).to_numpy()
+
+    out = df[["Year", "Month"]].copy()
+    for name, col in LAG_SOURCES.items():
+        for lag in LAGS:
+            out[f"{name}_lag{lag}"] = shifted(col, lag)
+    for name, col in ROLLING_SOURCES.items():
+        for window in WINDOWS:
+            values = pd.DataFrame({k: shifted(col, k) for k in range(window)})
+            out[f"{name}_roll{window}"] = values.mean(axis=1, skipna=True).to_numpy()
+    return out.reset_index().drop(columns="period")
+
+
+def _keys_for_ids(db: Session, ids):
+    table = models.PredictionData
+    ids = [int(i) for i in ids]
+    keys = []
+    for i in range(0, len(ids), KEY_BATCH_SIZE):
+        keys.extend(db.execute(
+            select(table.City, table.Year, table.Month).where(table.id.in_(ids[i:i + KEY_BATCH_SIZE]))
+        ).all())
+    return keys
+
+
+def refresh(db: Session, ids):
+    """
+    Recomputes the features affected by the prediction_data rows in ids:
+    every stored month of the affected cities from the earliest changed
+    month to MAX_LOOKBACK months after the latest one.
+    """
+    keys = _keys_for_ids(db, ids)
+    if not keys:
+        return 0
+
+    cities = sorted({city for city, _, _ in keys})
+    changed = [_period(year, month) for _, year, month in keys]
+    low, high = min(changed), max(changed) + MAX_LOOKBACK
+
+    table = models.PredictionData
+    store = models.DistrictFeatures
+    period = table.Year * 12 + table.Month - 1
+    store_period = store.Year * 12 + store.Month - 1
+    sources = [getattr(table, col) for col in (*LAG_SOURCES.values(), *ROLLING_SOURCES.values())]
+    written = 0
+    for i in range(0, len(cities), KEY_BATCH_SIZE):
+        batch = cities[i:i + KEY_BATCH_SIZE]
+        # History reaches MAX_LOOKBACK months before the recomputed range
+        rows = db.execute(
+            select(table.City, table.Year, table.Month, *sources)
+            .where(table.City.in_(batch), period.between(low - MAX_LOOKBACK, high))
+        ).all()
+        history = pd.DataFrame.from_records(
+            rows, columns=["City", "Year", "Month", *LAG_SOURCES.values(), *ROLLING_SOURCES.values()]
+        )
+        features = compute_features(history)
+        features = features[_period(features["Year"], features["Month"]) >= low]
+
+        db.execute(delete(store).where(store.City.in_(batch), store_period.between(low, high)))
+        records = _records(features)
+        if records:
+            db.execute(insert(store), records)
+        written += len(records)
+    return written
+
+
+def _records(df: pd.DataFrame):
+    now = models.utcnow()
+    records = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    for record in records:
+        for col, value in record.items():
+            if hasattr(value, "item"):
+                record[col] = value.item()
+        record["updated_at"] = now
+    return records
+
+
+def rebuild(db: Session):
+    """Recomputes the whole store (e.g. after enabling it on an existing database)."""
+    db.execute(delete(models.DistrictFeatures))
+    ids = db.execute(select(models.PredictionData.id)).scalars().all()
+    written = refresh(db, ids)
+    db.commit()
+    return written
+
+
+def rebuild_if_missing(db: Session):
+    """Builds the store once when prediction_data has rows but no features exist yet."""
+    if db.query(models.DistrictFeatures).first() is not None:
+        return 0
+    if db.query(models.PredictionData.id).first() is None:
+        return 0
+    written = rebuild(db)
+    print(f"Built feature store: {written} district-months.")
+    return written
+
+
+def _stored(db: Session, keys):
+    """Stored feature rows for keys, by (City, Year, Month)."""
+    store = models.DistrictFeatures
+    wanted = set(keys)
+    found = {}
+    for i in range(0, len(keys), KEY_BATCH_SIZE):
+        batch = keys[i:i + KEY_BATCH_SIZE]
+        # One IN list per key column walks the primary key; a row-value IN scans the table
+        for row in db.execute(
+            select(store.City, store.Year, store.Month, *[getattr(store, col) for col in FEATURE_COLUMNS])
+            .where(*[getattr(store, col).in_({key[j] for key in batch}) for j, col in enumerate(KEY)])
+        ):
+            if tuple(row[:3]) in wanted:
+                found[tuple(row[:3])] = row[3:]
+    return found
+
+
+def _on_demand(db: Session, keys: pd.DataFrame, misses):
+    """
+    Features for unstored keys, computed from each city's stored history
+    plus the rows of keys themselves (their source columns, where present).
+    """
+    sources = [*LAG_SOURCES.values(), *ROLLING_SOURCES.values()]
+    requested = pd.DataFrame(misses, columns=KEY)
+    own = keys[KEY + [col for col in sources if col in keys.columns]].merge(requested, on=KEY)
+
+    table = models.PredictionData
+    period = table.Year * 12 + table.Month - 1
+    periods = [_period(year, month) for _, year, month in misses]
+    low, high = min(periods) - MAX_LOOKBACK, max(periods)
+    cities = sorted({city for city, _, _ in misses})
+    stored = []
+    for i in range(0, len(cities), KEY_BATCH_SIZE):
+        stored.extend(db.execute(
+            select(table.City, table.Year, table.Month, *[getattr(table, col) for col in sources])
+            .where(table.City.in_(cities[i:i + KEY_BATCH_SIZE]), period.between(low, high))
+        ).all())
+    # The request's own values win over a stored row for the same month
+    frames = [frame for frame in (pd.DataFrame.from_records(stored, columns=KEY + sources), own) if not frame.empty]
+    if not frames:
+        return {}
+    history = pd.concat(frames, ignore_index=True)
+    computed = compute_features(history).merge(requested, on=KEY)
+    return {
+        (row[0], row[1], row[2]): row[3:]
+        for row in computed[KEY + FEATURE_COLUMNS].itertuples(index=False, name=None)
+    }
+
+
+def lookup_frame(db: Session, keys: pd.DataFrame) -> pd.DataFrame:
+    """
+    FEATURE_COLUMNS for each (City, Year, Month) row of keys, in the same
+    order, via primary-key lookups. Keys that are not stored (e.g. a
+    /predict for a month not uploaded yet) are computed on demand from the
+    city's stored history and the row itself; features without any
+    history are NaN.
+    """
+    wanted = list(zip(keys["City"].tolist(), keys["Year"].tolist(), keys["Month"].tolist()))
+    unique = list(set(wanted))
+    found = _stored(db, unique)
+    misses = [key for key in unique if key not in found]
+    if misses:
+        found.update(_on_demand(db, keys, misses))
+    missing = (None,) * len(FEATURE_COLUMNS)
+    return pd.DataFrame.from_records(
+        [found.get(key, missing) for key in wanted],
+        columns=FEATURE_COLUMNS,
+        index=keys.index,
+    ).astype("float64")
+
+
+def get_features(db: Session, city: str, year: int, month: int):
+    """One district-month's features, or None if it is not stored."""
+    return db.get(models.DistrictFeatures, (city, year, month))
+
+
+def training_frame(db: Session) -> pd.DataFrame:
+    """
+    The model/model.ipynb dataset (input columns, Next_Month_* targets of
+    the following calendar month) joined with the stored features.
+    """
+    table = models.PredictionData
+    store = models.DistrictFeatures
+    df = pd.read_sql_query(
+        select(*[getattr(table, col) for col in crud.INPUT_COLUMNS],
+               *[getattr(store, col) for col in FEATURE_COLUMNS])
+        .outerjoin(store, and_(store.City == table.City, store.Year == table.Year, store.Month == table.Month))
+        .order_by(table.City, table.Year, table.Month),
+        db.connection(),
+    )
+    period = _period(df["Year"], df["Month"])
+    following = df.assign(period=period - 1).drop_duplicates(subset=["City", "period"], keep="last")
+    following = following.set_index(["City", "period"])
+    index = pd.MultiIndex.from_arrays([df["City"], period])
+    df["Next_Month_Cholera"] = following["Cholera_Cases"].reindex(index).to_numpy()
+    df["Next_Month_Typhoid"] = following["Typhoid_Cases"].reindex(index).to_numpy()
+    return df
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import SessionLocal
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("export", "rebuild"):
+        sys.exit("usage: python features.py export out.csv | rebuild")
+    db = SessionLocal()
+    try:
+        if sys.argv[1] == "rebuild":
+            print(f"Rebuilt {rebuild(db)} district-months.")
+        else:
+            frame = training_frame(db)
+            frame.to_csv(sys.argv[2] if len(sys.argv) > 2 else "training_features.csv", index=False)
+            print(f"Exported {len(frame)} rows.")
+    finally:
+        db.close()
@@ -0,0 +1,194 @@
+# inference.py
+import os
+import time
+from typing import Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+import crud, metrics, schema
+
+PREDICTION_CHUNK_SIZE = int(os.getenv("PREDICTION_CHUNK_SIZE", "1000"))
+# "sklearn" runs the joblib pipeline as-is; "fast" compiles it to the
+# NumPy-only predictor in fastpath.py (falls back to sklearn if unsupported).
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "sklearn")
+# e.g. "r" to memory-map the pipeline's arrays (uncompressed artifacts only),
+# so forked/spawned workers share pages instead of each holding a copy.
+MODEL_MMAP_MODE = os.getenv("MODEL_MMAP_MODE") or None
+
+# --- NEW: predict time split into feature preprocessing and the regressor ---
+PREDICT_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "model_predict_seconds", "Model predict time by stage", labelnames=("stage",)
+)
+PREDICT_ROWS = metrics.REGISTRY.histogram(
+    "model_predict_rows", "Rows per model predict call", buckets=[1, 8, 64, 512, 1000, 5000, 10000, 50000]
+)
+
+
+def load_model(path: str, backend: str = INFERENCE_BACKEND, mmap_mode: Optional[str] = MODEL_MMAP_MODE):
+    """
+    Loads the pipeline from disk and, for the "fast" backend, swaps in a
+    compiled FastPredictor once it has passed the parity check.
+    """
+    pipeline = joblib.load(path, mmap_mode=mmap_mode)
+    if backend != "fast":
+        return pipeline
+
+    import fastpath
+    try:
+        predictor = fastpath.build_fast_predictor(pipeline)
+    except Exception as e:
+        # Any failure to compile or verify falls back to the pipeline
+        print(f"Fast inference unavailable, using sklearn pipeline: {type(e).__name__}: {e}")
+        return pipeline
+    print("Fast inference path enabled (parity check passed).")
+    return predictor
+
+
+def warm_up(model) -> float:
+    """
+    Runs one throwaway prediction so the first real request doesn't pay
+    for lazy imports and first-call allocations. Returns milliseconds.
+    """
+    record = {
+        col: ("" if annotation is str else 0)
+        for col, annotation in schema.PredictionInput.__annotations__.items()
+    }
+    started = time.perf_counter()
+    predict_records(model, [record])
+    return (time.perf_counter() - started) * 1000
+
+
+def model_features(model):
+    """Column names the model was trained on."""
+    names = getattr(model, "feature_names_in_", None)
+    if names is None and hasattr(model, "input_columns"):
+        names = model.input_columns
+    return list(names) if names is not None else list(crud.INPUT_COLUMNS)
+
+
+def store_features(model):
+    """Feature-store columns (lags, rolling windows) the model expects."""
+    import features
+
+    expected = set(model_features(model))
+    return [col for col in features.FEATURE_COLUMNS if col in expected]
+
+
+def add_store_features(model, df: pd.DataFrame, db: Optional[Session] = None) -> pd.DataFrame:
+    """
+    Joins the feature-store columns a model needs onto df by (City, Year,
+    Month) lookup, computing them from stored history for months that are
+    not stored. A no-op for models trained on the input columns only.
+    """
+    needed = [col for col in store_features(model) if col not in df.columns]
+    if not needed:
+        return df
+    import features
+
+    if db is None:
+        from database import SessionLocal
+
+        with SessionLocal() as session:
+            looked_up = features.lookup_frame(session, df)
+    else:
+        looked_up = features.lookup_frame(db, df)
+    return df.join(looked_up[needed])
+
+
+def _stages(model):
+    """
+    (preprocess, regressor) callables for a sklearn Pipeline or a
+    FastPredictor, or None for anything else.
+    """
+    if hasattr(model, "predict_matrix"):
+        return model.preprocess, model.predict_matrix
+    steps = getattr(model, "steps", None)
+    if not steps or len(steps) < 2:
+        return None
+    # Same steps Pipeline.predict runs, in the same order
+    transformers = [step for _, step in steps[:-1] if step not in (None, "passthrough")]
+
+    def preprocess(X):
+        for step in transformers:
+            X = step.transform(X)
+        return X
+
+    return preprocess, steps[-1][1].predict
+
+
+def _timed_predict(model, X, preprocess=None) -> np.ndarray:
+    """model.predict(X), recording preprocessing and regressor time separately."""
+    PREDICT_ROWS.observe(len(X))
+    stages = _stages(model)
+    if stages is None:
+        with PREDICT_STAGE_SECONDS.labels("total").time():
+            return model.predict(X)
+    with PREDICT_STAGE_SECONDS.labels("preprocess").time():
+        X = (preprocess or stages[0])(X)
+    with PREDICT_STAGE_SECONDS.labels("regressor").time():
+        return stages[1](X)
+
+
+def predict_records(model, records) -> np.ndarray:
+    """
+    Predicts a list of input dicts. Uses the fast predictor's
+    DataFrame-free path when available.
+    """
+    if store_features(model):
+        return predict_frame(model, pd.DataFrame(records))
+    if hasattr(model, "preprocess_records"):
+        return _timed_predict(model, records, preprocess=model.preprocess_records)
+    return _timed_predict(model, pd.DataFrame(records))
+
+
+def predict_frame(model, df: pd.DataFrame, db: Optional[Session] = None) -> np.ndarray:
+    """
+    Runs the pipeline once over a whole DataFrame and returns an (n, 2)
+    integer array of [cholera, typhoid] projections. Feature-store
+    columns the model needs are looked up first.
+    """
+    df = add_store_features(model, df, db=db)
+    prediction = _timed_predict(model, df[crud.INPUT_COLUMNS + store_features(model)])
+    return prediction.astype(int)
+
+
+def process_pending_chunk(
+    db: Session,
+    model,
+    after_id: int = 0,
+    chunk_size: int = PREDICTION_CHUNK_SIZE,
+    max_id: Optional[int] = None,
+    model_version: Optional[str] = None,
+):
+    """
+    Loads one chunk of unpredicted rows with id > after_id (and <= max_id,
+    if given), predicts it with a single model.predict call, and writes the
+    results back (tagged with model_version) in one bulk update. Returns
+    timing stats and the last id of the chunk.
+    """
+    start = time.perf_counter()
+    frame = crud.get_unpredicted_frame(
+        db=db, after_id=after_id, limit=chunk_size, max_id=max_id
+    )
+    if frame.empty:
+        return {"rows": 0, "seconds": 0.0, "rows_per_sec": 0.0, "last_id": after_id}
+
+    prediction = predict_frame(model, frame, db=db)
+    rows = crud.bulk_update_predictions(
+        db=db,
+        ids=frame["id"].to_numpy(),
+        cholera=prediction[:, 0],
+        typhoid=prediction[:, 1],
+        model_version=model_version,
+    )
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else 0.0,
+        "last_id": int(frame["id"].iloc[-1]),
+    }
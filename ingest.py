@@ -0,0 +1,207 @@
+# ingest.py
+"""
+Streaming ingestion for /upload-data/.
+
+Uploads are read in chunks of INGEST_CHUNK_SIZE rows straight from the
+spooled upload file, validated column-wise and bulk-inserted chunk by
+chunk, so memory stays flat whatever the file size. All chunks share
+one transaction: an unreadable file or missing columns leave nothing
+behind. Rows that fail validation are skipped and reported (row number
+and messages, the first INGEST_MAX_REPORTED_ERRORS of them) rather than
+failing the upload.
+
+Readers by extension:
+
+- .csv:              pd.read_csv(chunksize=...)
+- .xlsx:             python-calamine's row iterator (XLSX_READER=openpyxl,
+                     or calamine not installed, uses openpyxl read-only mode)
+- .parquet:          pyarrow row-group batches, reading only the input columns
+- .arrow / .feather: Arrow IPC (file or stream format) record batches
+
+Parquet and Arrow data stays columnar (Arrow batches -> DataFrame
+columns -> bulk insert); no per-row Python objects are built.
+"""
+import os
+import time
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+import crud, validation
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "10000"))
+INGEST_MAX_REPORTED_ERRORS = int(os.getenv("INGEST_MAX_REPORTED_ERRORS", "1000"))
+XLSX_READER = os.getenv("XLSX_READER", "calamine")  # "calamine" or "openpyxl"
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".parquet", ".arrow", ".feather")
+
+ARROW_FILE_MAGIC = b"ARROW1"
+TEXT_COLUMNS = [col for col, col_type in validation.COLUMN_TYPES.items() if col_type is str]
+
+
+def iter_csv_chunks(fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    yield from pd.read_csv(fileobj, chunksize=chunksize)
+
+
+def _xlsx_frame(batch, header) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(batch, columns=header)
+    # Numeric-looking names (e.g. a City of 123) come back as 123.0
+    for col in TEXT_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].map(lambda v: str(int(v)) if isinstance(v, float) and v.is_integer() else v)
+    return df
+
+
+def _iter_row_chunks(rows, chunksize: int, empty=None):
+    """
+    Groups a header row + data rows into DataFrames, skipping blank rows.
+    Cells equal to empty are read as None.
+    """
+    header = next(rows, None)
+    if header is None:
+        return
+    batch = []
+    for row in rows:
+        if empty is not None:
+            row = [None if value == empty else value for value in row]
+        if all(value is None for value in row):
+            continue
+        batch.append(row)
+        if len(batch) >= chunksize:
+            yield _xlsx_frame(batch, header)
+            batch = []
+    if batch:
+        yield _xlsx_frame(batch, header)
+
+
+def iter_xlsx_chunks_openpyxl(fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    """Streams the first worksheet row by row (openpyxl read-only mode)."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from _iter_row_chunks(workbook.worksheets[0].iter_rows(values_only=True), chunksize)
+    finally:
+        workbook.close()
+
+
+def iter_xlsx_chunks_calamine(fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    """
+    Iterates the first worksheet with python-calamine (Rust), which
+    parses several times faster than openpyxl. Empty cells come back as
+    "" and are turned into None, as openpyxl reports them.
+    """
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_filelike(fileobj)
+    try:
+        yield from _iter_row_chunks(iter(workbook.get_sheet_by_index(0).iter_rows()), chunksize, empty="")
+    finally:
+        workbook.close()
+
+
+def iter_xlsx_chunks(fileobj, chunksize: int = INGEST_CHUNK_SIZE, reader: str = XLSX_READER):
+    if reader == "calamine":
+        try:
+            import python_calamine  # noqa: F401
+        except ImportError:
+            reader = "openpyxl"
+    if reader == "calamine":
+        return iter_xlsx_chunks_calamine(fileobj, chunksize)
+    return iter_xlsx_chunks_openpyxl(fileobj, chunksize)
+
+
+def _input_columns(names):
+    """The input columns present in an Arrow schema (all names if any are missing, so validation reports them)."""
+    present = [col for col in crud.INPUT_COLUMNS if col in names]
+    return present if len(present) == len(crud.INPUT_COLUMNS) else list(names)
+
+
+def iter_arrow_frames(batches, chunksize: int = INGEST_CHUNK_SIZE):
+    """Regroups Arrow record batches of any size into DataFrames of chunksize rows."""
+    import pyarrow as pa
+
+    buffered = None
+    for batch in batches:
+        table = pa.Table.from_batches([batch])
+        buffered = table if buffered is None else pa.concat_tables([buffered, table])
+        while buffered.num_rows >= chunksize:
+            yield buffered.slice(0, chunksize).to_pandas()
+            buffered = buffered.slice(chunksize)
+    if buffered is not None and buffered.num_rows:
+        yield buffered.to_pandas()
+
+
+def iter_parquet_chunks(fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(fileobj)
+    columns = _input_columns(parquet.schema_arrow.names)
+    yield from iter_arrow_frames(parquet.iter_batches(batch_size=chunksize, columns=columns), chunksize)
+
+
+def iter_arrow_chunks(fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    """Arrow IPC in either the file (random access) or the stream format."""
+    import pyarrow.ipc as ipc
+
+    is_file = fileobj.read(len(ARROW_FILE_MAGIC)) == ARROW_FILE_MAGIC
+    fileobj.seek(0)
+    if is_file:
+        reader = ipc.open_file(fileobj)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        reader = ipc.open_stream(fileobj)
+        batches = iter(reader)
+    columns = _input_columns(reader.schema.names)
+    yield from iter_arrow_frames((batch.select(columns) for batch in batches), chunksize)
+
+
+def iter_upload_chunks(filename: str, fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    """Picks the chunked reader for an upload by file extension."""
+    if filename.endswith(".csv"):
+        return iter_csv_chunks(fileobj, chunksize)
+    if filename.endswith(".xlsx"):
+        return iter_xlsx_chunks(fileobj, chunksize)
+    if filename.endswith(".parquet"):
+        return iter_parquet_chunks(fileobj, chunksize)
+    if filename.endswith((".arrow", ".feather")):
+        return iter_arrow_chunks(fileobj, chunksize)
+    raise ValueError(f"Unsupported file type: {filename}")
+
+
+def ingest_upload(db: Session, filename: str, fileobj, chunksize: int = INGEST_CHUNK_SIZE):
+    """
+    Upserts an uploaded file chunk by chunk and commits once at the end.
+    Returns row/chunk counts, the ids that were inserted or changed (and
+    so need predicting), the rejected-row count with its error report
+    and the ingest rate. Raises ValueError for unreadable files or
+    missing columns (after rolling back).
+    """
+    start = time.perf_counter()
+    rows, chunks, rejected_rows, touched_ids, errors = 0, 0, 0, [], []
+    try:
+        for chunk in iter_upload_chunks(filename, fileobj, chunksize):
+            rejected = []
+            crud.bulk_insert_data_from_dataframe(
+                db=db, df=chunk, commit=False, touched_ids=touched_ids,
+                rejected=rejected, row_offset=rows,
+            )
+            rejected_rows += len(rejected)
+            errors.extend(rejected[:INGEST_MAX_REPORTED_ERRORS - len(errors)])
+            rows += len(chunk)
+            chunks += 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "rows_written": len(touched_ids),
+        "rows_rejected": rejected_rows,
+        "errors": errors,
+        "touched_ids": touched_ids,
+        "chunks": chunks,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,148 @@
+# llm.py
+"""
+Async LLM layer for report narratives.
+
+- The Gemini client is instructor's async client, so a slow round trip
+  no longer blocks the event loop.
+- Every call has a timeout (LLM_TIMEOUT_SECONDS) and goes through a
+  semaphore (LLM_MAX_CONCURRENCY); whole report generations are capped
+  separately (REPORT_MAX_CONCURRENCY).
+- Large datasets are summarised map-reduce style: one call per region
+  group in parallel, then one call that merges the partial narratives.
+- LLM_PROVIDER=stub swaps in a local deterministic provider (with an
+  optional artificial delay) for offline development and load tests.
+"""
+import asyncio
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+
+import metrics, reporting, schema
+
+load_dotenv()
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_MODEL = os.getenv("LLM_MODEL", "google/gemini-2.5-flash")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", "2"))
+LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "0"))
+# Serve a deterministic narrative built from the data when the LLM fails.
+LLM_FALLBACK = os.getenv("LLM_FALLBACK", "1") == "1"
+
+# --- NEW: call latency by outcome, and prompt size (reporting.estimate_tokens) ---
+LLM_CALL_SECONDS = metrics.REGISTRY.histogram(
+    "llm_call_seconds", "LLM call duration by provider and outcome", labelnames=("provider", "outcome")
+)
+LLM_PROMPT_TOKENS = metrics.REGISTRY.histogram(
+    "llm_prompt_tokens", "Estimated prompt tokens per LLM call",
+    buckets=[250, 500, 1000, 2000, 4000, 8000, 16000, 32000], labelnames=("provider",)
+)
+
+_client = None
+_call_semaphore = None
+_report_semaphore = None
+
+
+class StubLLM:
+    """
+    Offline stand-in for the instructor client: answers ReportNarrative
+    requests from the OVERVIEW and district lines in the prompt.
+    """
+
+    async def create(self, response_model, messages, **kwargs):
+        if LLM_STUB_LATENCY_MS:
+            await asyncio.sleep(LLM_STUB_LATENCY_MS / 1000.0)
+        prompt = messages[-1]["content"]
+        overview = [
+            line.strip() for line in prompt.splitlines()
+            if line.strip().startswith(("Entries:", "Cholera:", "Typhoid:"))
+        ]
+        districts = re.findall(r"^\s*(.+?) / (.+?) \(", prompt, flags=re.MULTILINE)
+        hotspots = ", ".join(f"{city} ({region})" for region, city in districts[:3])
+        return response_model(
+            description=" ".join(overview) or "No summary data was provided.",
+            call_to_action=(
+                f"1. Prioritise surveillance in {hotspots}. "
+                if hotspots else "1. Maintain routine surveillance. "
+            ) + "2. Review sanitation and water-quality programmes in Severe-risk districts.",
+        )
+
+
+def get_client():
+    """Builds the configured provider on first use."""
+    global _client
+    if _client is None:
+        if LLM_PROVIDER == "stub":
+            _client = StubLLM()
+        else:
+            if not os.getenv("GOOGLE_API_KEY"):
+                raise ValueError("GOOGLE_API_KEY not found in .env file")
+            import instructor
+
+            _client = instructor.from_provider(
+                LLM_MODEL,
+                async_client=True,
+                mode=instructor.Mode.GEMINI_JSON,
+            )
+    return _client
+
+
+def _semaphores():
+    global _call_semaphore, _report_semaphore
+    if _call_semaphore is None:
+        _call_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _report_semaphore = asyncio.Semaphore(REPORT_MAX_CONCURRENCY)
+    return _call_semaphore, _report_semaphore
+
+
+def report_slot():
+    """Async context manager limiting concurrent report generations."""
+    return _semaphores()[1]
+
+
+async def create(response_model, system_prompt: str, user_prompt: str, timeout: float = LLM_TIMEOUT_SECONDS):
+    """One structured LLM call, bounded by the call semaphore and a timeout."""
+    call_semaphore, _ = _semaphores()
+    LLM_PROMPT_TOKENS.labels(LLM_PROVIDER).observe(reporting.estimate_tokens(system_prompt + user_prompt))
+    async with call_semaphore:
+        started, outcome = time.perf_counter(), "error"
+        try:
+            result = await asyncio.wait_for(
+                get_client().create(
+                    response_model=response_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    max_retries=2,
+                ),
+                timeout=timeout,
+            )
+            outcome = "ok"
+            return result
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            LLM_CALL_SECONDS.labels(LLM_PROVIDER, outcome).observe(time.perf_counter() - started)
+
+
+async def map_reduce_narrative(system_prompt: str, chunk_prompts, reduce_prompt_fn):
+    """
+    Summarises each chunk prompt in parallel, then asks for one narrative
+    over the partial results. reduce_prompt_fn takes the list of partial
+    ReportNarratives and returns the reduce-step user prompt. Key-factor
+    summaries from the map step are carried into the result.
+    """
+    partials = await asyncio.gather(*[
+        create(schema.ReportNarrative, system_prompt, prompt) for prompt in chunk_prompts
+    ])
+    final = await create(schema.ReportNarrative, system_prompt, reduce_prompt_fn(partials))
+
+    key_factors = [k for partial in partials for k in (partial.key_factors or [])]
+    if key_factors and not final.key_factors:
+        final.key_factors = key_factors
+    return final
@@ -1,44 +1,110 @@
-import joblib
+import asyncio
 import pandas as pd
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
-from sklearn.impute import SimpleImputer
-import io
+import time
+import uuid
+from contextlib import asynccontextmanager
 
 from sqlalchemy.orm import Session
-import crud, models, schema, database
+import crud, models, schema, inference, backlog, worker, batcher, batch_predict, ingest, export, reporting, registry, predict_cache, summaries, features, metrics
 from database import SessionLocal, engine
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import List, Literal
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, BackgroundTasks, Request, Response, Query, Header
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from typing import List, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
-import instructor
+from starlette.concurrency import run_in_threadpool
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timezone
-import google.generativeai as genai
+# The LLM stack (instructor / Gemini) is imported by llm.py on the first report request
+import llm
 
 
 
-# --- ADDED: Create DB tables on startup ---
-models.Base.metadata.create_all(bind=engine)
-
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in .env file")
+if llm.LLM_PROVIDER == "gemini" and not GOOGLE_API_KEY:
+    print("WARNING: GOOGLE_API_KEY not set; reports will use the fallback narrative.")
+
+# Load the model after the server starts accepting requests (readiness
+# stays false until it is loaded and warmed up).
+MODEL_LOAD_IN_BACKGROUND = os.getenv("MODEL_LOAD_IN_BACKGROUND", "true").lower() == "true"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Per-request sampling profiles (pyinstrument) for requests sent with X-Profile: 1
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "false").lower() == "true"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+# --- NEW: the served (version, model) pair; swapped atomically by /admin/models ---
+serving = registry.ServingModel()
+
+# --- NEW: /predict memoization, keyed on the input and the serving model version ---
+prediction_cache = predict_cache.PredictionCache()
+
+# Startup progress, reported by the /health probes.
+startup_state = {
+    "started_at": time.time(),
+    "db_ready": False,
+    "model_loaded": False,
+    "model_load_seconds": None,
+    "error": None,
+}
+
+
+def load_and_warm_model():
+    """Loads the active registry version once and warms it up before marking it ready."""
+    try:
+        version = registry.ensure_active_version()
+        serving.activate(version, persist=False)
+    except FileNotFoundError as e:
+        startup_state["error"] = f"Model file not found: {e.filename}"
+        print(f"ERROR: {startup_state['error']}")
+        return
+    except Exception as e:
+        startup_state["error"] = f"Failed to load model. {e}"
+        print(f"ERROR: {startup_state['error']}")
+        return
+    startup_state["model_load_seconds"] = serving.status["seconds"]
+    startup_state["model_loaded"] = True
+
+
+def build_missing_derived_tables():
+    """Backfills the analytics rollups and the feature store on first start."""
+    db = SessionLocal()
+    try:
+        summaries.rebuild_if_missing(db=db)
+        features.rebuild_if_missing(db=db)
+    finally:
+        db.close()
 
-app = FastAPI()
 
-# Configure the Google client
-genai.configure(api_key=GOOGLE_API_KEY)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # --- ADDED: Create DB tables on startup ---
+    await run_in_threadpool(models.init_db, engine)
+    await run_in_threadpool(build_missing_derived_tables)
+    startup_state["db_ready"] = True
 
-client = instructor.from_provider(
-    "google/gemini-2.5-flash",
-    mode=instructor.Mode.GEMINI_JSON,
-)
+    if MODEL_LOAD_IN_BACKGROUND:
+        model_task = asyncio.create_task(run_in_threadpool(load_and_warm_model))
+    else:
+        model_task = None
+        await run_in_threadpool(load_and_warm_model)
+
+    start_prediction_workers()
+    start_predict_batcher()
+    try:
+        yield
+    finally:
+        await stop_predict_batcher()
+        stop_prediction_workers()
+        if model_task is not None:
+            await model_task
+
+
+app = FastAPI(lifespan=lifespan)
+
+# --- NEW: the async LLM client lives in llm.py (LLM_PROVIDER=stub for offline runs) ---
+REPORT_MODEL = llm.LLM_MODEL if llm.LLM_PROVIDER == "gemini" else llm.LLM_PROVIDER
 # Add CORS Middleware
 origins = [
     "http://localhost",
@@ -55,6 +121,46 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- NEW: Prometheus metrics (GET /metrics) ---
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "http_request_duration_seconds", "Request duration by route template",
+    labelnames=("method", "route", "status"),
+)
+BACKLOG_ROWS = metrics.REGISTRY.gauge("prediction_backlog_rows", "Stored rows without predictions")
+BACKLOG_ROWS_PER_SEC = metrics.REGISTRY.gauge(
+    "prediction_backlog_rows_per_sec", "Throughput of the current or last in-process backlog drain"
+)
+app.add_middleware(metrics.RequestMetricsMiddleware, histogram=HTTP_REQUEST_SECONDS)
+
+
+async def profile_request(request: Request, call_next):
+    """
+    Installed only with PROFILE_REQUESTS=true: a request sent with
+    X-Profile: 1 (and the admin token, if one is set) returns a
+    pyinstrument HTML profile instead of its normal response. Work done in the threadpool (sync endpoints)
+    shows up as time awaiting run_in_threadpool.
+    """
+    if request.headers.get("x-profile") != "1":
+        return await call_next(request)
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        return await call_next(request)
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        return JSONResponse(status_code=501, content={"detail": "pyinstrument is not installed."})
+
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    response = await call_next(request)
+    # Drain the body so streamed work is inside the profile too
+    async for _ in response.body_iterator:
+        pass
+    profiler.stop()
+    return HTMLResponse(profiler.output_html())
+
+if PROFILE_REQUESTS:
+    app.middleware("http")(profile_request)
+
 # --- ADDED: Database Dependency ---
 def get_db():
     db = SessionLocal()
@@ -65,25 +171,43 @@ def get_db():
 # --- END ADDED ---
 
 
-from schema import (
-    PredictionInput, SinglePrediction, PredictedCases, 
-    Location, ReportOutput, PredictionData
-)
+from schema import PredictionInput, ReportOutput, PredictionData
 
-MODEL_PATH = 'model/cholera_gb_pipeline.joblib'
-model = None
+# --- Prediction worker pool lifecycle ---
+def start_prediction_workers():
+    """Resumes jobs interrupted by a restart and starts the worker pool."""
+    if worker.PREDICTION_WORKER_MODE != "pool":
+        return
+    worker.recover_jobs()
+    # Seed the registry here (first boot only) so workers don't race to do it
+    try:
+        registry.ensure_active_version()
+    except Exception as e:
+        print(f"ERROR: No model version available for the worker pool. {e}")
+        return
+    worker.start_pool()
+    worker.dispatch_pending_jobs()
 
-try:
-    # Make sure imports above are done BEFORE this line
-    model = joblib.load(MODEL_PATH)
-    print(f"Model loaded successfully from {MODEL_PATH}")
-except FileNotFoundError:
-    print(f"ERROR: Model file not found at {MODEL_PATH}")
-except Exception as e:
-    print(f"ERROR: Failed to load model. {e}")
-    model = None
+def stop_prediction_workers():
+    worker.shutdown_pool()
 
 
+# --- Optional /predict micro-batcher (PREDICT_MICROBATCH=true) ---
+predict_batcher = None
+
+def start_predict_batcher():
+    global predict_batcher
+    if batcher.PREDICT_MICROBATCH:
+        # Each request passes the model it resolved, matching the version it caches under
+        predict_batcher = batcher.MicroBatcher(inference.predict_frame)
+        metrics.REGISTRY.register(predict_batcher.batch_size_hist)
+        metrics.REGISTRY.register(predict_batcher.queue_wait_hist)
+        predict_batcher.start()
+
+async def stop_predict_batcher():
+    if predict_batcher is not None:
+        await predict_batcher.stop()
+
 
 # --- NEW: Background Task for Processing ---
 def process_pending_predictions():
@@ -93,57 +217,26 @@ def process_pending_predictions():
     predicts them, and updates the DB.
     """
     print("Background processing started...")
-    if model is None:
+    loaded = serving.get()
+    if loaded is None:
         print("Model is not loaded. Cannot process background tasks.")
         return
-    db = SessionLocal()
     try:
-        # Get rows where projected_cholera is NULL
-        unpredicted_rows = crud.get_unpredicted_data(db=db)
-        if not unpredicted_rows:
+        # Drain the whole backlog in vectorized chunks, paging forward on id
+        stats = backlog.drain_backlog(model=loaded.model, model_version=loaded.version)
+        if stats is None:
+            return
+        if stats["rows"] == 0:
             print("No new data to predict.")
             return
 
-        print(f"Found {len(unpredicted_rows)} rows to process.")
-        
-        for row in unpredicted_rows:
-            # Convert the SQLAlchemy model row back to a dict, then to a DataFrame
-            # so the scikit-learn pipeline can understand it.
-            input_dict = {
-                "Region": row.Region,
-                "City": row.City,
-                "Year": row.Year,
-                "Month": row.Month,
-                "Rainfall_mm": row.Rainfall_mm,
-                "Temperature_celsius": row.Temperature_celsius,
-                "Sanitation_Index": row.Sanitation_Index,
-                "Water_Quality_Index": row.Water_Quality_Index,
-                "Population_Density": row.Population_Density,
-                "Waste_Management_Score": row.Waste_Management_Score,
-                "Cholera_Cases": row.Cholera_Cases,
-                "Typhoid_Cases": row.Typhoid_Cases,
-            }
-            input_df = pd.DataFrame([input_dict])
-            
-            # Make the prediction
-            prediction = model.predict(input_df)
-            proj_cholera = int(prediction[0][0])
-            proj_typhoid = int(prediction[0][1])
-            
-            # Update the row in the database
-            crud.update_data_predictions(
-                db=db, 
-                data_id=row.id, 
-                cholera=proj_cholera, 
-                typhoid=proj_typhoid
-            )
-        
-        print(f"Successfully processed {len(unpredicted_rows)} rows.")
+        print(
+            f"Successfully processed {stats['rows']} rows in {stats['chunks']} chunks "
+            f"in {stats['seconds']}s ({stats['rows_per_sec']} rows/sec)."
+        )
 
     except Exception as e:
         print(f"Error in background processing: {e}")
-    finally:
-        db.close()
 
 
 
@@ -155,41 +248,71 @@ async def upload_data_file(
     db: Session = Depends(get_db)
 ):
     """
-    This endpoint accepts a CSV or Excel file, stores its contents
+    This endpoint accepts a CSV, Excel, Parquet or Arrow IPC file, stores its contents
     in the database, and triggers a background task to run predictions.
     """
-    if not file.filename.endswith(('.csv', '.xlsx')):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a .csv or .xlsx file.")
+    if not file.filename.endswith(ingest.SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Please upload one of: {', '.join(ingest.SUPPORTED_EXTENSIONS)}.",
+        )
 
     try:
-        # Read the file into a pandas DataFrame
-        contents = await file.read()
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
-        else:
-            df = pd.read_excel(io.BytesIO(contents))
-            
-        # Optional: Add column validation here
-        expected_cols = set(PredictionInput.__annotations__.keys())
-        if not expected_cols.issubset(df.columns):
-            missing = expected_cols - set(df.columns)
+        # Stream the spooled upload into the database chunk by chunk;
+        # rows already stored with identical values are left untouched.
+        stats = await run_in_threadpool(
+            ingest.ingest_upload, db=db, filename=file.filename, fileobj=file.file
+        )
+        rows_added = stats["rows_written"]
+        print(
+            f"Ingested {stats['rows']} rows from {file.filename} in {stats['chunks']} chunks, "
+            f"{rows_added} new or changed, {stats['rows_rejected']} rejected "
+            f"({stats['rows_per_sec']} rows/sec)."
+        )
+        if stats["rows"] and stats["rows_rejected"] == stats["rows"]:
             raise HTTPException(
-                status_code=400, 
-                detail=f"File is missing required columns: {missing}"
+                status_code=400,
+                detail={"message": "Every row failed validation.", "errors": stats["errors"]},
             )
 
-        # Insert all data into the database
-        rows_added = crud.bulk_insert_data_from_dataframe(db=db, df=df)
-        
-        # Add the prediction task to the background
-        background_tasks.add_task(process_pending_predictions)
-
-        return {
+        result = {
             "message": f"Successfully uploaded {file.filename}",
             "rows_added": rows_added,
-            "detail": "Prediction processing has started in the background."
+            "rows_unchanged": stats["rows"] - stats["rows_rejected"] - rows_added,
+            # Invalid rows are skipped, not fatal; errors lists them by 1-based data row
+            "rows_rejected": stats["rows_rejected"],
+            "errors": stats["errors"],
+            "ingest_rows_per_sec": stats["rows_per_sec"],
+        }
+        if not stats["touched_ids"]:
+            # Every row was already stored unchanged: no jobs, nothing to poll
+            return {**result, "status": "nothing_to_predict", "upload_id": None, "jobs": 0,
+                    "detail": "No new or changed rows; existing predictions are current."}
+
+        # Queue durable prediction jobs for the new/changed rows; the worker
+        # pool (in this process or `python worker.py`) picks them up.
+        upload_id = uuid.uuid4().hex
+        jobs = crud.create_prediction_jobs(
+            db=db,
+            upload_id=upload_id,
+            ids=stats["touched_ids"],
+            shard_size=worker.JOB_SHARD_SIZE,
+        )
+        if worker.PREDICTION_WORKER_MODE == "pool":
+            background_tasks.add_task(worker.dispatch_pending_jobs)
+
+        return {
+            **result,
+            "status": "queued",
+            "upload_id": upload_id,
+            "jobs": len(jobs),
+            "detail": f"Prediction processing has been queued. Poll /jobs/{upload_id} for progress."
         }
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid file contents: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 # --- END NEW ---
@@ -197,12 +320,184 @@ async def upload_data_file(
 
 
 @app.get("/get-all-predictions/", response_model=List[PredictionData])
-def get_all_predictions(db: Session = Depends(get_db)):
+def get_all_predictions(
+    response: Response,
+    filters: schema.PredictionFilters = Depends(),
+    after_id: int = Query(0, ge=0, description="Cursor: the last id of the previous page"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """
+    Retrieves records (including predictions) one page at a time, in id
+    order. When more rows may follow, the X-Next-Cursor header carries
+    the after_id for the next page.
+    """
+    rows = crud.get_prediction_page(db=db, filters=filters, after_id=after_id, limit=limit)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return rows
+
+
+@app.get("/get-all-predictions/export")
+def export_all_predictions(
+    filters: schema.PredictionFilters = Depends(),
+    format: Literal["ndjson", "csv", "parquet"] = "ndjson",
+):
+    """Streams every matching record as NDJSON, CSV or Parquet from a server-side cursor."""
+    return StreamingResponse(
+        export.stream_predictions(filters, fmt=format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=predictions.{format}"},
+    )
+
+
+
+@app.get("/jobs/{upload_id}", response_model=schema.UploadJobStatus)
+def get_upload_jobs(upload_id: str, db: Session = Depends(get_db)):
+    """
+    Reports the prediction jobs queued for one upload, with an overall
+    status: failed if any shard failed, done when all shards are done.
+    """
+    jobs = crud.get_jobs_for_upload(db=db, upload_id=upload_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail=f"No jobs found for upload {upload_id}.")
+
+    statuses = {job.status for job in jobs}
+    if "failed" in statuses:
+        status = "failed"
+    elif statuses == {"done"}:
+        status = "done"
+    elif "running" in statuses or "done" in statuses:
+        status = "running"
+    else:
+        status = "pending"
+
+    return {
+        "upload_id": upload_id,
+        "status": status,
+        "rows_done": sum(job.rows_done or 0 for job in jobs),
+        "jobs": jobs,
+    }
+
+
+
+@app.get("/backlog/status")
+def get_backlog_status(db: Session = Depends(get_db)):
+    """
+    Reports the prediction backlog: rows pending, rows done in the
+    current/last drain, throughput and estimated time to empty.
     """
-    Retrieves all records from the database, including predictions.
+    return backlog.get_backlog_status(db=db)
+
+
+
+# --- NEW: Analytics from the materialized summary tables ---
+@app.get("/analytics/date-range", response_model=schema.DateRange)
+def get_processed_date_range(region: Optional[str] = None, db: Session = Depends(get_db)):
+    """Earliest and latest processed period, nationally or for one region."""
+    date_range = summaries.get_date_range(db=db, region=region)
+    if date_range is None:
+        raise HTTPException(status_code=404, detail="No processed prediction data found.")
+    return date_range
+
+
+@app.get("/analytics/trends", response_model=List[schema.PeriodTrend])
+def get_trends(region: Optional[str] = None, db: Session = Depends(get_db)):
+    """Monthly totals (current vs projected) and risk-bucket counts."""
+    return summaries.get_trends(db=db, region=region)
+
+
+@app.get("/analytics/districts", response_model=List[schema.DistrictSummary])
+def get_district_summaries(
+    region: Optional[str] = None,
+    risk: Optional[Literal["Low", "Medium", "Severe"]] = None,
+    db: Session = Depends(get_db),
+):
+    """Per-district rollups; risk filters on either disease's latest risk level."""
+    return summaries.get_districts(db=db, region=region, risk=risk)
+
+
+
+# --- NEW: Feature store lookup ---
+@app.get("/features/{city}/{year}/{month}", response_model=schema.DistrictFeatures)
+def get_district_features(city: str, year: int, month: int, db: Session = Depends(get_db)):
+    """Lag and rolling-window features of one district-month (primary-key lookup)."""
+    row = features.get_features(db=db, city=city, year=year, month=month)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No features stored for {city} {month}/{year}.")
+    return row
+
+
+
+# --- NEW: Model registry admin ---
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin routes need X-Admin-Token when ADMIN_TOKEN is set."""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+def activate_model_version(version: str):
+    """Background task: load + warm up off the request path, then swap."""
+    try:
+        serving.activate(version)
+    except Exception as e:
+        print(f"Failed to activate model version {version}: {e}")
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+def list_model_versions(db: Session = Depends(get_db)):
+    """Registered versions, the active/serving one and how many rows each version scored."""
+    return {
+        "active": registry.get_active_version(),
+        "serving": serving.status,
+        "versions": registry.list_versions(),
+        "rows_by_version": crud.count_rows_by_model_version(db=db),
+    }
+
+
+@app.post("/admin/models/{version}/activate", status_code=202, dependencies=[Depends(require_admin)])
+def activate_model(version: str, background_tasks: BackgroundTasks):
+    """
+    Loads a registered version in the background and swaps it in once it
+    is warmed up; /predict keeps using the current model until then.
     """
-    data = db.query(models.PredictionData).all()
-    return data
+    try:
+        registry.get_metadata(version)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    background_tasks.add_task(activate_model_version, version)
+    return {
+        "status": "loading",
+        "version": version,
+        "detail": "Poll /admin/models for the swap status.",
+    }
+
+
+@app.post("/admin/models/backfill", dependencies=[Depends(require_admin)])
+def backfill_stale_predictions(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Queues prediction jobs for every row scored by a model version other
+    than the one being served.
+    """
+    loaded = _require_model()
+    ids = crud.reset_stale_predictions(db=db, model_version=loaded.version)
+    if not ids:
+        return {"model_version": loaded.version, "rows": 0, "status": "nothing_to_predict",
+                "upload_id": None, "jobs": 0, "detail": "Every row is scored by the served version."}
+    backfill_id = uuid.uuid4().hex
+    jobs = crud.create_prediction_jobs(
+        db=db, upload_id=backfill_id, ids=ids, shard_size=worker.JOB_SHARD_SIZE
+    )
+    if worker.PREDICTION_WORKER_MODE == "pool":
+        background_tasks.add_task(worker.dispatch_pending_jobs)
+    return {
+        "model_version": loaded.version,
+        "rows": len(ids),
+        "status": "queued",
+        "upload_id": backfill_id,
+        "jobs": len(jobs),
+        "detail": f"Poll /jobs/{backfill_id} for progress.",
+    }
 
 
 
@@ -210,33 +505,113 @@ def get_all_predictions(db: Session = Depends(get_db)):
 def read_root():
     return {"message": "Welcome to the Disease Outbreak Prediction API"}
 
-@app.post("/predict")
-def predict_disease_outbreak(input_data: PredictionInput):
-    if model is None:
+
+@app.get("/metrics")
+def get_metrics(db: Session = Depends(get_db)):
+    """Every metric of this process in the Prometheus text format."""
+    status = backlog.get_backlog_status(db=db)
+    BACKLOG_ROWS.set(status["rows_pending"])
+    BACKLOG_ROWS_PER_SEC.set(status["rows_per_sec"] or 0)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# --- NEW: Liveness / readiness probes ---
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving requests."""
+    return {"status": "alive", "uptime_seconds": round(time.time() - startup_state["started_at"], 1)}
+
+@app.get("/health/ready")
+def readiness():
+    """503 until the database is initialised and the model is loaded and warmed up."""
+    ready = startup_state["db_ready"] and startup_state["model_loaded"]
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", **startup_state, "model": serving.status},
+    )
+
+
+def _require_model():
+    """The serving (version, model) pair, or 503/500 while it is unavailable."""
+    loaded = serving.get()
+    if loaded is None:
+        if startup_state["error"] is None:
+            raise HTTPException(status_code=503, detail="Model is still loading.")
         raise HTTPException(status_code=500, detail="Model is not loaded properly.")
+    return loaded
+
+
+@app.post("/predict")
+async def predict_disease_outbreak(input_data: PredictionInput, response: Response):
+    loaded = _require_model()
     
-    # Convert input data to DataFrame
     input_dict = input_data.dict()
-    input_df = pd.DataFrame([input_dict])
-    
-    # Make prediction
-    prediction = model.predict(input_df)
+
+    # Repeated inputs are answered from the cache for the same model version.
+    # Models using feature-store columns also depend on stored history,
+    # which changes with every ingest, so they bypass it.
+    use_cache = not inference.store_features(loaded.model)
+    cached = prediction_cache.get(input_dict, loaded.version) if use_cache else None
+    response.headers["X-Predict-Cache"] = ("hit" if cached is not None else "miss") if use_cache else "bypass"
+    if cached is not None:
+        return {"prediction": cached}
+
+    # Opt-in: share one vectorized predict with concurrent requests
+    if predict_batcher is not None:
+        row = await predict_batcher.submit(input_dict, loaded.model)
+    else:
+        # Make prediction (off the event loop)
+        row = (await run_in_threadpool(inference.predict_records, loaded.model, [input_dict]))[0]
+    prediction = [int(row[0]), int(row[1])]
+    if use_cache:
+        prediction_cache.put(input_dict, loaded.version, prediction)
     
     # Return the prediction result
-    return {"prediction": [int(prediction[0][0]), int(prediction[0][1])]}
+    return {"prediction": prediction}
 
 
-# ... all your imports and app setup ...
-# Make sure 'os' and 'pandas' are imported at the top
-import os 
-import pandas as pd
+@app.post("/predict/batch")
+async def predict_disease_outbreak_batch(request: Request):
+    """
+    Scores many PredictionInput records in one call. The body is a JSON
+    array or NDJSON, or columnar data sent as Arrow IPC or Parquet (by
+    Content-Type, see batch_predict.COLUMNAR_MEDIA_TYPES); results stream
+    back as NDJSON lines
+    ({"index": i, "prediction": [cholera, typhoid]} or {"index": i, "errors": [...]})
+    as each chunk finishes.
+    """
+    loaded = _require_model()
+
+    body = await batch_predict.spool_request_body(request.stream())
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type in batch_predict.COLUMNAR_MEDIA_TYPES:
+        results = batch_predict.stream_frame_predictions(
+            loaded.model, batch_predict.iter_columnar_frames(media_type, body)
+        )
+    else:
+        records = batch_predict.iter_json_records(batch_predict.iter_file_chunks(body))
+        results = batch_predict.stream_predictions(loaded.model, records)
+    return StreamingResponse(results, media_type="application/x-ndjson")
+
+
+@app.get("/predict/cache/stats")
+def get_predict_cache_stats():
+    """Hit/miss/eviction counters of the /predict memoization cache."""
+    return prediction_cache.stats()
+
+
+@app.get("/predict/batcher/stats")
+def get_predict_batcher_stats():
+    """Batch-size and queue-wait histograms for tuning the micro-batch window."""
+    if predict_batcher is None:
+        return {"enabled": False}
+    return predict_batcher.stats()
 
-# ... all your other code ...
-# ... model loading, background tasks, other endpoints ...
 
 
 @app.post("/generate-comprehensive-report", response_model=ReportOutput)
 async def create_comprehensive_report(
+    response: Response,
     db: Session = Depends(get_db)
 ) -> ReportOutput:
     """
@@ -247,6 +622,23 @@ async def create_comprehensive_report(
     and report on a default 'test.csv' file.
     """
     
+    # --- NEW: DB, CSV and model work runs in the thread pool, off the event loop ---
+    await run_in_threadpool(_load_default_data_if_empty, db)
+
+    # --- Step 0: Serve a cached report if the processed data is unchanged ---
+    cache_key, cached = await run_in_threadpool(_cached_report, db)
+    if cached is not None:
+        response.headers["X-Report-Cache"] = "hit"
+        return ReportOutput.model_validate_json(cached)
+    response.headers["X-Report-Cache"] = "miss"
+
+    # --- NEW: cap concurrent report generations; cache hits skip the queue ---
+    async with llm.report_slot():
+        return await _generate_report(response=response, db=db, cache_key=cache_key)
+
+
+def _load_default_data_if_empty(db: Session):
+    """Loads and scores test.csv when the database is completely empty (blocking)."""
     # Define the path to your default file
     DEFAULT_CSV_PATH = "test.csv" 
     
@@ -286,11 +678,58 @@ async def create_comprehensive_report(
         )
     # --- END OF NEW LOGIC ---
 
-    # --- Step 1: Fetch all processed data (Original Logic) ---
-    # This part now runs *after* the empty-DB check.
-    processed_data, date_range = crud.get_all_processed_data_with_range(db=db)
-    
-    if not processed_data:
+
+def _cached_report(db: Session):
+    """(cache_key, cached report JSON or None) for the current processed data (blocking)."""
+    cache_key = reporting.report_cache_key(crud.get_processed_fingerprint(db=db), REPORT_MODEL)
+    cached = crud.get_cached_report(
+        db=db, key=cache_key, ttl_seconds=reporting.REPORT_CACHE_TTL_SECONDS
+    )
+    return cache_key, cached
+
+
+def _prepare_report_data(db: Session):
+    """Blocking DataFrame work for the report, run in the thread pool."""
+    processed_df = reporting.load_processed_frame(db=db)
+    if processed_df.empty:
+        return None
+
+    # Changes, risk levels and rankings are computed here, deterministically;
+    # only the compact summary goes to the model.
+    risk_df = reporting.add_risk_columns(processed_df)
+    data_summary, _ = reporting.build_data_summary(risk_df)
+
+    started = time.perf_counter()
+    regional_data = reporting.build_regional_data(risk_df)
+    print(
+        f"Computed regional_data for {len(regional_data)} entries "
+        f"in {(time.perf_counter() - started) * 1000:.1f} ms."
+    )
+
+    prompt_tokens = reporting.estimate_tokens(data_summary)
+    legacy_tokens = reporting.legacy_prompt_tokens(processed_df)
+    print(
+        f"Report prompt data: ~{prompt_tokens} tokens for {len(processed_df)} rows "
+        f"(per-row dump would be ~{legacy_tokens} tokens, "
+        f"{100 - 100 * prompt_tokens / max(legacy_tokens, 1):.0f}% smaller)."
+    )
+
+    # Map-reduce: one summary per region group when the full summary
+    # would have to be trimmed to fit the token budget.
+    chunk_summaries = []
+    if reporting.needs_map_reduce(risk_df):
+        chunk_summaries = [
+            reporting.build_data_summary(reporting.add_risk_columns(chunk))[0]
+            for chunk in reporting.split_by_region(processed_df)
+        ]
+    return risk_df, data_summary, regional_data, chunk_summaries
+
+
+async def _generate_report(response: Response, db: Session, cache_key: str) -> ReportOutput:
+    # --- Step 1: Fetch all processed data and pre-aggregate it ---
+    prepared = await run_in_threadpool(_prepare_report_data, db)
+
+    if prepared is None:
         # This will now catch:
         # 1. DB had data, but none was processed.
         # 2. DB was empty, default data was loaded, but processing failed.
@@ -298,10 +737,11 @@ async def create_comprehensive_report(
             status_code=404, 
             detail="No processed prediction data found in the database."
         )
+    risk_df, data_summary, regional_data, chunk_summaries = prepared
 
     # --- Step 2: Prepare prompt variables ---
-    # (The rest of your function remains exactly the same)
     now_utc = datetime.now(timezone.utc)
+    date_range = reporting.date_range_of(risk_df)
     
     # Create a dynamic reporting_period string
     try:
@@ -318,85 +758,108 @@ async def create_comprehensive_report(
         reporting_period = "All Available Data" # Fallback
 
     # --- Step 3: Create the System Prompt (Modified) ---
+    # Per-district figures (change %, risk levels) are computed locally;
+    # the model only writes the narrative.
     system_prompt = f"""
     You are an expert Public Health Analyst for the Ghana Health Service,
     tasked with writing a *comprehensive executive summary* for the Ministry.
     
-    Your job is to take a list of raw data from multiple districts *and*
-    *multiple time periods* and generate a complete, structured report
-    according to the 'ReportOutput' schema.
-
-    You must perform the following actions:
-    1.  **POPULATE 'regional_data' LIST**: For *each* data entry in the
-        provided data, you must create a 'RegionalData' object.
-        -   The 'location' object must include the specific region and district.
-        -   You must calculate 'projected_change_percent' and 'risk_level'.
-        -   Write a 1-2 sentence 'key_factors_summary' highlighting the
-            main drivers for that specific district *at that specific time*.
-    
-    2.  **RISK LEVEL RULES**:
+    Your job is to take a pre-aggregated summary of data from multiple
+    districts *and* *multiple time periods* and write the narrative parts
+    of the report according to the 'ReportNarrative' schema. All
+    projections, change percentages and risk levels are already calculated.
+
+    Risk levels in the data follow these rules:
         -   > 50% increase = "Severe"
         -   20-50% increase = "Medium"
         -   < 20% increase = "Low"
-    
-    3.  **CALCULATION RULES**:
-        -   change = ((new - old) / old) * 100
-        -   If old is 0, a 'new' > 0 is a 100% increase.
         
-    4.  **WRITE SUMMARIES (CRITICAL)**: After analyzing all data, write:
-        -   'description': An executive summary (3-4 sentences) for the
-            *entire reporting period* ({reporting_period}), identifying
-            overall trends, seasonal patterns, and persistent high-risk zones.
-        -   'call_to_action': A prioritized list (2-3 items) of *strategic,
-            long-term actions* for the *regional* directorate based on the
-            total data.
-
-    You must return a valid JSON object matching the 'ReportOutput' structure.
+    You must write:
+    1.  'description': An executive summary (3-4 sentences) for the
+        *entire reporting period* ({reporting_period}), identifying
+        overall trends, seasonal patterns, and persistent high-risk zones.
+    2.  'call_to_action': A prioritized list (2-3 items) of *strategic,
+        long-term actions* for the *regional* directorate based on the
+        total data.
+    3.  Optionally 'key_factors': for districts listed under
+        'HIGHEST-RISK DISTRICTS', a 1-2 sentence 'key_factors_summary'
+        of the main drivers for that district *at that period* (give the
+        region, district, year and month exactly as listed).
+
+    You must return a valid JSON object matching the 'ReportNarrative' structure.
     """
 
-    # --- Step 4: Create the User Prompt (Data Dump) ---
-    # We must include the Year/Month for each entry so the AI can see trends
-    data_dump = ""
-    for row in processed_data:
-        data_dump += (
-            f"\n--- District Data Entry (Period: {row.Month}/{row.Year}) ---\n"
-            f"Region: {row.Region}\n"
-            f"District: {row.City}\n"
-            f"Current Cases (Cholera/Typhoid): {row.Cholera_Cases} / {row.Typhoid_Cases}\n"
-            f"Projected Cases (Cholera/Typhoid): {row.projected_cholera} / {row.projected_typhoid}\n"
-            f"Key Factors:\n"
-            f"  - Rainfall: {row.Rainfall_mm} mm\n"
-            f"  - Sanitation Index (0-1): {row.Sanitation_Index}\n"
-            f"  - Water Quality Index (0-1): {row.Water_Quality_Index}\n"
-            f"  - Population Density: {row.Population_Density} per km²\n"
-            f"  - Waste Management Score (0-1): {row.Waste_Management_Score}\n"
-        )
-
-    user_prompt = f"""
+    # --- Step 4: Create the User Prompt (Aggregated Summary) ---
+    def user_prompt_for(summary: str, scope: str = "the entire reporting period") -> str:
+        return f"""
     Please generate a full, comprehensive public health report based on the
-    following data entries for the entire reporting period: {reporting_period}.
+    following summary for {scope}: {reporting_period}.
 
     Report Generation Date: {now_utc.isoformat()}
     
-    {data_dump}
+    {summary}
     """
 
-    # --- Step 5: Call the AI (Unchanged) ---
-    try:
-        report = client.create(
-            response_model=ReportOutput,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            max_retries=2,
+    def reduce_prompt(partials) -> str:
+        parts = "\n\n".join(
+            f"PART {i}\nDescription: {p.description}\nActions: {p.call_to_action}"
+            for i, p in enumerate(partials, 1)
         )
-        
-        return report
-        
+        return user_prompt_for(
+            f"{data_summary}\n\nREGIONAL GROUP SUMMARIES\n{parts}\n\n"
+            "Combine these into one national description and call to action."
+        )
+
+    # --- Step 5: Call the AI for the narrative only ---
+    try:
+        if chunk_summaries:
+            print(f"Report data over token budget; map-reducing over {len(chunk_summaries)} region groups.")
+            narrative = await llm.map_reduce_narrative(
+                system_prompt,
+                [user_prompt_for(summary, "a group of regions over the period") for summary in chunk_summaries],
+                reduce_prompt,
+            )
+        else:
+            narrative = await llm.create(
+                schema.ReportNarrative, system_prompt, user_prompt_for(data_summary)
+            )
+        narrative_source = "llm"
+
     except Exception as e:
-        print(f"AI Error: {e}") 
-        raise HTTPException(
-            status_code=500, 
-            detail=f"AI report generation failed: {str(e)}"
-        )
\ No newline at end of file
+        print(f"AI Error: {type(e).__name__}: {e}")
+        if not llm.LLM_FALLBACK:
+            raise HTTPException(
+                status_code=500, 
+                detail=f"AI report generation failed: {str(e)}"
+            )
+        description, call_to_action = reporting.fallback_narrative(risk_df)
+        narrative = schema.ReportNarrative(description=description, call_to_action=call_to_action)
+        narrative_source = "fallback"
+    response.headers["X-Report-Narrative"] = narrative_source
+
+    # --- Step 6: Assemble the report ---
+    if narrative.key_factors:
+        key_factors = {
+            (k.region, k.district, k.year, k.month): k.key_factors_summary
+            for k in narrative.key_factors
+        }
+        regional_data = reporting.build_regional_data(risk_df, key_factors=key_factors)
+
+    report = ReportOutput(
+        date_generated=now_utc.isoformat(),
+        reporting_period=reporting_period,
+        regional_data=regional_data,
+        description=narrative.description,
+        call_to_action=narrative.call_to_action,
+    )
+    # Fallback narratives are not cached, so the next request retries the LLM.
+    if narrative_source == "llm":
+        await run_in_threadpool(
+            crud.save_cached_report,
+            db=db,
+            key=cache_key,
+            report_json=report.model_dump_json(),
+            ttl_seconds=reporting.REPORT_CACHE_TTL_SECONDS,
+            max_entries=reporting.REPORT_CACHE_MAX_ENTRIES,
+        )
+    return report
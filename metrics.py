@@ -0,0 +1,239 @@
+# metrics.py
+"""
+In-process metrics with Prometheus text exposition.
+
+Modules declare their metrics on REGISTRY (histograms, counters,
+gauges, optionally with labels) and observe them where the work
+happens; GET /metrics renders everything in the Prometheus text format.
+Values are per process: prediction worker pool processes keep their
+own and are not included.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a sub-millisecond query up to a slow LLM call
+DEFAULT_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram (cumulative counts per upper bound, plus
+    count and sum), safe to observe from several threads.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, buckets=DEFAULT_BUCKETS, help: str = ""):
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Observes the wall time of the with-block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {
+            "name": self.name,
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else None,
+            "buckets": cumulative,
+        }
+
+    def samples(self):
+        """(suffix, extra labels, value) triples for exposition."""
+        snapshot = self.snapshot()
+        for bound, count in snapshot["buckets"].items():
+            yield "_bucket", {"le": bound}, count
+        yield "_sum", {}, snapshot["sum"]
+        yield "_count", {}, snapshot["count"]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def samples(self):
+        yield "_total", {}, self._value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def samples(self):
+        yield "", {}, self._value
+
+
+class Family:
+    """A metric with labels: one child metric per distinct label-value tuple."""
+
+    def __init__(self, factory, name: str, help: str, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = factory(name).kind
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory(self.name))
+        return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in child.samples():
+                yield suffix, {**dict(zip(self.labelnames, values)), **extra}, value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Adds metric (replacing one of the same name) and returns it."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS, labelnames=()):
+        if labelnames:
+            return self.register(Family(lambda n: Histogram(n, buckets, help), name, help, labelnames))
+        return self.register(Histogram(name, buckets, help))
+
+    def counter(self, name: str, help: str = "", labelnames=()):
+        if labelnames:
+            return self.register(Family(lambda n: Counter(n, help), name, help, labelnames))
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str = "", labelnames=()):
+        if labelnames:
+            return self.register(Family(lambda n: Gauge(n, help), name, help, labelnames))
+        return self.register(Gauge(name, help))
+
+    def render(self) -> str:
+        """Every registered metric in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+                name = f"{metric.name}{suffix}"
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware observing each HTTP request's duration (through the
+    last body chunk) into histogram, labelled by method, route template
+    and status code.
+    """
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started, status = time.perf_counter(), 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The matched route's template (set by the router) keeps label cardinality bounded
+            route = scope.get("route")
+            self.histogram.labels(
+                scope["method"], route.path if route is not None else "<unmatched>", status
+            ).observe(time.perf_counter() - started)
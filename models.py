@@ -1,8 +1,18 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index, Text, inspect, text
 from sqlalchemy.sql import func
 from database import Base
 
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+# One row per district and month; re-uploads update it in place.
+NATURAL_KEY = ["Region", "City", "Year", "Month"]
+NATURAL_KEY_INDEX = "ux_prediction_data_natural_key"
+
 class PredictionData(Base):
     __tablename__ = "prediction_data"
 
@@ -25,5 +35,263 @@ class PredictionData(Base):
     # New fields to store the prediction results
     projected_cholera = Column(Integer, nullable=True)
     projected_typhoid = Column(Integer, nullable=True)
+    # Registry version of the model that produced the projections
+    model_version = Column(String, nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Microsecond resolution (Python-side) so report fingerprints see every write
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        # Partial index so the backlog worker finds pending rows without
+        # scanning the (ever-growing) set of already-predicted ones.
+        Index(
+            "ix_prediction_data_pending",
+            "id",
+            sqlite_where=text("projected_cholera IS NULL"),
+            postgresql_where=text("projected_cholera IS NULL"),
+        ),
+        Index(NATURAL_KEY_INDEX, *NATURAL_KEY, unique=True),
+        # Period-range filters that don't pin a Region/City
+        Index("ix_prediction_data_period", "Year", "Month"),
+        # Backfills after a model swap look up rows by the version that scored them
+        Index("ix_prediction_data_model_version", "model_version"),
+    )
+
+
+class PredictionJob(Base):
+    """A durable unit of background prediction work: one id range of one upload."""
+    __tablename__ = "prediction_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upload_id = Column(String, index=True)
+    status = Column(String, index=True, default="pending")  # pending / running / done / failed
+    start_id = Column(Integer)
+    end_id = Column(Integer)
+    attempts = Column(Integer, default=0)
+    rows_done = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    # The process running the job and how long its claim holds; the owner
+    # renews the lease while it works, so only an expired lease means the
+    # owner died.
+    owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class ReportCache(Base):
+    """Generated reports keyed on a fingerprint of the processed data."""
+    __tablename__ = "report_cache"
+
+    key = Column(String, primary_key=True)
+    report_json = Column(Text)
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), default=utcnow, index=True)
+    last_accessed = Column(DateTime(timezone=True), default=utcnow, index=True)
+
+
+class DistrictSummary(Base):
+    """
+    Per-district rollup of processed rows (maintained by summaries.py
+    whenever predictions are written or cleared).
+    """
+    __tablename__ = "district_summary"
+
+    Region = Column(String, primary_key=True)
+    City = Column(String, primary_key=True)
+    periods = Column(Integer)
+    first_year = Column(Integer)
+    first_month = Column(Integer)
+    last_year = Column(Integer)
+    last_month = Column(Integer)
+    cholera_cases = Column(Integer)
+    projected_cholera = Column(Integer)
+    typhoid_cases = Column(Integer)
+    projected_typhoid = Column(Integer)
+    severe_periods = Column(Integer)
+    # Latest period's projections and risk buckets
+    latest_projected_cholera = Column(Integer)
+    latest_projected_typhoid = Column(Integer)
+    latest_cholera_risk = Column(String)
+    latest_typhoid_risk = Column(String)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+
+class RegionPeriodSummary(Base):
+    """Per-region, per-month totals and risk-bucket counts of processed rows."""
+    __tablename__ = "region_period_summary"
+
+    Region = Column(String, primary_key=True)
+    Year = Column(Integer, primary_key=True)
+    Month = Column(Integer, primary_key=True)
+    districts = Column(Integer)
+    cholera_cases = Column(Integer)
+    projected_cholera = Column(Integer)
+    typhoid_cases = Column(Integer)
+    projected_typhoid = Column(Integer)
+    cholera_severe = Column(Integer)
+    cholera_medium = Column(Integer)
+    cholera_low = Column(Integer)
+    typhoid_severe = Column(Integer)
+    typhoid_medium = Column(Integer)
+    typhoid_low = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        Index("ix_region_period_summary_period", "Year", "Month"),
+    )
+
+
+class DistrictFeatures(Base):
+    """
+    Lag and rolling-window features per city and month (features.py),
+    recomputed incrementally on ingest.
+    """
+    __tablename__ = "district_features"
+
+    City = Column(String, primary_key=True)
+    Year = Column(Integer, primary_key=True)
+    Month = Column(Integer, primary_key=True)
+    cholera_lag1 = Column(Float, nullable=True)
+    cholera_lag3 = Column(Float, nullable=True)
+    typhoid_lag1 = Column(Float, nullable=True)
+    typhoid_lag3 = Column(Float, nullable=True)
+    rainfall_roll3 = Column(Float, nullable=True)
+    rainfall_roll6 = Column(Float, nullable=True)
+    sanitation_roll3 = Column(Float, nullable=True)
+    sanitation_roll6 = Column(Float, nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+
+# Set by init_db: duplicate natural-key rows blocking the unique index
+# (and so upserts) until `python models.py dedupe` is run.
+pending_duplicates = 0
+
+
+def init_db(bind):
+    """
+    Creates missing tables, then any columns and indexes missing from
+    existing tables (create_all only emits them together with a new table).
+    The natural-key unique index is skipped, with a warning, while
+    duplicate rows exist; nothing is deleted here.
+    """
+    global pending_duplicates
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(bind)
+    pending_duplicates = _count_duplicate_rows(bind)
+    if pending_duplicates:
+        print(
+            f"WARNING: prediction_data holds {pending_duplicates} duplicate rows of the same "
+            f"(Region, City, Year, Month); uploads are disabled until they are removed. "
+            f"Run `python models.py dedupe --dry-run` to review them, then `python models.py dedupe`."
+        )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == NATURAL_KEY_INDEX and pending_duplicates:
+                continue
+            index.create(bind=bind, checkfirst=True)
+
+
+def _duplicate_rows_query() -> str:
+    """
+    Rows an upsert would have replaced: every row of a repeated natural
+    key except the newest (highest id). Rows with a NULL key column never
+    conflict in the unique index and are left alone.
+    """
+    key = ", ".join(f'"{col}"' for col in NATURAL_KEY)
+    not_null = " AND ".join(f'"{col}" IS NOT NULL' for col in NATURAL_KEY)
+    return (
+        f"SELECT * FROM prediction_data WHERE {not_null} AND id NOT IN "
+        f"(SELECT MAX(id) FROM prediction_data WHERE {not_null} GROUP BY {key})"
+    )
+
+
+def _count_duplicate_rows(bind) -> int:
+    existing = {index["name"] for index in inspect(bind).get_indexes("prediction_data")}
+    if NATURAL_KEY_INDEX in existing:
+        return 0
+    with bind.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM ({_duplicate_rows_query()}) AS duplicates")).scalar()
+
+
+def recount_duplicates(bind) -> int:
+    """Re-checks pending_duplicates, e.g. after a dedupe run by another process."""
+    global pending_duplicates
+    pending_duplicates = _count_duplicate_rows(bind)
+    return pending_duplicates
+
+
+def dedupe_natural_key(bind, backup_path: str = None, dry_run: bool = False):
+    """
+    Explicit migration for databases created before the natural-key
+    unique index: writes the duplicate rows (all but the newest of each
+    key) to backup_path as CSV, deletes them, rebuilds the analytics
+    summaries and the feature store from the remaining rows in the same
+    transaction, and builds the index. Returns the duplicate rows as a
+    DataFrame.
+    """
+    global pending_duplicates
+    import pandas as pd
+    from sqlalchemy.orm import Session
+
+    import features, summaries  # both import this module
+
+    with bind.connect() as conn:
+        duplicates = pd.read_sql_query(text(_duplicate_rows_query()), conn)
+    if dry_run or duplicates.empty:
+        return duplicates
+
+    backup_path = backup_path or f"prediction_data_duplicates_{utcnow():%Y%m%d%H%M%S}.csv"
+    duplicates.to_csv(backup_path, index=False)
+    ids = ", ".join(str(int(i)) for i in duplicates["id"])
+    with Session(bind=bind) as db:
+        db.execute(text(f"DELETE FROM prediction_data WHERE id IN ({ids})"))
+        # Both were built from every row, duplicates included
+        summaries.refresh(db, commit=False)
+        features.rebuild(db)  # commits the whole migration
+    print(f"Backed up {len(duplicates)} duplicate rows to {backup_path} and removed them; "
+          f"rebuilt the analytics summaries and feature store.")
+    for index in PredictionData.__table__.indexes:
+        if index.name == NATURAL_KEY_INDEX:
+            index.create(bind=bind, checkfirst=True)
+    pending_duplicates = 0
+    return duplicates
+
+
+def _add_missing_columns(bind):
+    """
+    Adds columns introduced after a table was created (nullable, without
+    server defaults, which SQLite's ADD COLUMN cannot take).
+    """
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+            print(f"Added column {table.name}.{column.name}.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Database maintenance.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dedupe = commands.add_parser("dedupe", help="remove duplicate natural-key rows and add the unique index")
+    dedupe.add_argument("--backup", help="CSV file for the removed rows")
+    dedupe.add_argument("--dry-run", action="store_true", help="only list the rows that would be removed")
+    args = parser.parse_args()
+
+    init_db(engine)
+    removed = dedupe_natural_key(engine, backup_path=args.backup, dry_run=args.dry_run)
+    if args.dry_run:
+        print(removed.to_string(index=False) if len(removed) else "No duplicate rows.")
+    elif removed.empty:
+        print("No duplicate rows.")
@@ -0,0 +1,176 @@
+# predict_cache.py
+"""
+Memoization for /predict.
+
+Dashboards send the same PredictionInput over and over; each repeat
+used to re-run the full pipeline. Results are cached under a SHA-256 of
+the canonical input (schema column order, numbers as floats) plus the
+model version, in a bounded in-process LRU.
+
+With PREDICT_CACHE_BACKEND=sqlite, misses fall through to a shared
+SQLite file (PREDICT_CACHE_PATH) so several API processes share results.
+
+A different model version clears the cache on first use, so a swapped
+model never serves predictions from the old one. Models trained on
+feature-store columns are not cached (/predict bypasses it): their
+output also depends on stored history, which every ingest changes.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import crud
+
+PREDICT_CACHE_SIZE = int(os.getenv("PREDICT_CACHE_SIZE", "10000"))  # 0 disables the cache
+PREDICT_CACHE_BACKEND = os.getenv("PREDICT_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+PREDICT_CACHE_PATH = os.getenv("PREDICT_CACHE_PATH", "predict_cache.db")
+PREDICT_CACHE_DISK_MAX_ROWS = int(os.getenv("PREDICT_CACHE_DISK_MAX_ROWS", "200000"))
+
+
+def canonical_key(record: dict, model_version: str) -> str:
+    """Same inputs -> same key, whatever the field order or int/float spelling."""
+    values = []
+    for col in crud.INPUT_COLUMNS:
+        value = record.get(col)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        values.append(value)
+    payload = json.dumps([model_version, values], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _SqliteStore:
+    """Shared second level: one row per key, pruned to max_rows (oldest first)."""
+
+    def __init__(self, path: str, max_rows: int):
+        self.max_rows = max_rows
+        self._puts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS predict_cache ("
+            "key TEXT PRIMARY KEY, model_version TEXT, cholera INTEGER, typhoid INTEGER)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT cholera, typhoid FROM predict_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return list(row) if row else None
+
+    def put(self, key: str, model_version: str, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predict_cache VALUES (?, ?, ?, ?)",
+                (key, model_version, int(value[0]), int(value[1])),
+            )
+            self._puts += 1
+            if self._puts % 1000 == 0:
+                self._conn.execute(
+                    "DELETE FROM predict_cache WHERE rowid <= "
+                    "(SELECT MAX(rowid) FROM predict_cache) - ?",
+                    (self.max_rows,),
+                )
+
+    def drop_other_versions(self, model_version: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM predict_cache WHERE model_version IS NOT ?", (model_version,)
+            )
+
+
+class PredictionCache:
+    def __init__(self, max_size: int = PREDICT_CACHE_SIZE, backend: str = PREDICT_CACHE_BACKEND,
+                 path: str = PREDICT_CACHE_PATH):
+        self.max_size = max_size
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._store = (
+            _SqliteStore(path, PREDICT_CACHE_DISK_MAX_ROWS)
+            if backend == "sqlite" and max_size > 0 else None
+        )
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _check_version(self, model_version: str):
+        # Caller holds self._lock
+        if model_version != self._version:
+            if self._version is not None:
+                self.counters["invalidations"] += 1
+                if self._store is not None:
+                    self._store.drop_other_versions(model_version)
+            self._entries.clear()
+            self._version = model_version
+
+    def get(self, record: dict, model_version: str):
+        """The cached [cholera, typhoid] for this input and version, or None."""
+        if not self.enabled:
+            return None
+        key = canonical_key(record, model_version)
+        with self._lock:
+            self._check_version(model_version)
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return value
+        if self._store is not None:
+            value = self._store.get(key)
+            if value is not None:
+                with self._lock:
+                    self.counters["shared_hits"] += 1
+                    self._insert(key, value)
+                return value
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, record: dict, model_version: str, value):
+        if not self.enabled:
+            return
+        key = canonical_key(record, model_version)
+        value = [int(value[0]), int(value[1])]
+        with self._lock:
+            self._check_version(model_version)
+            self._insert(key, value)
+        if self._store is not None:
+            self._store.put(key, model_version, value)
+
+    def _insert(self, key: str, value):
+        # Caller holds self._lock
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend,
+            "model_version": self._version,
+            "size": size,
+            "max_size": self.max_size,
+            **counters,
+            "hit_rate": round((counters["hits"] + counters["shared_hits"]) / lookups, 4) if lookups else None,
+        }
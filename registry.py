@@ -0,0 +1,242 @@
+# registry.py
+"""
+Versioned model registry.
+
+Each version lives in its own directory under MODEL_REGISTRY_DIR:
+
+    model/registry/
+        ACTIVE                      <- name of the version to serve
+        20251027-3f2a9c1b/
+            model.joblib
+            metadata.json           <- version, features, metrics, checksum, ...
+
+The API serves one ServingModel; activating a version loads and warms it
+up off the request path, then swaps the (version, model) pair in a single
+assignment, so in-flight /predict calls finish on the model they started
+with. Workers compare their version with ACTIVE before each job.
+
+An empty registry is seeded from the legacy model/cholera_gb_pipeline.joblib.
+
+    python registry.py list
+    python registry.py register path/to/model.joblib [--metrics '{"r2": 0.9}'] [--activate]
+    python registry.py activate <version>
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Optional
+
+import crud, inference
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "model/registry")
+LEGACY_MODEL_PATH = os.getenv("MODEL_PATH", "model/cholera_gb_pipeline.joblib")
+ARTIFACT_NAME = "model.joblib"
+METADATA_NAME = "metadata.json"
+ACTIVE_NAME = "ACTIVE"
+
+LoadedModel = namedtuple("LoadedModel", ["version", "model", "metadata"])
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _version_dir(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> str:
+    if not version or os.sep in version or version.startswith("."):
+        raise ValueError(f"Invalid model version: {version!r}")
+    return os.path.join(registry_dir, version)
+
+
+def artifact_path(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> str:
+    return os.path.join(_version_dir(version, registry_dir), ARTIFACT_NAME)
+
+
+def get_metadata(version: str, registry_dir: str = MODEL_REGISTRY_DIR) -> dict:
+    path = os.path.join(_version_dir(version, registry_dir), METADATA_NAME)
+    if not os.path.exists(path):
+        raise KeyError(f"Model version {version} is not registered.")
+    with open(path) as f:
+        return json.load(f)
+
+
+def list_versions(registry_dir: str = MODEL_REGISTRY_DIR):
+    """Metadata of every registered version, oldest first."""
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = []
+    for name in os.listdir(registry_dir):
+        if os.path.exists(os.path.join(registry_dir, name, METADATA_NAME)):
+            versions.append(get_metadata(name, registry_dir))
+    return sorted(versions, key=lambda meta: meta["created_at"])
+
+
+def register_artifact(
+    path: str,
+    version: Optional[str] = None,
+    metrics: Optional[dict] = None,
+    features: Optional[list] = None,
+    source: Optional[str] = None,
+    activate: bool = False,
+    registry_dir: str = MODEL_REGISTRY_DIR,
+) -> dict:
+    """
+    Copies a joblib pipeline into the registry with its metadata. The
+    version defaults to <date>-<checksum prefix>; features default to the
+    pipeline's feature_names_in_.
+    """
+    checksum = file_checksum(path)
+    created_at = datetime.now(timezone.utc)
+    version = version or f"{created_at:%Y%m%d}-{checksum[:8]}"
+    target = _version_dir(version, registry_dir)
+    if os.path.exists(target):
+        raise ValueError(f"Model version {version} already exists.")
+
+    if features is None:
+        pipeline = inference.load_model(path, backend="sklearn")
+        features = [str(f) for f in getattr(pipeline, "feature_names_in_", crud.INPUT_COLUMNS)]
+
+    # Write into a temporary directory and rename, so readers never see a
+    # version without its artifact.
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    shutil.copyfile(path, os.path.join(staging, ARTIFACT_NAME))
+    metadata = {
+        "version": version,
+        "created_at": created_at.isoformat(),
+        "features": features,
+        "metrics": metrics or {},
+        "checksum": checksum,
+        "source": source or os.path.basename(path),
+    }
+    with open(os.path.join(staging, METADATA_NAME), "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.rename(staging, target)
+
+    if activate:
+        set_active_version(version, registry_dir)
+    return metadata
+
+
+def get_active_version(registry_dir: str = MODEL_REGISTRY_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(registry_dir, ACTIVE_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_active_version(version: str, registry_dir: str = MODEL_REGISTRY_DIR):
+    """Points ACTIVE at a registered version (atomic rename)."""
+    get_metadata(version, registry_dir)
+    tmp = os.path.join(registry_dir, f".{ACTIVE_NAME}.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(registry_dir, ACTIVE_NAME))
+
+
+def ensure_active_version(registry_dir: str = MODEL_REGISTRY_DIR) -> str:
+    """
+    Returns the active version, seeding the registry from the legacy
+    model file (or activating the newest version) when none is set.
+    """
+    version = get_active_version(registry_dir)
+    if version is not None:
+        return version
+
+    versions = list_versions(registry_dir)
+    if versions:
+        version = versions[-1]["version"]
+        set_active_version(version, registry_dir)
+    else:
+        metadata = register_artifact(
+            LEGACY_MODEL_PATH, source=LEGACY_MODEL_PATH, activate=True, registry_dir=registry_dir
+        )
+        version = metadata["version"]
+        print(f"Seeded model registry with {LEGACY_MODEL_PATH} as version {version}.")
+    return version
+
+
+def load_version(version: str, registry_dir: str = MODEL_REGISTRY_DIR, **load_kwargs) -> LoadedModel:
+    """Loads a registered version after verifying the artifact checksum."""
+    metadata = get_metadata(version, registry_dir)
+    path = artifact_path(version, registry_dir)
+    if file_checksum(path) != metadata["checksum"]:
+        raise ValueError(f"Checksum mismatch for model version {version}.")
+    return LoadedModel(version, inference.load_model(path, **load_kwargs), metadata)
+
+
+class ServingModel:
+    """
+    The model the API predicts with. Readers call get() once per request
+    and use that (version, model) pair throughout; activate() builds the
+    replacement fully before swapping it in.
+    """
+
+    def __init__(self):
+        self.current: Optional[LoadedModel] = None
+        self.status = {"state": "empty", "version": None, "error": None, "seconds": None}
+        self._lock = threading.Lock()  # one activation at a time
+
+    def get(self) -> Optional[LoadedModel]:
+        return self.current
+
+    def activate(self, version: str, persist: bool = True) -> LoadedModel:
+        """Loads, checks and warms up a version, then swaps it in."""
+        with self._lock:
+            started = time.perf_counter()
+            self.status = {"state": "loading", "version": version, "error": None, "seconds": None}
+            try:
+                loaded = load_version(version)
+                inference.warm_up(loaded.model)
+                if persist:
+                    set_active_version(version)
+            except Exception as e:
+                self.status = {"state": "failed", "version": version, "error": str(e), "seconds": None}
+                raise
+            self.current = loaded  # single reference assignment: the atomic swap
+            self.status = {
+                "state": "active",
+                "version": version,
+                "error": None,
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            print(f"Serving model version {version} (loaded in {self.status['seconds']}s).")
+            return loaded
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage the model registry.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    register = commands.add_parser("register")
+    register.add_argument("path")
+    register.add_argument("--version")
+    register.add_argument("--metrics", type=json.loads, default=None)
+    register.add_argument("--activate", action="store_true")
+    activate = commands.add_parser("activate")
+    activate.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        active = get_active_version()
+        for meta in list_versions():
+            marker = "*" if meta["version"] == active else " "
+            print(f"{marker} {meta['version']}  {meta['created_at']}  {json.dumps(meta['metrics'])}")
+    elif args.command == "register":
+        meta = register_artifact(args.path, version=args.version, metrics=args.metrics, activate=args.activate)
+        print(json.dumps(meta, indent=2))
+    else:
+        set_active_version(args.version)
+        print(f"Active version: {args.version}")
@@ -0,0 +1,332 @@
+# reporting.py
+"""
+Deterministic pre-aggregation for /generate-comprehensive-report.
+
+Instead of pasting every processed row into the prompt, the processed
+data is loaded as one DataFrame, change percentages and risk levels are
+computed with the same rules the prompt describes, and only a compact
+summary (totals per period, risk distribution, top-N highest-risk
+districts) is sent to the model. The summary is trimmed to fit
+REPORT_TOKEN_BUDGET.
+"""
+import hashlib
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import crud, models
+
+REPORT_TOP_N = int(os.getenv("REPORT_TOP_N", "10"))
+REPORT_TOKEN_BUDGET = int(os.getenv("REPORT_TOKEN_BUDGET", "4000"))
+REPORT_CACHE_TTL_SECONDS = int(os.getenv("REPORT_CACHE_TTL_SECONDS", str(24 * 3600)))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "50"))
+REPORT_MAP_CHUNKS = int(os.getenv("REPORT_MAP_CHUNKS", "4"))
+
+# Bump whenever the prompts or the summary format change, so cached
+# reports built from the old prompt stop matching.
+PROMPT_VERSION = "3"
+
+CHARS_PER_TOKEN = 4  # rough, model-agnostic estimate
+DISEASES = {"cholera": ("Cholera_Cases", "projected_cholera"),
+            "typhoid": ("Typhoid_Cases", "projected_typhoid")}
+
+
+def report_cache_key(fingerprint, model_name: str) -> str:
+    """Content address of a report: data fingerprint + everything that shapes the prompt."""
+    parts = [*fingerprint, PROMPT_VERSION, model_name, str(REPORT_TOP_N), str(REPORT_TOKEN_BUDGET)]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def load_processed_frame(db: Session) -> pd.DataFrame:
+    """Reads every processed row as one DataFrame (no ORM objects)."""
+    table = models.PredictionData
+    stmt = select(*[getattr(table, col) for col in crud.OUTPUT_COLUMNS]).where(
+        table.projected_cholera != None,
+        table.projected_typhoid != None,
+    )
+    return pd.read_sql_query(stmt, db.connection())
+
+
+def date_range_of(df: pd.DataFrame):
+    """Earliest and latest Year/Month in the frame, in crud's date_range shape."""
+    period = df["Year"] * 12 + (df["Month"] - 1)
+    start, end = int(period.min()), int(period.max())
+    return {
+        "start_year": start // 12,
+        "start_month": start % 12 + 1,
+        "end_year": end // 12,
+        "end_month": end % 12 + 1,
+    }
+
+
+def change_percent(old, new) -> np.ndarray:
+    """((new - old) / old) * 100, with old == 0 giving 100 if new > 0 else 0."""
+    old = np.asarray(old, dtype=np.float64)
+    new = np.asarray(new, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = (new - old) / old * 100.0
+    return np.where(old == 0, np.where(new > 0, 100.0, 0.0), change)
+
+
+def risk_level(change) -> np.ndarray:
+    """> 50% increase is Severe, 20-50% Medium, < 20% Low."""
+    change = np.asarray(change, dtype=np.float64)
+    return np.select([change > 50, change >= 20], ["Severe", "Medium"], default="Low")
+
+
+def add_risk_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds <disease>_change and <disease>_risk columns for both diseases."""
+    df = df.copy()
+    for disease, (current, projected) in DISEASES.items():
+        df[f"{disease}_change"] = change_percent(df[current], df[projected]).round(1)
+        df[f"{disease}_risk"] = risk_level(df[f"{disease}_change"])
+    df["max_change"] = df[["cholera_change", "typhoid_change"]].max(axis=1)
+    df["period"] = df["Year"] * 12 + (df["Month"] - 1)
+    return df
+
+
+def _period_label(year: int, month: int) -> str:
+    return datetime(int(year), int(month), 1).strftime("%b %Y")
+
+
+def _overview_lines(df: pd.DataFrame):
+    date_range = date_range_of(df)
+    lines = [
+        f"Entries: {len(df)} | Districts: {df.groupby(['Region', 'City']).ngroups} | "
+        f"Regions: {df['Region'].nunique()} | Periods: {df['period'].nunique()} "
+        f"({_period_label(date_range['start_year'], date_range['start_month'])} - "
+        f"{_period_label(date_range['end_year'], date_range['end_month'])})"
+    ]
+    for disease, (current, projected) in DISEASES.items():
+        now, proj = int(df[current].sum()), int(df[projected].sum())
+        counts = df[f"{disease}_risk"].value_counts()
+        lines.append(
+            f"{disease.title()}: {now} current -> {proj} projected "
+            f"({change_percent([now], [proj])[0]:+.1f}%); entries by risk: "
+            f"Severe {counts.get('Severe', 0)}, Medium {counts.get('Medium', 0)}, Low {counts.get('Low', 0)}"
+        )
+    return lines
+
+
+def _period_lines(df: pd.DataFrame):
+    periods = df.groupby(["Year", "Month"]).agg(
+        cholera=("Cholera_Cases", "sum"),
+        cholera_proj=("projected_cholera", "sum"),
+        typhoid=("Typhoid_Cases", "sum"),
+        typhoid_proj=("projected_typhoid", "sum"),
+        severe=("max_change", lambda s: int((s > 50).sum())),
+        districts=("City", "nunique"),
+    ).reset_index()
+    return [
+        f"{_period_label(p.Year, p.Month)}: cholera {p.cholera}->{p.cholera_proj}, "
+        f"typhoid {p.typhoid}->{p.typhoid_proj}, severe districts {p.severe}/{p.districts}"
+        for p in periods.itertuples(index=False)
+    ]
+
+
+def top_risk_districts(df: pd.DataFrame, top_n: int) -> pd.DataFrame:
+    """
+    Each district's latest period, ranked by its largest projected
+    increase (then projected cases), plus how many periods it was Severe.
+    """
+    severe_periods = (
+        (df["max_change"] > 50).groupby([df["Region"], df["City"]]).sum().rename("severe_periods")
+    )
+    latest = df.sort_values("period").groupby(["Region", "City"]).tail(1)
+    latest = latest.join(severe_periods, on=["Region", "City"])
+    latest["projected_total"] = latest["projected_cholera"] + latest["projected_typhoid"]
+    return latest.sort_values(
+        ["max_change", "projected_total"], ascending=False
+    ).head(top_n)
+
+
+def _district_lines(top: pd.DataFrame):
+    return [
+        f"{r.Region} / {r.City} ({_period_label(r.Year, r.Month)}): "
+        f"cholera {r.Cholera_Cases}->{r.projected_cholera} ({r.cholera_change:+.1f}%, {r.cholera_risk}); "
+        f"typhoid {r.Typhoid_Cases}->{r.projected_typhoid} ({r.typhoid_change:+.1f}%, {r.typhoid_risk}); "
+        f"rain {r.Rainfall_mm}mm, sanitation {r.Sanitation_Index}, water {r.Water_Quality_Index}, "
+        f"density {r.Population_Density}/km2, waste {r.Waste_Management_Score}; "
+        f"severe in {r.severe_periods} period(s)"
+        for r in top.itertuples(index=False)
+    ]
+
+
+def _render(overview, periods, districts) -> str:
+    sections = ["OVERVIEW", *overview]
+    if periods:
+        sections += ["", "TOTALS BY PERIOD (current -> projected)", *periods]
+    if districts:
+        sections += ["", "HIGHEST-RISK DISTRICTS (latest period each)", *districts]
+    return "\n".join(sections)
+
+
+def build_data_summary(
+    df: pd.DataFrame, top_n: int = REPORT_TOP_N, token_budget: int = REPORT_TOKEN_BUDGET
+):
+    """
+    Renders the compact prompt data for a frame from add_risk_columns.
+    When over token_budget, drops the oldest period lines first, then
+    districts from the bottom of the ranking. Returns (text, top_districts).
+    """
+    overview = _overview_lines(df)
+    periods = _period_lines(df)
+    top = top_risk_districts(df, top_n)
+    districts = _district_lines(top)
+
+    text = _render(overview, periods, districts)
+    while estimate_tokens(text) > token_budget and (periods or len(districts) > 1):
+        if periods:
+            periods = periods[1:]
+        else:
+            districts = districts[:-1]
+        text = _render(overview, periods, districts)
+    return text, top.head(len(districts))
+
+
+def needs_map_reduce(df: pd.DataFrame, token_budget: int = REPORT_TOKEN_BUDGET) -> bool:
+    """True when the untrimmed summary would not fit the token budget."""
+    text = _render(_overview_lines(df), _period_lines(df), _district_lines(top_risk_districts(df, REPORT_TOP_N)))
+    return estimate_tokens(text) > token_budget and df["Region"].nunique() > 1
+
+
+def split_by_region(df: pd.DataFrame, max_chunks: int = REPORT_MAP_CHUNKS):
+    """
+    Groups whole regions into at most max_chunks frames of similar row
+    counts (largest region first into the lightest chunk).
+    """
+    sizes = df["Region"].value_counts()
+    bins = [[] for _ in range(min(max_chunks, len(sizes)))]
+    loads = [0] * len(bins)
+    for region, size in sizes.items():
+        lightest = loads.index(min(loads))
+        bins[lightest].append(region)
+        loads[lightest] += size
+    return [df[df["Region"].isin(regions)] for regions in bins if regions]
+
+
+def fallback_narrative(df: pd.DataFrame, top_n: int = 3):
+    """
+    Deterministic description/call_to_action used when the LLM fails or
+    times out, so the report is still served from the computed figures.
+    """
+    overview = _overview_lines(df)
+    top = top_risk_districts(df, top_n)
+    hotspots = ", ".join(f"{r.City} ({r.Region})" for r in top.itertuples(index=False))
+    description = (
+        " ".join(overview)
+        + (f" Highest projected increases: {hotspots}." if hotspots else "")
+    )
+    actions = [
+        "Target sanitation and water-quality programmes at districts rated Severe.",
+        "Re-run this report once the narrative service is available.",
+    ]
+    if hotspots:
+        actions.insert(0, f"Prioritise cholera and typhoid surveillance in {hotspots}.")
+    call_to_action = " ".join(f"{i}. {action}" for i, action in enumerate(actions, 1))
+    return description, call_to_action
+
+
+# Indicator -> (label, direction): which tail of the distribution is a risk driver.
+KEY_FACTORS = {
+    "Rainfall_mm": ("heavy rainfall", "high"),
+    "Sanitation_Index": ("poor sanitation", "low"),
+    "Water_Quality_Index": ("poor water quality", "low"),
+    "Waste_Management_Score": ("weak waste management", "low"),
+    "Population_Density": ("high population density", "high"),
+}
+
+
+def key_factor_summaries(df: pd.DataFrame) -> np.ndarray:
+    """
+    One deterministic sentence pair per row: the projected changes, then
+    the indicators in the riskiest quartile of the whole dataset.
+    """
+    drivers = np.full(len(df), "", dtype=object)
+    for col, (label, direction) in KEY_FACTORS.items():
+        values = df[col].to_numpy(dtype=np.float64)
+        if direction == "high":
+            flagged = values >= np.nanpercentile(values, 75)
+        else:
+            flagged = values <= np.nanpercentile(values, 25)
+        drivers = np.where(flagged, drivers + label + ", ", drivers)
+
+    drivers = pd.Series(drivers).str.rstrip(", ")
+    drivers = np.where(
+        drivers == "",
+        "No environmental indicator stands out against other districts.",
+        "Main drivers: " + drivers + ".",
+    )
+    periods = [_period_label(y, m) for y, m in zip(df["Year"].tolist(), df["Month"].tolist())]
+    lead = [
+        f"{period}: cholera {c:+.1f}% ({cr}), typhoid {t:+.1f}% ({tr}). "
+        for period, c, cr, t, tr in zip(
+            periods,
+            df["cholera_change"].tolist(), df["cholera_risk"].tolist(),
+            df["typhoid_change"].tolist(), df["typhoid_risk"].tolist(),
+        )
+    ]
+    return np.asarray(lead, dtype=object) + drivers
+
+
+def build_regional_data(df: pd.DataFrame, key_factors=None):
+    """
+    Builds the 'regional_data' entries (one per processed row) from a
+    frame from add_risk_columns, ordered by period then location.
+    key_factors optionally maps (region, district, year, month) to a
+    summary that replaces the generated one.
+    """
+    df = df.sort_values(["period", "Region", "City"])
+    summaries = key_factor_summaries(df)
+    key_factors = key_factors or {}
+
+    entries = []
+    for (region, city, year, month, c_proj, c_chg, c_risk, t_proj, t_chg, t_risk, summary) in zip(
+        df["Region"].tolist(), df["City"].tolist(), df["Year"].tolist(), df["Month"].tolist(),
+        df["projected_cholera"].tolist(), df["cholera_change"].tolist(), df["cholera_risk"].tolist(),
+        df["projected_typhoid"].tolist(), df["typhoid_change"].tolist(), df["typhoid_risk"].tolist(),
+        summaries.tolist(),
+    ):
+        entries.append({
+            "location": {"region": region, "district": city},
+            "predictions": {
+                "cholera": {"projected_cases": c_proj, "projected_change_percent": c_chg, "risk_level": c_risk},
+                "typhoid": {"projected_cases": t_proj, "projected_change_percent": t_chg, "risk_level": t_risk},
+            },
+            "key_factors_summary": key_factors.get((region, city, year, month), summary),
+        })
+    return entries
+
+
+def legacy_prompt_tokens(df: pd.DataFrame, sample: int = 200) -> int:
+    """
+    Estimated token count of the old one-block-per-row data dump,
+    measured on a sample of rows and scaled to the full frame.
+    """
+    if df.empty:
+        return 0
+    rows = df.head(sample)
+    sample_chars = sum(
+        len(
+            f"\n--- District Data Entry (Period: {r.Month}/{r.Year}) ---\n"
+            f"Region: {r.Region}\nDistrict: {r.City}\n"
+            f"Current Cases (Cholera/Typhoid): {r.Cholera_Cases} / {r.Typhoid_Cases}\n"
+            f"Projected Cases (Cholera/Typhoid): {r.projected_cholera} / {r.projected_typhoid}\n"
+            f"Key Factors:\n  - Rainfall: {r.Rainfall_mm} mm\n"
+            f"  - Sanitation Index (0-1): {r.Sanitation_Index}\n"
+            f"  - Water Quality Index (0-1): {r.Water_Quality_Index}\n"
+            f"  - Population Density: {r.Population_Density} per km²\n"
+            f"  - Waste Management Score (0-1): {r.Waste_Management_Score}\n"
+        )
+        for r in rows.itertuples(index=False)
+    )
+    return math.ceil(sample_chars * len(df) / len(rows) / CHARS_PER_TOKEN)
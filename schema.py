@@ -7,25 +7,64 @@ class PredictionInput(BaseModel):
     Region: str
     City: str
     Year : int
-    Month: int
+    Month: int = Field(..., ge=1, le=12)
     Rainfall_mm: float
     Temperature_celsius: float
-    Sanitation_Index: float
-    Water_Quality_Index: float
+    # Indices are scores up to 100 (model/model.ipynb trains on 30-90);
+    # test.csv's fractions also fit
+    Sanitation_Index: float = Field(..., ge=0, le=100)
+    Water_Quality_Index: float = Field(..., ge=0, le=100)
     Population_Density: float
-    Waste_Management_Score: float
+    Waste_Management_Score: float = Field(..., ge=0, le=100)
     Cholera_Cases: int
     Typhoid_Cases: int
 
 # This model is used when reading data from the DB
 class PredictionData(PredictionInput):
+    # Stored rows are served as they are: no input range checks on output
+    Month: int
+    Sanitation_Index: float
+    Water_Quality_Index: float
+    Waste_Management_Score: float
     id: int
     projected_cholera: Optional[int]
     projected_typhoid: Optional[int]
+    model_version: Optional[str] = None
 
     class Config:
         orm_mode = True # Renamed to from_attributes in Pydantic v2
 
+# Query filters shared by /get-all-predictions/ and its export
+class PredictionFilters(BaseModel):
+    region: Optional[str] = None
+    city: Optional[str] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    month_min: Optional[int] = Field(None, ge=1, le=12)
+    month_max: Optional[int] = Field(None, ge=1, le=12)
+    processed: Optional[bool] = Field(None,
+        description="True for rows with projections, False for rows still pending")
+
+# Background prediction jobs (one per id-range shard of an upload)
+class PredictionJob(BaseModel):
+    id: int
+    upload_id: str
+    status: Literal["pending", "running", "done", "failed"]
+    start_id: int
+    end_id: int
+    attempts: int
+    rows_done: int
+    error: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+class UploadJobStatus(BaseModel):
+    upload_id: str
+    status: Literal["pending", "running", "done", "failed"]
+    rows_done: int
+    jobs: List[PredictionJob]
+
 # --- Keep all your other Pydantic models here too ---
 class SinglePrediction(BaseModel):
     projected_cases: int
@@ -49,6 +88,27 @@ class RegionalData(BaseModel):
     key_factors_summary: str = Field(..., 
         description="A 1-2 sentence summary of the primary risk drivers for this specific district.")
 
+# What the LLM writes; regional_data is computed locally (reporting.py)
+class DistrictKeyFactors(BaseModel):
+    region: str
+    district: str
+    year: int
+    month: int
+    key_factors_summary: str = Field(...,
+        description="A 1-2 sentence summary of the primary risk drivers for this district and period.")
+
+class ReportNarrative(BaseModel):
+    description: str = Field(
+        ...,
+        description="An executive summary (3-4 sentences) for the *entire* report, highlighting key trends and highest-risk areas."
+    )
+    call_to_action: str = Field(
+        ...,
+        description="A prioritized list (2-3 items) of recommended actions for the *regional* health directorate."
+    )
+    key_factors: Optional[List[DistrictKeyFactors]] = Field(None,
+        description="Optional richer key-factor summaries for the highest-risk districts listed in the data.")
+
 # ReportOutput is now an "Executive Summary" for the whole region
 class ReportOutput(BaseModel):
     """A structured public health executive summary for the Ministry of Health."""
@@ -69,3 +129,63 @@ class ReportOutput(BaseModel):
         ..., 
         description="A prioritized list (2-3 items) of recommended actions for the *regional* health directorate."
     )
+
+# Analytics served from the materialized summary tables
+class DateRange(BaseModel):
+    start_year: int
+    start_month: int
+    end_year: int
+    end_month: int
+
+class PeriodTrend(BaseModel):
+    year: int
+    month: int
+    districts: int
+    cholera_cases: int
+    projected_cholera: int
+    typhoid_cases: int
+    projected_typhoid: int
+    cholera_severe: int
+    cholera_medium: int
+    cholera_low: int
+    typhoid_severe: int
+    typhoid_medium: int
+    typhoid_low: int
+
+class DistrictSummary(BaseModel):
+    Region: str
+    City: str
+    periods: int
+    first_year: int
+    first_month: int
+    last_year: int
+    last_month: int
+    cholera_cases: int
+    projected_cholera: int
+    typhoid_cases: int
+    projected_typhoid: int
+    severe_periods: int
+    latest_projected_cholera: int
+    latest_projected_typhoid: int
+    latest_cholera_risk: Literal["Low", "Medium", "Severe"]
+    latest_typhoid_risk: Literal["Low", "Medium", "Severe"]
+
+    class Config:
+        orm_mode = True
+
+# Feature-store row (features.py)
+class DistrictFeatures(BaseModel):
+    City: str
+    Year: int
+    Month: int
+    cholera_lag1: Optional[float] = None
+    cholera_lag3: Optional[float] = None
+    typhoid_lag1: Optional[float] = None
+    typhoid_lag3: Optional[float] = None
+    rainfall_roll3: Optional[float] = None
+    rainfall_roll6: Optional[float] = None
+    sanitation_roll3: Optional[float] = None
+    sanitation_roll6: Optional[float] = None
+
+    class Config:
+        orm_mode = True
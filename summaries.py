@@ -0,0 +1,359 @@
+# summaries.py
+"""
+Materialized rollups of processed predictions.
+
+district_summary (one row per Region/City) and region_period_summary
+(one row per Region/Year/Month) hold totals, projected vs actual cases
+and risk-bucket counts, so analytics endpoints read O(districts) or
+O(regions x months) rows instead of scanning prediction_data.
+
+They are kept current incrementally, in the caller's transaction: a
+write takes a snapshot() of the processed rows it may change, and
+update() then adds the changed rows' new contributions and subtracts
+their old ones. Totals and bucket counts are plain sums; first/last
+period and latest_* only move forward on additions, and a district that
+lost a processed row is recomputed on its own from an indexed read.
+Risk buckets use the same rules as reporting.add_risk_columns.
+"""
+import pandas as pd
+from sqlalchemy import bindparam, case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+import crud, models, reporting
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+KEY_BATCH_SIZE = 300
+
+DISTRICT_KEY = ["Region", "City"]
+REGION_PERIOD_KEY = ["Region", "Year", "Month"]
+
+# Summary columns that are plain sums over rows
+DISTRICT_SUMS = ["periods", "cholera_cases", "projected_cholera", "typhoid_cases",
+                 "projected_typhoid", "severe_periods"]
+REGION_PERIOD_SUMS = ["districts", "cholera_cases", "projected_cholera", "typhoid_cases",
+                      "projected_typhoid", "cholera_severe", "cholera_medium", "cholera_low",
+                      "typhoid_severe", "typhoid_medium", "typhoid_low"]
+
+
+def _batches(items, size: int = KEY_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _processed_query():
+    table = models.PredictionData
+    return select(*[getattr(table, col) for col in crud.OUTPUT_COLUMNS]).where(
+        table.projected_cholera != None,
+        table.projected_typhoid != None,
+    )
+
+
+def _read(db: Session, statements) -> pd.DataFrame:
+    frames = [pd.read_sql_query(stmt, db.connection()) for stmt in statements]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=crud.OUTPUT_COLUMNS)
+
+
+def snapshot(db: Session, ids=None, condition=None) -> pd.DataFrame:
+    """
+    The processed prediction_data rows among ids (or matching condition),
+    read by primary key; pass it to update() after the write.
+    """
+    table = models.PredictionData
+    if condition is not None:
+        return _read(db, [_processed_query().where(condition)])
+    return _read(db, [_processed_query().where(table.id.in_(batch))
+                      for batch in _batches(int(i) for i in ids)])
+
+
+def _processed_rows(db: Session, key_columns=None, keys=None) -> pd.DataFrame:
+    """
+    Processed rows whose key_columns tuple is in keys (all processed rows
+    when keys is None), with risk columns. Filters each key column with
+    its own IN list, which SQLite serves from an index (a row-value IN
+    is a full scan), and keeps the exact keys in pandas.
+    """
+    table = models.PredictionData
+    if keys is None:
+        df = _read(db, [_processed_query()])
+    else:
+        df = _read(db, [
+            _processed_query().where(*[
+                getattr(table, col).in_(sorted({key[i] for key in batch}))
+                for i, col in enumerate(key_columns)
+            ])
+            for batch in _batches(keys)
+        ])
+        df = df.merge(pd.DataFrame(keys, columns=key_columns), on=key_columns)
+    if df.empty:
+        return df
+    return reporting.add_risk_columns(df)
+
+
+def _district_rows(df: pd.DataFrame):
+    df = df.sort_values("period")
+    severe = (df["cholera_risk"] == "Severe") | (df["typhoid_risk"] == "Severe")
+    grouped = df.assign(severe=severe).groupby(DISTRICT_KEY, sort=False)
+    totals = grouped.agg(
+        periods=("period", "size"),
+        first_period=("period", "min"),
+        last_period=("period", "max"),
+        cholera_cases=("Cholera_Cases", "sum"),
+        projected_cholera=("projected_cholera", "sum"),
+        typhoid_cases=("Typhoid_Cases", "sum"),
+        projected_typhoid=("projected_typhoid", "sum"),
+        severe_periods=("severe", "sum"),
+    )
+    latest = grouped.tail(1).set_index(DISTRICT_KEY)
+    totals["latest_projected_cholera"] = latest["projected_cholera"]
+    totals["latest_projected_typhoid"] = latest["projected_typhoid"]
+    totals["latest_cholera_risk"] = latest["cholera_risk"]
+    totals["latest_typhoid_risk"] = latest["typhoid_risk"]
+    totals["first_year"], totals["first_month"] = totals["first_period"] // 12, totals["first_period"] % 12 + 1
+    totals["last_year"], totals["last_month"] = totals["last_period"] // 12, totals["last_period"] % 12 + 1
+    totals = totals.drop(columns=["first_period", "last_period"]).reset_index()
+    return _records(totals)
+
+
+def _region_period_totals(df: pd.DataFrame) -> pd.DataFrame:
+    aggregations = {
+        "districts": ("City", "nunique"),
+        "cholera_cases": ("Cholera_Cases", "sum"),
+        "projected_cholera": ("projected_cholera", "sum"),
+        "typhoid_cases": ("Typhoid_Cases", "sum"),
+        "projected_typhoid": ("projected_typhoid", "sum"),
+    }
+    for disease in reporting.DISEASES:
+        for level in ("Severe", "Medium", "Low"):
+            df[f"{disease}_{level.lower()}"] = df[f"{disease}_risk"] == level
+            aggregations[f"{disease}_{level.lower()}"] = (f"{disease}_{level.lower()}", "sum")
+    return df.groupby(REGION_PERIOD_KEY).agg(**aggregations)
+
+
+def _region_period_rows(df: pd.DataFrame):
+    return _records(_region_period_totals(df).reset_index())
+
+
+def _records(df: pd.DataFrame):
+    """DataFrame rows as dicts of plain Python scalars."""
+    now = models.utcnow()
+    records = df.astype(object).to_dict(orient="records")
+    for record in records:
+        for col, value in record.items():
+            if hasattr(value, "item"):
+                record[col] = value.item()
+        record["updated_at"] = now
+    return records
+
+
+def _replace(db: Session, summary, key_columns, keys, rows):
+    """Deletes the summary rows for keys (by primary key) and inserts their recomputed rows."""
+    if keys:
+        table = summary.__table__
+        db.connection().execute(
+            delete(table).where(*[table.c[col] == bindparam(f"k_{col}") for col in key_columns]),
+            [{f"k_{col}": value for col, value in zip(key_columns, key)} for key in keys],
+        )
+    if rows:
+        db.execute(insert(summary), rows)
+
+
+def _recompute(db: Session, districts, region_periods):
+    """Rebuilds the summary rows of the given districts and region-months."""
+    df = _processed_rows(db, DISTRICT_KEY, districts)
+    _replace(db, models.DistrictSummary, DISTRICT_KEY, districts,
+             _district_rows(df) if not df.empty else [])
+    df = _processed_rows(db, REGION_PERIOD_KEY, region_periods)
+    _replace(db, models.RegionPeriodSummary, REGION_PERIOD_KEY, region_periods,
+             _region_period_rows(df) if not df.empty else [])
+
+
+def _keys(df: pd.DataFrame, key_columns):
+    return sorted(set(df[key_columns].itertuples(index=False, name=None)))
+
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _add_region_periods(db: Session, dialect_insert, before: pd.DataFrame, after: pd.DataFrame):
+    """Adds after's contributions to region_period_summary and subtracts before's."""
+    delta = None
+    for df, sign in ((after, 1), (before, -1)):
+        if not df.empty:
+            totals = _region_period_totals(df) * sign
+            delta = totals if delta is None else delta.add(totals, fill_value=0)
+    delta = delta[(delta != 0).any(axis=1)].astype("int64")
+    if delta.empty:
+        return
+    summary = models.RegionPeriodSummary.__table__
+    stmt = dialect_insert(summary)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=REGION_PERIOD_KEY,
+        set_={
+            **{col: summary.c[col] + stmt.excluded[col] for col in REGION_PERIOD_SUMS},
+            "updated_at": models.utcnow(),
+        },
+    ), _records(delta.reset_index()))
+    if not before.empty:
+        db.execute(delete(summary).where(summary.c.districts <= 0))
+
+
+def _add_districts(db: Session, dialect_insert, added: pd.DataFrame):
+    """
+    Folds added rows into district_summary: sums accumulate, first_* move
+    back and last_*/latest_* move forward when the added rows reach past
+    the stored range.
+    """
+    summary = models.DistrictSummary.__table__
+    stmt = dialect_insert(summary)
+    new, old = stmt.excluded, summary.c
+    earlier = new.first_year * 12 + new.first_month < old.first_year * 12 + old.first_month
+    later = new.last_year * 12 + new.last_month > old.last_year * 12 + old.last_month
+    latest = ["last_year", "last_month", "latest_projected_cholera", "latest_projected_typhoid",
+              "latest_cholera_risk", "latest_typhoid_risk"]
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=DISTRICT_KEY,
+        set_={
+            **{col: old[col] + new[col] for col in DISTRICT_SUMS},
+            **{col: case((earlier, new[col]), else_=old[col]) for col in ("first_year", "first_month")},
+            **{col: case((later, new[col]), else_=old[col]) for col in latest},
+            "updated_at": models.utcnow(),
+        },
+    ), _district_rows(added))
+
+
+def update(db: Session, before: pd.DataFrame, ids):
+    """
+    Applies a write to the prediction_data rows in ids to the summaries,
+    given their snapshot() from before it (None when the write could not
+    have changed processed rows). Rows of before outside ids are ignored.
+    Falls back to recomputing the touched keys on databases
+    without upserts.
+    """
+    ids = [int(i) for i in ids]
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        return refresh(db, ids)
+
+    after = snapshot(db, ids)
+    before = before[before["id"].isin(ids)] if before is not None else after.iloc[:0]
+    if before.empty and after.empty:
+        return 0
+    before = reporting.add_risk_columns(before) if not before.empty else before
+    after = reporting.add_risk_columns(after) if not after.empty else after
+
+    _add_region_periods(db, dialect_insert, before, after)
+
+    # A removed row may have been a district's first, last or latest period
+    removed = _keys(before, DISTRICT_KEY) if not before.empty else []
+    if not after.empty:
+        lost = pd.MultiIndex.from_tuples(removed, names=DISTRICT_KEY) if removed else None
+        added = after if lost is None else after[~after.set_index(DISTRICT_KEY).index.isin(lost)]
+        if not added.empty:
+            _add_districts(db, dialect_insert, added)
+    if removed:
+        df = _processed_rows(db, DISTRICT_KEY, removed)
+        _replace(db, models.DistrictSummary, DISTRICT_KEY, removed,
+                 _district_rows(df) if not df.empty else [])
+    return len(before) + len(after)
+
+
+def refresh(db: Session, ids=None, commit: bool = False):
+    """
+    Recomputes the district and region-month summaries touched by the
+    prediction_data rows in ids, or rebuilds them from every processed
+    row when ids is None. Rows that are no longer processed drop out of
+    their summaries.
+    """
+    if ids is None:
+        df = _processed_rows(db)
+        db.execute(delete(models.DistrictSummary))
+        db.execute(delete(models.RegionPeriodSummary))
+        if not df.empty:
+            db.execute(insert(models.DistrictSummary), _district_rows(df))
+            db.execute(insert(models.RegionPeriodSummary), _region_period_rows(df))
+        if commit:
+            db.commit()
+        return len(df)
+
+    table = models.PredictionData
+    keys = []
+    for batch in _batches(int(i) for i in ids):
+        keys.extend(db.execute(
+            select(table.Region, table.City, table.Year, table.Month).where(table.id.in_(batch))
+        ).all())
+    if not keys:
+        return 0
+    _recompute(db, sorted({(r, c) for r, c, _, _ in keys}), sorted({(r, y, m) for r, _, y, m in keys}))
+    if commit:
+        db.commit()
+    return len(keys)
+
+
+def rebuild_if_missing(db: Session):
+    """
+    Builds the summaries from scratch when processed rows exist but the
+    summary tables are empty (first start after adding them).
+    """
+    if db.query(models.DistrictSummary).first() is not None:
+        return 0
+    if db.query(models.PredictionData.id).filter(models.PredictionData.projected_cholera != None).first() is None:
+        return 0
+    rows = refresh(db, commit=True)
+    print(f"Built analytics summaries from {rows} processed rows.")
+    return rows
+
+
+def get_date_range(db: Session, region=None):
+    """Earliest and latest processed Year/Month, from region_period_summary."""
+    summary = models.RegionPeriodSummary
+    period = summary.Year * 12 + summary.Month - 1
+    query = db.query(func.min(period), func.max(period))
+    if region is not None:
+        query = query.filter(summary.Region == region)
+    start, end = query.one()
+    if start is None:
+        return None
+    return {
+        "start_year": start // 12,
+        "start_month": start % 12 + 1,
+        "end_year": end // 12,
+        "end_month": end % 12 + 1,
+    }
+
+
+def get_trends(db: Session, region=None):
+    """Per-month totals and risk-bucket counts, nationally or for one region."""
+    summary = models.RegionPeriodSummary
+    sums = [
+        func.sum(getattr(summary, col)).label(col)
+        for col in ("districts", "cholera_cases", "projected_cholera", "typhoid_cases", "projected_typhoid",
+                    "cholera_severe", "cholera_medium", "cholera_low",
+                    "typhoid_severe", "typhoid_medium", "typhoid_low")
+    ]
+    query = db.query(summary.Year.label("year"), summary.Month.label("month"), *sums)
+    if region is not None:
+        query = query.filter(summary.Region == region)
+    rows = query.group_by(summary.Year, summary.Month).order_by(summary.Year, summary.Month).all()
+    return [row._asdict() for row in rows]
+
+
+def get_districts(db: Session, region=None, risk=None):
+    """District rollups, highest latest projected cases first."""
+    summary = models.DistrictSummary
+    query = db.query(summary)
+    if region is not None:
+        query = query.filter(summary.Region == region)
+    if risk is not None:
+        query = query.filter((summary.latest_cholera_risk == risk) | (summary.latest_typhoid_risk == risk))
+    return query.order_by(
+        (summary.latest_projected_cholera + summary.latest_projected_typhoid).desc()
+    ).all()
@@ -0,0 +1,97 @@
+# test_fastpath.py
+"""FastPredictor must match pipeline.predict on every layout it accepts."""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import fastpath, inference, train
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHIPPED_MODEL = os.path.join(ROOT, "model", "cholera_gb_pipeline.joblib")
+TEST_CSV = os.path.join(ROOT, "test.csv")
+
+
+def _history(rows: int = 600, seed: int = 0) -> pd.DataFrame:
+    """Synthetic training rows shaped like features.training_frame()."""
+    rng = np.random.default_rng(seed)
+    cities = {"Kumasi": "Ashanti", "Accra": "Greater Accra", "Tamale": "Northern", "Ho": "Volta"}
+    city = rng.choice(list(cities), size=rows)
+    df = pd.DataFrame({
+        "Region": [cities[c] for c in city],
+        "City": city,
+        "Year": rng.integers(2019, 2026, size=rows),
+        "Month": rng.integers(1, 13, size=rows),
+        "Rainfall_mm": rng.uniform(0, 300, size=rows).round(1),
+        "Temperature_celsius": rng.uniform(26, 33, size=rows).round(1),
+        "Sanitation_Index": rng.uniform(30, 90, size=rows).round(2),
+        "Water_Quality_Index": rng.uniform(30, 90, size=rows).round(2),
+        "Population_Density": rng.integers(100, 5000, size=rows),
+        "Waste_Management_Score": rng.uniform(30, 90, size=rows).round(2),
+        "Cholera_Cases": rng.integers(0, 100, size=rows),
+        "Typhoid_Cases": rng.integers(0, 100, size=rows),
+    })
+    df["Next_Month_Cholera"] = df["Cholera_Cases"] + df["Month"] * 3 + rng.integers(0, 10, size=rows)
+    df["Next_Month_Typhoid"] = df["Typhoid_Cases"] + (df["Year"] - 2019) * 5 + rng.integers(0, 10, size=rows)
+    return df
+
+
+@pytest.fixture(scope="module")
+def shipped():
+    return joblib.load(SHIPPED_MODEL)
+
+
+@pytest.fixture(scope="module")
+def trained():
+    """A gb candidate built by train.build_pipeline (Year/Month passthrough)."""
+    df = _history()
+    pipeline = train.build_pipeline("gb", train.NUMERIC_FEATURES)
+    return pipeline.fit(df.drop(columns=train.TARGETS), df[train.TARGETS]), df
+
+
+def _assert_parity(pipeline, frame):
+    predictor = fastpath.FastPredictor(pipeline)
+    np.testing.assert_allclose(predictor.predict(frame), pipeline.predict(frame), atol=1e-6)
+    records = frame.to_dict(orient="records")
+    np.testing.assert_allclose(predictor.predict_records(records), pipeline.predict(frame), atol=1e-6)
+    assert fastpath.check_parity(pipeline, predictor) <= 1e-6
+
+
+def test_shipped_model_parity(shipped):
+    _assert_parity(shipped, pd.read_csv(TEST_CSV))
+
+
+def test_trained_model_parity(trained):
+    pipeline, df = trained
+    predictor = fastpath.FastPredictor(pipeline)
+    assert predictor.passthrough_columns == train.PASSTHROUGH_FEATURES
+    _assert_parity(pipeline, df.drop(columns=train.TARGETS))
+
+
+def test_unsupported_layout_raises():
+    df = _history(rows=200)
+    pipeline = train.build_pipeline("hgb", train.NUMERIC_FEATURES)
+    pipeline.fit(df.drop(columns=train.TARGETS), df[train.TARGETS])
+    with pytest.raises(fastpath.UnsupportedPipelineError):
+        fastpath.FastPredictor(pipeline)
+
+
+def test_load_model_fast_backend(trained, tmp_path):
+    pipeline, _ = trained
+    path = tmp_path / "model.joblib"
+    joblib.dump(pipeline, path)
+    model = inference.load_model(str(path), backend="fast")
+    assert isinstance(model, fastpath.FastPredictor)
+    assert inference.model_features(model)[-2:] == ["Year", "Month"]
+
+
+def test_load_model_falls_back_on_any_error(monkeypatch):
+    def broken(pipeline):
+        raise ValueError("columns are missing")
+
+    monkeypatch.setattr(fastpath, "build_fast_predictor", broken)
+    model = inference.load_model(SHIPPED_MODEL, backend="fast")
+    assert not isinstance(model, fastpath.FastPredictor)
+    assert hasattr(model, "predict")
@@ -0,0 +1,327 @@
+# train.py
+"""
+Scriptable model training from prediction_data.
+
+Replaces the hand-run model/model.ipynb workflow:
+
+1. Loads history with features.training_frame() (input columns, the
+   Next_Month_* targets of the following calendar month and, with
+   --with-features, the feature-store lags and rolling means).
+2. Scores each candidate pipeline (the notebook's preprocessing +
+   MultiOutputRegressor) with time-based cross-validation: folds split
+   on whole months, always training on the past and testing on the
+   months that follow. Folds and candidates run in parallel
+   (joblib, process backend, TRAIN_N_JOBS workers).
+3. Refits every candidate on all rows and measures what serving cares
+   about: single-row latency through inference.predict_records (the
+   /predict path), batch throughput and artifact size.
+4. Picks the most accurate candidate whose p95 single-row latency is
+   within the budget (the fastest one if none is) and registers it as
+   a new version in the model registry.
+
+    python train.py [--candidates gb,hgb,rf,xgb] [--splits 4] [--n-jobs 4]
+                    [--with-features] [--latency-budget-ms 25] [--activate]
+                    [--report report.json] [--dry-run]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import (
+    GradientBoostingRegressor, HistGradientBoostingRegressor, RandomForestRegressor, StackingRegressor,
+)
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import TimeSeriesSplit
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+import features, inference, models, registry
+
+TRAIN_N_JOBS = int(os.getenv("TRAIN_N_JOBS", str(min(4, os.cpu_count() or 1))))
+TRAIN_CV_SPLITS = int(os.getenv("TRAIN_CV_SPLITS", "4"))
+TRAIN_LATENCY_BUDGET_MS = float(os.getenv("TRAIN_LATENCY_BUDGET_MS", "25"))
+TRAIN_SEED = 42
+
+# Same columns as model/model.ipynb
+NUMERIC_FEATURES = [
+    "Temperature_celsius", "Rainfall_mm", "Population_Density",
+    "Water_Quality_Index", "Sanitation_Index", "Waste_Management_Score",
+]
+CATEGORICAL_FEATURES = ["Region", "City"]
+TARGETS = ["Next_Month_Cholera", "Next_Month_Typhoid"]
+DISEASES = ["cholera", "typhoid"]
+DEFAULT_CANDIDATES = ["gb", "hgb", "rf", "xgb"]
+
+
+def _xgb(**params):
+    from xgboost import XGBRegressor
+
+    return XGBRegressor(random_state=TRAIN_SEED, n_jobs=1, **params)
+
+
+def _stacking():
+    estimators = [
+        ("rf", RandomForestRegressor(random_state=TRAIN_SEED, n_estimators=200)),
+        ("gb", GradientBoostingRegressor(random_state=TRAIN_SEED)),
+        ("hgb", HistGradientBoostingRegressor(random_state=TRAIN_SEED)),
+    ]
+    final = None
+    if _xgboost_available():
+        estimators.insert(0, ("xgb", _xgb(n_estimators=300, learning_rate=0.1, max_depth=5)))
+        final = _xgb(learning_rate=0.1, n_estimators=100)
+    return StackingRegressor(estimators=estimators, final_estimator=final)
+
+
+# Regressors from the notebook, each wrapped in MultiOutputRegressor
+CANDIDATES = {
+    "gb": lambda: GradientBoostingRegressor(random_state=TRAIN_SEED),
+    "hgb": lambda: HistGradientBoostingRegressor(random_state=TRAIN_SEED),
+    "rf": lambda: RandomForestRegressor(random_state=TRAIN_SEED, n_estimators=200),
+    "xgb": lambda: _xgb(n_estimators=300, learning_rate=0.1, max_depth=5),
+    "stacking": _stacking,
+}
+
+
+def _xgboost_available() -> bool:
+    try:
+        import xgboost  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Calendar columns passed to the regressor unscaled, for seasonality
+PASSTHROUGH_FEATURES = ["Year", "Month"]
+
+
+def build_pipeline(name: str, numeric_features) -> Pipeline:
+    """
+    The notebook's preprocessing followed by candidate name. Year and
+    Month pass through as-is; any other column (the current case counts)
+    is dropped, as in the notebook.
+    """
+    preprocessor = ColumnTransformer([
+        ("num", Pipeline([
+            ("imputer", SimpleImputer(strategy="median")),
+            ("scaler", StandardScaler()),
+        ]), list(numeric_features)),
+        ("cat", Pipeline([
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            # Dense: HistGradientBoosting rejects sparse input
+            ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False)),
+        ]), CATEGORICAL_FEATURES),
+        ("period", "passthrough", PASSTHROUGH_FEATURES),
+    ], remainder="drop")
+    return Pipeline([
+        ("preprocessor", preprocessor),
+        ("regressor", MultiOutputRegressor(CANDIDATES[name]())),
+    ])
+
+
+def load_dataset(db, with_features: bool = False):
+    """
+    (X, y, periods) from prediction_data, rows without a next month
+    dropped. Creates missing tables first and, with_features, builds the
+    feature store if it is still empty.
+    """
+    models.init_db(db.get_bind())
+    if with_features:
+        features.rebuild_if_missing(db)
+    df = features.training_frame(db).dropna(subset=TARGETS).reset_index(drop=True)
+    feature_columns = features.FEATURE_COLUMNS if with_features else []
+    X = df.drop(columns=TARGETS + ([] if with_features else features.FEATURE_COLUMNS))
+    periods = (df["Year"] * 12 + df["Month"] - 1).to_numpy()
+    return X, df[TARGETS], periods, NUMERIC_FEATURES + feature_columns
+
+
+def time_splits(periods, n_splits: int = TRAIN_CV_SPLITS):
+    """
+    TimeSeriesSplit over distinct months, mapped back to row indices, so
+    a month is never split between training and test.
+    """
+    months = np.unique(periods)
+    if len(months) <= n_splits:
+        raise ValueError(f"Need more than {n_splits} distinct months of history, found {len(months)}.")
+    for train_months, test_months in TimeSeriesSplit(n_splits=n_splits).split(months):
+        yield (
+            np.flatnonzero(np.isin(periods, months[train_months])),
+            np.flatnonzero(np.isin(periods, months[test_months])),
+        )
+
+
+def score(y_true: pd.DataFrame, y_pred: np.ndarray) -> dict:
+    metrics = {}
+    for i, (disease, target) in enumerate(zip(DISEASES, TARGETS)):
+        metrics[f"{disease}_rmse"] = float(np.sqrt(mean_squared_error(y_true[target], y_pred[:, i])))
+        metrics[f"{disease}_r2"] = float(r2_score(y_true[target], y_pred[:, i]))
+    metrics["avg_rmse"] = (metrics["cholera_rmse"] + metrics["typhoid_rmse"]) / 2
+    return metrics
+
+
+def _fit_fold(name, pipeline, X, y, train_idx, test_idx):
+    started = time.perf_counter()
+    model = clone(pipeline).fit(X.iloc[train_idx], y.iloc[train_idx])
+    return name, {**score(y.iloc[test_idx], model.predict(X.iloc[test_idx])),
+                  "fit_seconds": time.perf_counter() - started}
+
+
+def _fit_full(name, pipeline, X, y):
+    started = time.perf_counter()
+    return name, clone(pipeline).fit(X, y), time.perf_counter() - started
+
+
+def serving_profile(model, X: pd.DataFrame, single_rows: int = 200, batch_rows: int = 1000) -> dict:
+    """Single-row latency on the /predict path, batch throughput and artifact size."""
+    sample = X.sample(n=min(single_rows, len(X)), random_state=TRAIN_SEED)
+    records = sample.to_dict(orient="records")
+    inference.predict_records(model, records[:5])  # warm-up
+    latencies = []
+    for record in records:
+        started = time.perf_counter()
+        inference.predict_records(model, [record])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    batch = X.sample(n=min(batch_rows, len(X)), replace=len(X) < batch_rows, random_state=TRAIN_SEED)
+    started = time.perf_counter()
+    inference.predict_frame(model, batch)
+    batch_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.joblib")
+        joblib.dump(model, path)
+        size = os.path.getsize(path)
+
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "batch_rows_per_sec": round(len(batch) / batch_seconds, 1),
+        "size_mb": round(size / 1e6, 3),
+    }
+
+
+def choose(results: dict, latency_budget_ms: float) -> str:
+    """Lowest CV avg_rmse within the latency budget; the fastest candidate if none fits."""
+    within = [name for name, r in results.items() if r["serving"]["p95_ms"] <= latency_budget_ms]
+    if within:
+        return min(within, key=lambda name: results[name]["cv"]["avg_rmse"])
+    print(f"WARNING: no candidate meets the {latency_budget_ms} ms p95 budget; choosing the fastest.")
+    return min(results, key=lambda name: results[name]["serving"]["p95_ms"])
+
+
+def train(db, candidates=None, n_splits: int = TRAIN_CV_SPLITS, n_jobs: int = TRAIN_N_JOBS,
+          with_features: bool = False, latency_budget_ms: float = TRAIN_LATENCY_BUDGET_MS):
+    """
+    Cross-validates and refits the candidates; returns (report, winning
+    name, fitted models by name).
+    """
+    candidates = list(candidates or DEFAULT_CANDIDATES)
+    if "xgb" in candidates and not _xgboost_available():
+        print("xgboost is not installed; skipping the xgb candidate.")
+        candidates.remove("xgb")
+    unknown = [name for name in candidates if name not in CANDIDATES]
+    if unknown or not candidates:
+        raise ValueError(f"Unknown or no candidates: {unknown}; choose from {sorted(CANDIDATES)}")
+
+    X, y, periods, numeric_features = load_dataset(db, with_features)
+    splits = list(time_splits(periods, n_splits))
+    pipelines = {name: build_pipeline(name, numeric_features) for name in candidates}
+    print(f"Training {len(candidates)} candidates on {len(X)} rows, "
+          f"{len(np.unique(periods))} months, {len(splits)} time-based folds, n_jobs={n_jobs}.")
+
+    started = time.perf_counter()
+    parallel = joblib.Parallel(n_jobs=n_jobs, backend="loky")
+    fold_results = parallel(
+        joblib.delayed(_fit_fold)(name, pipeline, X, y, train_idx, test_idx)
+        for name, pipeline in pipelines.items()
+        for train_idx, test_idx in splits
+    )
+    fitted = parallel(joblib.delayed(_fit_full)(name, pipeline, X, y) for name, pipeline in pipelines.items())
+    train_seconds = time.perf_counter() - started
+
+    results = {}
+    for name in candidates:
+        folds = [metrics for fold_name, metrics in fold_results if fold_name == name]
+        cv = {key: round(float(np.mean([fold[key] for fold in folds])), 4) for key in folds[0]}
+        cv["avg_rmse_std"] = round(float(np.std([fold["avg_rmse"] for fold in folds])), 4)
+        results[name] = {"cv": cv}
+    fitted_models = {}
+    for name, model, seconds in fitted:
+        fitted_models[name] = model
+        # Measured one candidate at a time, after training, so timings don't contend
+        results[name]["serving"] = serving_profile(model, X)
+        results[name]["refit_seconds"] = round(seconds, 2)
+
+    winner = choose(results, latency_budget_ms)
+    report = {
+        "rows": len(X),
+        "months": int(len(np.unique(periods))),
+        "splits": len(splits),
+        "with_features": with_features,
+        "latency_budget_ms": latency_budget_ms,
+        "train_seconds": round(train_seconds, 2),
+        "winner": winner,
+        "candidates": results,
+    }
+    return report, winner, fitted_models
+
+
+def print_table(report: dict):
+    print(f"{'candidate':<10} {'avg_rmse':>9} {'cholera_r2':>10} {'typhoid_r2':>10} "
+          f"{'p50_ms':>8} {'p95_ms':>8} {'rows/s':>10} {'size_mb':>8}")
+    for name, r in report["candidates"].items():
+        marker = " *" if name == report["winner"] else ""
+        print(f"{name:<10} {r['cv']['avg_rmse']:>9.3f} {r['cv']['cholera_r2']:>10.3f} "
+              f"{r['cv']['typhoid_r2']:>10.3f} {r['serving']['p50_ms']:>8.2f} {r['serving']['p95_ms']:>8.2f} "
+              f"{r['serving']['batch_rows_per_sec']:>10.0f} {r['serving']['size_mb']:>8.2f}{marker}")
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", default=",".join(DEFAULT_CANDIDATES),
+                        help=f"comma-separated, from {', '.join(CANDIDATES)}")
+    parser.add_argument("--splits", type=int, default=TRAIN_CV_SPLITS)
+    parser.add_argument("--n-jobs", type=int, default=TRAIN_N_JOBS)
+    parser.add_argument("--with-features", action="store_true", help="also train on feature-store columns")
+    parser.add_argument("--latency-budget-ms", type=float, default=TRAIN_LATENCY_BUDGET_MS)
+    parser.add_argument("--report", help="write the full report as JSON to this file")
+    parser.add_argument("--activate", action="store_true", help="make the winner the active version")
+    parser.add_argument("--dry-run", action="store_true", help="report only; don't register the winner")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report, winner, fitted = train(
+            db, candidates=[c for c in args.candidates.split(",") if c], n_splits=args.splits,
+            n_jobs=args.n_jobs, with_features=args.with_features, latency_budget_ms=args.latency_budget_ms,
+        )
+    finally:
+        db.close()
+    print_table(report)
+
+    if not args.dry_run:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "model.joblib")
+            joblib.dump(fitted[winner], path)
+            winning = report["candidates"][winner]
+            meta = registry.register_artifact(
+                path,
+                metrics={**winning["cv"], **winning["serving"], "candidate": winner},
+                source=f"train.py:{winner}",
+                activate=args.activate,
+            )
+        report["registered_version"] = meta["version"]
+        print(f"Registered {winner} as version {meta['version']}{' (active)' if args.activate else ''}.")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
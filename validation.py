@@ -0,0 +1,101 @@
+# validation.py
+import numpy as np
+import pandas as pd
+
+import schema
+
+# Column -> Python type, straight from the PredictionInput annotations.
+COLUMN_TYPES = dict(schema.PredictionInput.__annotations__)
+
+
+def _bounds(field):
+    """(ge, le) from a schema field's constraints; None where unbounded."""
+    low = high = None
+    for constraint in field.metadata:
+        low = getattr(constraint, "ge", low)
+        high = getattr(constraint, "le", high)
+    return low, high
+
+
+def _range_text(low, high) -> str:
+    if low is not None and high is not None:
+        return f"must be between {low} and {high}"
+    return f"must be >= {low}" if low is not None else f"must be <= {high}"
+
+
+# Column -> (ge, le) for the range-constrained PredictionInput fields
+COLUMN_BOUNDS = {
+    col: _bounds(field)
+    for col, field in schema.PredictionInput.model_fields.items()
+    if _bounds(field) != (None, None)
+}
+
+
+def validate_frame(df: pd.DataFrame):
+    """
+    Validates and coerces a DataFrame against PredictionInput column by
+    column instead of building one Pydantic object per row: nulls and
+    blank text, non-numeric or non-finite numbers, fractional integers
+    and values outside the schema's ge/le bounds.
+
+    Returns (valid_df, errors): valid_df holds the rows that passed, with
+    columns in schema order and coerced to schema types; errors maps the
+    positional index of each rejected row to a list of messages.
+    Raises ValueError if whole columns are missing.
+    """
+    missing = [col for col in COLUMN_TYPES if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+    n = len(df)
+    bad = np.zeros(n, dtype=bool)
+    errors = {}
+    coerced = {}
+
+    def reject(mask, message):
+        for pos in np.flatnonzero(mask):
+            errors.setdefault(int(pos), []).append(message)
+
+    for col, col_type in COLUMN_TYPES.items():
+        values = df[col]
+        if col_type is str:
+            text = values.astype(str)
+            invalid = (values.isna() | (text.str.strip() == "")).to_numpy()
+            reject(invalid, f"{col}: field required")
+            coerced[col] = text
+        else:
+            numeric = pd.to_numeric(values, errors="coerce")
+            invalid = ~np.isfinite(numeric.to_numpy(dtype="float64"))
+            reject(invalid & values.isna().to_numpy(), f"{col}: field required")
+            reject(invalid & values.notna().to_numpy(), f"{col}: expected a number")
+            if col_type is int:
+                fractional = ~invalid & (numeric.fillna(0) % 1 != 0).to_numpy()
+                reject(fractional, f"{col}: expected an integer")
+                invalid = invalid | fractional
+            if col in COLUMN_BOUNDS:
+                low, high = COLUMN_BOUNDS[col]
+                filled = numeric.where(~invalid, low if low is not None else high).to_numpy()
+                out_of_range = np.zeros(n, dtype=bool)
+                if low is not None:
+                    out_of_range |= filled < low
+                if high is not None:
+                    out_of_range |= filled > high
+                reject(out_of_range, f"{col}: {_range_text(low, high)}")
+                invalid = invalid | out_of_range
+            if col_type is int:
+                coerced[col] = numeric.where(~invalid, 0).astype("int64")
+            else:
+                coerced[col] = numeric.astype("float64")
+        bad |= invalid
+
+    valid_df = pd.DataFrame(coerced, index=df.index)[~bad]
+    return valid_df, errors
+
+
+def error_report(errors: dict, offset: int = 0):
+    """
+    errors from validate_frame as a list of {"row", "errors"} entries in
+    row order; row is the 1-based data row (header excluded) counting
+    from offset.
+    """
+    return [{"row": offset + pos + 1, "errors": errors[pos]} for pos in sorted(errors)]
@@ -0,0 +1,270 @@
+# worker.py
+"""
+Out-of-process prediction workers.
+
+Uploads are split into PredictionJob rows (one per id-range shard). Jobs
+are claimed from the table and run in a ProcessPoolExecutor whose worker
+processes each load their own copy of the active registry model, so large
+batches never compete with the API for its interpreter. Because the queue
+lives in the database, jobs interrupted by a crash are requeued and
+finish from the rows that are still unpredicted. Each claimed job carries
+a lease that the claiming process renews every JOB_LEASE_SECONDS / 3;
+only jobs whose lease has expired (their owner is gone) are requeued, so
+jobs held by another live API or worker process never run twice. Before
+each job a worker checks the registry's ACTIVE version and reloads if a
+new model was activated.
+
+Run standalone with `python worker.py` (PREDICTION_WORKER_MODE=external),
+or let the API own the pool (PREDICTION_WORKER_MODE=pool, the default).
+"""
+import functools
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import crud, inference, models, registry
+from database import SessionLocal, engine
+
+PREDICTION_WORKER_MODE = os.getenv("PREDICTION_WORKER_MODE", "pool")
+PREDICTION_WORKERS = int(os.getenv("PREDICTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+JOB_SHARD_SIZE = int(os.getenv("JOB_SHARD_SIZE", "5000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Identifies this process as the owner of the jobs it claims.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Set in each worker process by _init_worker / _ensure_current_model.
+_worker_model = None
+
+# Parent-side pool state.
+_executor = None
+_executor_lock = threading.Lock()
+_pool_size = 0
+_in_flight = 0
+_heartbeat_stop = threading.Event()
+_heartbeat_thread = None
+
+
+def _init_worker():
+    """Pool initializer: every worker process loads its own copy of the active model."""
+    _ensure_current_model()
+
+
+def _ensure_current_model():
+    """Reloads the worker's model when the registry's active version has changed."""
+    global _worker_model
+    version = registry.ensure_active_version()
+    if _worker_model is None or _worker_model.version != version:
+        _worker_model = registry.load_version(version)
+        print(f"[worker {os.getpid()}] Model version {version} loaded")
+    return _worker_model
+
+
+def run_job(job_id: int, model=None, model_version=None, owner=None) -> int:
+    """
+    Predicts all still-pending rows in a job's id range and marks the job
+    done. On error the job goes back to 'pending' until it has used up
+    JOB_MAX_ATTEMPTS, then 'failed'. With owner, stops early if the job's
+    lease was lost to another process. Returns the number of rows predicted.
+    """
+    if model is None:
+        loaded = _ensure_current_model()
+        model, model_version = loaded.model, loaded.version
+    db = SessionLocal()
+    try:
+        job = db.get(models.PredictionJob, job_id)
+        if job is None:
+            return 0
+        try:
+            last_id = job.start_id - 1
+            while True:
+                if owner is not None and job.owner != owner:
+                    print(f"Job {job_id} was requeued after its lease expired; leaving it to {job.owner}.")
+                    return job.rows_done or 0
+                stats = inference.process_pending_chunk(
+                    db=db,
+                    model=model,
+                    after_id=last_id,
+                    max_id=job.end_id,
+                    model_version=model_version,
+                )
+                if stats["rows"] == 0:
+                    break
+                last_id = stats["last_id"]
+                job.rows_done = (job.rows_done or 0) + stats["rows"]
+                db.commit()
+            job.status = "done"
+            job.error = None
+            db.commit()
+            return job.rows_done
+        except Exception as e:
+            db.rollback()
+            job.status = "pending" if job.attempts < JOB_MAX_ATTEMPTS else "failed"
+            job.error = str(e)
+            job.owner = job.lease_expires_at = None
+            db.commit()
+            print(f"Job {job_id} failed (attempt {job.attempts}): {e}")
+            return 0
+    finally:
+        db.close()
+
+
+def _new_executor(workers: int):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def start_pool(workers: int = PREDICTION_WORKERS):
+    """
+    Starts the worker pool (spawned processes, each with its own model)
+    and the lease heartbeat.
+    """
+    global _executor, _pool_size, _heartbeat_thread
+    with _executor_lock:
+        if _executor is None:
+            _pool_size = workers
+            _executor = _new_executor(workers)
+        if _heartbeat_thread is None:
+            _heartbeat_stop.clear()
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name="job-lease-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+    return _executor
+
+
+def shutdown_pool():
+    global _executor, _heartbeat_thread
+    _heartbeat_stop.set()
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+        _heartbeat_thread = None
+
+
+def _reset_pool(broken):
+    """Replaces a broken executor (a worker process died) with a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        _executor = _new_executor(_pool_size)
+    print("Prediction worker pool was broken; started a new one.")
+
+
+def _release(job_ids, error: str):
+    db = SessionLocal()
+    try:
+        crud.release_jobs(db=db, ids=job_ids, owner=WORKER_ID, max_attempts=JOB_MAX_ATTEMPTS, error=error)
+    finally:
+        db.close()
+
+
+def _heartbeat():
+    """Renews this process's job leases and requeues jobs whose owner has died."""
+    while not _heartbeat_stop.wait(JOB_LEASE_SECONDS / 3):
+        try:
+            db = SessionLocal()
+            try:
+                crud.renew_job_leases(db=db, owner=WORKER_ID, lease_seconds=JOB_LEASE_SECONDS)
+            finally:
+                db.close()
+            if recover_jobs():
+                dispatch_pending_jobs()
+        except Exception as e:
+            print(f"Job lease heartbeat failed: {e}")
+
+
+def _on_job_finished(job_id, executor, future):
+    global _in_flight
+    with _executor_lock:
+        _in_flight -= 1
+    # Cancelled (pool shut down) jobs keep their lease and are requeued once it expires
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        # The job's process died before it could record anything
+        _release([job_id], "Worker process died while running the job.")
+        _reset_pool(executor)
+    # A failed job may have gone back to 'pending'; pick it (and anything
+    # queued meanwhile) up again.
+    dispatch_pending_jobs()
+
+
+def dispatch_pending_jobs() -> int:
+    """
+    Claims as many pending jobs as there are idle pool slots and submits
+    them to the pool. Jobs that cannot be submitted (the pool broke) are
+    released back to the queue and the pool is rebuilt. Returns the
+    number of jobs submitted.
+    """
+    global _in_flight
+    executor = _executor
+    if executor is None:
+        return 0
+
+    with _executor_lock:
+        free_slots = _pool_size - _in_flight
+        if free_slots <= 0:
+            return 0
+        db = SessionLocal()
+        try:
+            job_ids = crud.claim_pending_jobs(
+                db=db, limit=free_slots, owner=WORKER_ID, lease_seconds=JOB_LEASE_SECONDS
+            )
+        finally:
+            db.close()
+        _in_flight += len(job_ids)
+
+    for submitted, job_id in enumerate(job_ids):
+        try:
+            future = executor.submit(run_job, job_id, owner=WORKER_ID)
+        except (BrokenProcessPool, RuntimeError) as e:
+            unsubmitted = job_ids[submitted:]
+            with _executor_lock:
+                _in_flight -= len(unsubmitted)
+            _release(unsubmitted, f"Worker pool unavailable: {e}")
+            _reset_pool(executor)
+            return submitted
+        future.add_done_callback(functools.partial(_on_job_finished, job_id, executor))
+    return len(job_ids)
+
+
+def recover_jobs() -> int:
+    """Requeues 'running' jobs whose lease expired (their process died)."""
+    db = SessionLocal()
+    try:
+        requeued = crud.requeue_expired_jobs(db=db, max_attempts=JOB_MAX_ATTEMPTS)
+    finally:
+        db.close()
+    if requeued:
+        print(f"Requeued {requeued} interrupted prediction jobs.")
+    return requeued
+
+
+def run_forever(poll_interval: float = JOB_POLL_INTERVAL):
+    """Standalone worker loop: recover, then keep the pool fed from the job table."""
+    models.init_db(engine)
+    registry.ensure_active_version()
+    recover_jobs()
+    start_pool()
+    print(f"Prediction worker started with {PREDICTION_WORKERS} processes.")
+    try:
+        while True:
+            dispatch_pending_jobs()
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    run_forever()